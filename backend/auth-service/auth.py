@@ -1,15 +1,15 @@
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from functools import lru_cache
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import HTTPException, status, Depends
 import os
-from dotenv import load_dotenv
+
+from shared import config
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-# Charger les variables d'environnement
-load_dotenv()
+# Charger les variables d'environnement (une seule fois par processus)
+config.load_env()
 
 # Configuration de sécurité
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
@@ -17,13 +17,23 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# python-jose (et son backend cryptography) et passlib/bcrypt coûtent ~90 ms à
+# l'import : ils ne sont chargés qu'au premier token ou mot de passe traité
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+@lru_cache(maxsize=None)
+def _jose():
+    from jose import JWTError, jwt
+    return jwt, JWTError
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -32,6 +42,7 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    jwt, _ = _jose()
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -39,10 +50,12 @@ def create_refresh_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
     to_encode.update({"exp": expire})
+    jwt, _ = _jose()
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 def verify_token(token: str):
+    jwt, JWTError = _jose()
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -52,13 +65,31 @@ def verify_token(token: str):
     except JWTError:
         return None
 
-def refresh_access_token(refresh_token: str):
+def token_claims(user, admin: bool):
+    # "uid" permet au gateway de paralléliser les appels qui dépendent de l'identifiant
+    claims = {"sub": user.email, "uid": user.id}
+    # "adm" ne sert qu'à la priorité d'admission ; les droits restent vérifiés en base
+    if admin:
+        claims["adm"] = True
+    return claims
+
+def refresh_access_token(refresh_token: str, is_admin=None):
+    """
+    Nouveau token d'accès ; is_admin(uid) réévalue "adm" (rôles modifiés depuis la connexion)
+    """
+    jwt, JWTError = _jose()
     try:
         payload = jwt.decode(refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
             return None
         # Create new access token
-        return create_access_token(data={"sub": email})
+        data = {"sub": email}
+        if payload.get("uid") is not None:
+            data["uid"] = payload["uid"]
+            admin = is_admin(payload["uid"]) if is_admin is not None else payload.get("adm")
+            if admin:
+                data["adm"] = True
+        return create_access_token(data=data)
     except JWTError:
         return None
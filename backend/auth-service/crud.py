@@ -1,7 +1,20 @@
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 import models
 import schemas
 from auth import get_password_hash, verify_password
+from shared import cache, outbox, rollup
+
+USERS_PER_ROLE = "users_per_role"
+
+# Recherches ponctuelles mises en cache, invalidées à chaque écriture du modèle.
+# Les utilisateurs ne sont pas mis en cache : une entrée porterait hashed_password
+# (copié dans Redis) et un is_active périmé jusqu'au TTL sur les autres réplicas.
+roles_by_id = cache.Cache("auth_roles", models.Role, topic="role")
+roles_by_name = cache.Cache("auth_roles_by_name", models.Role, key="name", topic="role")
+permissions_by_id = cache.Cache("auth_permissions", models.Permission, topic="permission")
+permissions_by_name = cache.Cache("auth_permissions_by_name", models.Permission, key="name", topic="permission")
+
 
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
@@ -20,6 +33,8 @@ def create_user(db: Session, user: schemas.UserCreate):
         hashed_password=hashed_password
     )
     db.add(db_user)
+    db.flush()
+    outbox.record(db, models.OutboxEvent, "user", "created", db_user.id)
     db.commit()
     db.refresh(db_user)
     return db_user
@@ -33,9 +48,11 @@ def authenticate_user(db: Session, email: str, password: str):
     return user
 
 # Fonctions pour la gestion des rôles et permissions
+@permissions_by_name.cached
 def get_permission_by_name(db: Session, name: str):
     return db.query(models.Permission).filter(models.Permission.name == name).first()
 
+@permissions_by_id.cached
 def get_permission(db: Session, permission_id: int):
     return db.query(models.Permission).filter(models.Permission.id == permission_id).first()
 
@@ -48,13 +65,17 @@ def create_permission(db: Session, permission: schemas.PermissionCreate):
         description=permission.description
     )
     db.add(db_permission)
+    db.flush()
+    outbox.record(db, models.OutboxEvent, "permission", "created", db_permission.id, {"name": db_permission.name})
     db.commit()
     db.refresh(db_permission)
     return db_permission
 
+@roles_by_name.cached
 def get_role_by_name(db: Session, name: str):
     return db.query(models.Role).filter(models.Role.name == name).first()
 
+@roles_by_id.cached
 def get_role(db: Session, role_id: int):
     return db.query(models.Role).filter(models.Role.id == role_id).first()
 
@@ -68,6 +89,10 @@ def create_role(db: Session, role: schemas.RoleCreate):
         is_default=role.is_default
     )
     db.add(db_role)
+    db.flush()
+    # Un rôle s'inclut lui-même : les requêtes de permissions passent toutes par la fermeture
+    db.add(models.RoleClosure(role_id=db_role.id, included_role_id=db_role.id, paths=1))
+    outbox.record(db, models.OutboxEvent, "role", "created", db_role.id, {"name": db_role.name})
     db.commit()
     db.refresh(db_role)
     return db_role
@@ -77,6 +102,7 @@ def add_permission_to_role(db: Session, role_id: int, permission_id: int):
     permission = get_permission(db, permission_id)
     if role and permission:
         role.permissions.append(permission)
+        outbox.record(db, models.OutboxEvent, "role", "permission_added", role_id, {"permission_id": permission_id})
         db.commit()
         db.refresh(role)
     return role
@@ -84,34 +110,161 @@ def add_permission_to_role(db: Session, role_id: int, permission_id: int):
 def add_role_to_user(db: Session, user_id: int, role_id: int):
     user = get_user(db, user_id)
     role = get_role(db, role_id)
-    if user and role:
+    if user and role and role not in user.roles:
         user.roles.append(role)
+        outbox.record(db, models.OutboxEvent, "user", "role_added", user_id, {"role_id": role_id})
+        rollup.increment(db, models.Rollup, USERS_PER_ROLE, role.name)
         db.commit()
         db.refresh(user)
     return user
 
+# --- Hiérarchie des rôles (table de fermeture) ---
+
+def role_includes(db: Session, role_id: int, included_role_id: int) -> bool:
+    return db.query(models.RoleClosure).get((role_id, included_role_id)) is not None
+
+def _link(db: Session, role_id: int, inherited_role_id: int, sign: int):
+    """
+    Ajoute (sign=1) ou retire (sign=-1) les chemins créés par l'arête role_id -> inherited_role_id :
+    chaque rôle incluant role_id inclut désormais chaque rôle inclus par inherited_role_id
+    """
+    closure = models.RoleClosure
+    ancestors = db.query(closure.role_id, closure.paths).filter(closure.included_role_id == role_id).all()
+    descendants = db.query(closure.included_role_id, closure.paths).filter(closure.role_id == inherited_role_id).all()
+    for ancestor, ancestor_paths in ancestors:
+        for descendant, descendant_paths in descendants:
+            delta = sign * ancestor_paths * descendant_paths
+            updated = db.query(closure).filter(
+                closure.role_id == ancestor, closure.included_role_id == descendant
+            ).update({closure.paths: closure.paths + delta}, synchronize_session=False)
+            if not updated:
+                db.add(closure(role_id=ancestor, included_role_id=descendant, paths=delta))
+    db.flush()
+    if sign < 0:
+        db.query(closure).filter(closure.paths <= 0).delete(synchronize_session=False)
+
+def add_role_inheritance(db: Session, role_id: int, inherited_role_id: int):
+    """
+    role_id hérite de inherited_role_id ; ValueError si l'arête crée un cycle
+    """
+    role = get_role(db, role_id)
+    inherited = get_role(db, inherited_role_id)
+    if not role or not inherited:
+        return None
+    edge = models.role_inheritance.c
+    if db.query(models.role_inheritance).filter(
+        edge.role_id == role_id, edge.inherited_role_id == inherited_role_id
+    ).first():
+        return role
+    # Cycle : le rôle hérité inclut déjà, directement ou non, le rôle courant
+    if role_includes(db, inherited_role_id, role_id):
+        raise ValueError(f"Le rôle '{inherited.name}' inclut déjà '{role.name}' : cycle d'héritage")
+    db.execute(models.role_inheritance.insert().values(role_id=role_id, inherited_role_id=inherited_role_id))
+    _link(db, role_id, inherited_role_id, 1)
+    outbox.record(db, models.OutboxEvent, "role", "inheritance_added", role_id, {"inherited_role_id": inherited_role_id})
+    db.commit()
+    db.refresh(role)
+    return role
+
+def remove_role_inheritance(db: Session, role_id: int, inherited_role_id: int) -> bool:
+    removed = db.execute(models.role_inheritance.delete().where(
+        (models.role_inheritance.c.role_id == role_id)
+        & (models.role_inheritance.c.inherited_role_id == inherited_role_id)
+    )).rowcount
+    if not removed:
+        return False
+    _link(db, role_id, inherited_role_id, -1)
+    outbox.record(db, models.OutboxEvent, "role", "inheritance_removed", role_id, {"inherited_role_id": inherited_role_id})
+    db.commit()
+    return True
+
+def get_inherited_roles(db: Session, role_id: int, transitive: bool = False):
+    """
+    Rôles hérités directement, ou tous les rôles inclus (hors lui-même) si transitive
+    """
+    query = db.query(models.Role)
+    if transitive:
+        query = query.join(models.RoleClosure, models.RoleClosure.included_role_id == models.Role.id) \
+            .filter(models.RoleClosure.role_id == role_id, models.Role.id != role_id)
+    else:
+        query = query.join(models.role_inheritance, models.role_inheritance.c.inherited_role_id == models.Role.id) \
+            .filter(models.role_inheritance.c.role_id == role_id)
+    return query.order_by(models.Role.name).all()
+
+def ensure_role_closure(db: Session):
+    """
+    Lignes réflexives des rôles créés avant la table de fermeture (bases existantes)
+    """
+    closure = models.RoleClosure
+    missing = db.query(models.Role.id).filter(
+        ~db.query(closure).filter(closure.role_id == models.Role.id, closure.included_role_id == models.Role.id).exists()
+    ).all()
+    db.add_all(closure(role_id=role_id, included_role_id=role_id, paths=1) for role_id, in missing)
+    db.commit()
+    return len(missing)
+
+def rebuild_role_closure(db: Session):
+    """
+    Recalcule toute la table de fermeture depuis les arêtes d'héritage (après un import en masse)
+    """
+    closure = models.RoleClosure
+    db.query(closure).delete(synchronize_session=False)
+    db.add_all(closure(role_id=role_id, included_role_id=role_id, paths=1) for role_id, in db.query(models.Role.id))
+    db.flush()
+    for role_id, inherited_role_id in db.query(models.role_inheritance).all():
+        _link(db, role_id, inherited_role_id, 1)
+    db.commit()
+
+def _effective_permissions(db: Session, user_id: int):
+    # Rôles de l'utilisateur -> rôles inclus -> permissions : une seule requête, quelle que soit la profondeur
+    return db.query(models.Permission) \
+        .join(models.role_permission, models.role_permission.c.permission_id == models.Permission.id) \
+        .join(models.RoleClosure, models.RoleClosure.included_role_id == models.role_permission.c.role_id) \
+        .join(models.user_role, models.user_role.c.role_id == models.RoleClosure.role_id) \
+        .filter(models.user_role.c.user_id == user_id)
+
 def get_user_roles(db: Session, user_id: int):
     user = get_user(db, user_id)
     return user.roles if user else []
 
 def get_user_permissions(db: Session, user_id: int):
-    user = get_user(db, user_id)
-    if not user:
-        return []
-    
-    # Récupérer toutes les permissions de tous les rôles de l'utilisateur
-    permissions = []
-    for role in user.roles:
-        permissions.extend(role.permissions)
-    
-    # Éliminer les doublons
-    unique_permissions = list({perm.id: perm for perm in permissions}.values())
-    return unique_permissions
+    # Permissions des rôles de l'utilisateur et de tous les rôles dont ils héritent
+    return _effective_permissions(db, user_id).distinct().all()
+
+def get_user_permission_names(db: Session, user_id: int, names=None) -> set:
+    query = _effective_permissions(db, user_id).with_entities(models.Permission.name)
+    if names is not None:
+        query = query.filter(models.Permission.name.in_(list(names)))
+    return {name for name, in query.distinct()}
 
 def user_has_permission(db: Session, user_id: int, permission_name: str):
-    permissions = get_user_permissions(db, user_id)
-    return any(perm.name == permission_name for perm in permissions)
+    return db.query(
+        _effective_permissions(db, user_id).filter(models.Permission.name == permission_name).exists()
+    ).scalar()
 
 def user_has_role(db: Session, user_id: int, role_name: str):
-    roles = get_user_roles(db, user_id)
-    return any(role.name == role_name for role in roles)
+    # Rôle attribué ou hérité (un admin a aussi le rôle manager)
+    return db.query(
+        db.query(models.user_role)
+        .join(models.RoleClosure, models.RoleClosure.role_id == models.user_role.c.role_id)
+        .join(models.Role, models.Role.id == models.RoleClosure.included_role_id)
+        .filter(models.user_role.c.user_id == user_id, models.Role.name == role_name)
+        .exists()
+    ).scalar()
+
+def user_is_admin(db: Session, user_id: int) -> bool:
+    # Superutilisateur, ou rôle admin attribué ou hérité via la fermeture des rôles
+    user = get_user(db, user_id)
+    return bool(user and (user.is_superuser or user_has_role(db, user_id, "admin")))
+
+def get_user_stats(db: Session):
+    return rollup.series(db, models.Rollup, USERS_PER_ROLE)
+
+def rebuild_rollups(db: Session):
+    counts = dict(
+        db.query(models.Role.name, func.count(models.user_role.c.user_id))
+        .join(models.user_role, models.user_role.c.role_id == models.Role.id)
+        .group_by(models.Role.name)
+    )
+    rollup.rebuild(db, models.Rollup, USERS_PER_ROLE, counts)
+    return {USERS_PER_ROLE: sum(counts.values())}
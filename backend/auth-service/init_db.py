@@ -1,3 +1,9 @@
+import os
+import sys
+
+# Rendre le paquet backend/shared importable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from database import SessionLocal, engine
 import models
 import crud
@@ -23,7 +29,10 @@ def init_database():
             {"name": "view_services", "description": "Voir les services"},
             {"name": "manage_services", "description": "Gérer les services"},
             {"name": "view_contacts", "description": "Voir les contacts"},
-            {"name": "manage_contacts", "description": "Gérer les contacts"}
+            {"name": "manage_contacts", "description": "Gérer les contacts"},
+            {"name": "view_audit", "description": "Consulter le journal d'audit"},
+            {"name": "debug_profile", "description": "Profiler les services en cours d'exécution"},
+            {"name": "view_events", "description": "Suivre le flux des événements de changement (GET /events)"}
         ]
         
         # Créer les permissions
@@ -32,45 +41,47 @@ def init_database():
                 permission = schemas.PermissionCreate(**perm_data)
                 crud.create_permission(db, permission)
         
-        # Rôles de base
+        # Rôles de base, du plus restreint au plus large : chaque rôle hérite du
+        # précédent (admin ⊇ manager ⊇ user) et ne déclare que ses permissions propres
         roles_data = [
             {
-                "name": "admin",
-                "description": "Administrateur système avec tous les droits",
-                "is_default": False,
+                "name": "user",
+                "description": "Utilisateur standard",
+                "is_default": True,
+                "inherits": [],
                 "permissions": [
-                    "view_users", "manage_users",
-                    "view_roles", "manage_roles",
-                    "view_permissions", "manage_permissions",
-                    "view_projects", "manage_projects",
-                    "view_services", "manage_services",
-                    "view_contacts", "manage_contacts"
+                    "view_projects", "view_services", "view_contacts"
                 ]
             },
             {
                 "name": "manager",
                 "description": "Manager avec droits de gestion",
                 "is_default": False,
+                "inherits": ["user"],
                 "permissions": [
                     "view_users", "view_roles", "view_permissions",
-                    "view_projects", "manage_projects",
-                    "view_services", "manage_services",
-                    "view_contacts", "manage_contacts"
+                    "manage_projects", "manage_services", "manage_contacts"
                 ]
             },
             {
-                "name": "user",
-                "description": "Utilisateur standard",
-                "is_default": True,
+                "name": "admin",
+                "description": "Administrateur système avec tous les droits",
+                "is_default": False,
+                "inherits": ["manager"],
                 "permissions": [
-                    "view_projects", "view_services", "view_contacts"
+                    "manage_users", "manage_roles", "manage_permissions",
+                    "view_audit", "debug_profile", "view_events"
                 ]
             }
         ]
         
-        # Créer les rôles et leurs permissions
+        # Bases créées avant la hiérarchie des rôles
+        crud.ensure_role_closure(db)
+        
+        # Créer les rôles, leurs permissions et leur héritage
         for role_data in roles_data:
-            if not crud.get_role_by_name(db, role_data["name"]):
+            role = crud.get_role_by_name(db, role_data["name"])
+            if not role:
                 role_create = schemas.RoleCreate(
                     name=role_data["name"],
                     description=role_data["description"],
@@ -83,6 +94,11 @@ def init_database():
                     permission = crud.get_permission_by_name(db, perm_name)
                     if permission:
                         crud.add_permission_to_role(db, role.id, permission.id)
+            
+            for inherited_name in role_data["inherits"]:
+                inherited = crud.get_role_by_name(db, inherited_name)
+                if inherited and not crud.role_includes(db, role.id, inherited.id):
+                    crud.add_role_inheritance(db, role.id, inherited.id)
         
         print("✅ Base de données initialisée avec succès!")
         print("📋 Permissions créées:", len(permissions_data))
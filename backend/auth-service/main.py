@@ -1,9 +1,13 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from typing import Optional, List
+from datetime import datetime
 import os
-from dotenv import load_dotenv
+import sys
+
+# Rendre le paquet backend/shared importable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database import SessionLocal, engine
 import models
@@ -11,9 +15,7 @@ import schemas
 import crud
 import auth
 import middleware
-
-# Charger les variables d'environnement
-load_dotenv()
+from shared import admission, audit, cache, looplag, metrics, outbox, profiler, rollup, sqlprofile, tracing
 
 # Créer les tables
 models.Base.metadata.create_all(bind=engine)
@@ -24,6 +26,56 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Profilage SQL par requête : en-tête Server-Timing, métriques et détection des N+1
+sqlprofile.instrument_engine(engine)
+tracing.instrument_engine(engine)
+app.add_middleware(sqlprofile.SQLProfilingMiddleware, service="auth")
+metrics.install(app)
+# Profilage à la demande (permission debug_profile)
+profiler.install(app, "auth", dependency=middleware.has_permission(profiler.PERMISSION))
+# Retard de la boucle asyncio et détection des appels bloquants
+looplag.install(app, "auth")
+
+# Contrôle d'admission : compartiments par route, délestage en 503 + Retry-After
+app.add_middleware(admission.AdmissionMiddleware, service="auth", routes=[
+    # Connexions (bcrypt) séparées des lectures : un afflux de logins ne bloque pas /users/me
+    ("POST", "/token", "login"),
+    ("POST", "/refresh", "login"),
+    ("POST", "/register", "login"),
+], limits={"login": 4})
+
+# Traçage distribué : ajouté en dernier, le span serveur couvre toute la requête
+app.add_middleware(tracing.TracingMiddleware, service="auth")
+
+# Flux des événements de changement (outbox) pour l'invalidation des caches
+event_stream = outbox.EventStream("auth", models.OutboxEvent, SessionLocal)
+outbox.install(app, event_stream, dependency=middleware.has_permission(outbox.PERMISSION))
+# Caches en mémoire invalidés par les écritures des autres processus
+cache.install(app, event_stream)
+
+# Journal d'audit : tampon en mémoire vidé par lots par un thread dédié
+audit_log = audit.create("auth", SessionLocal, models.AuditEvent)
+
+@app.on_event("startup")
+def start_audit_log():
+    audit_log.start()
+
+@app.on_event("shutdown")
+def stop_audit_log():
+    audit_log.stop()
+
+def client_ip(request: Request):
+    return request.client.host if request.client else None
+
+@app.on_event("startup")
+def ensure_role_closure():
+    # Rôles créés avant la hiérarchie : ajout de leurs lignes réflexives dans la fermeture
+    db = SessionLocal()
+    try:
+        crud.ensure_role_closure(db)
+    finally:
+        db.close()
+
 # Dépendance pour obtenir la session de base de données
 def get_db():
     db = SessionLocal()
@@ -34,20 +86,25 @@ def get_db():
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Handlers synchrones : bcrypt et SQLAlchemy s'exécutent dans le pool de threads, pas sur la boucle
 @app.post("/token", response_model=schemas.Token)
-async def login_for_access_token(
+def login_for_access_token(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
     user = crud.authenticate_user(db, form_data.username, form_data.password)
     if not user:
+        audit_log.record("login_failed", actor=form_data.username, ip=client_ip(request))
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Identifiants incorrects",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = auth.create_access_token(data={"sub": user.email})
-    refresh_token = auth.create_refresh_token(data={"sub": user.email})
+    claims = auth.token_claims(user, crud.user_is_admin(db, user.id))
+    access_token = auth.create_access_token(data=claims)
+    refresh_token = auth.create_refresh_token(data=claims)
+    audit_log.record("login", actor=user.email, target=user.id, ip=client_ip(request))
     return {
         "access_token": access_token,
         "refresh_token": refresh_token,
@@ -55,17 +112,20 @@ async def login_for_access_token(
     }
 
 @app.post("/refresh", response_model=schemas.TokenRefresh)
-async def refresh_token(
+def refresh_token(
+    request: Request,
     refresh_token: str,
     db: Session = Depends(get_db)
 ):
-    new_access_token = auth.refresh_access_token(refresh_token)
+    new_access_token = auth.refresh_access_token(refresh_token, lambda user_id: crud.user_is_admin(db, user_id))
     if not new_access_token:
+        audit_log.record("refresh_failed", ip=client_ip(request))
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Refresh token invalide ou expiré",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    audit_log.record("refresh", actor=auth.verify_token(new_access_token), ip=client_ip(request))
     return {
         "access_token": new_access_token,
         "token_type": "bearer"
@@ -75,6 +135,7 @@ async def refresh_token(
 @app.post("/permissions", response_model=schemas.Permission)
 def create_permission(
     permission: schemas.PermissionCreate,
+    request: Request,
     db: Session = Depends(get_db),
     current_user = Depends(middleware.has_permission("manage_permissions"))
 ):
@@ -84,7 +145,10 @@ def create_permission(
             status_code=400,
             detail="Permission déjà existante"
         )
-    return crud.create_permission(db=db, permission=permission)
+    db_permission = crud.create_permission(db=db, permission=permission)
+    audit_log.record("permission_created", actor=current_user.email, target=db_permission.id,
+                     ip=client_ip(request), name=db_permission.name)
+    return db_permission
 
 @app.get("/permissions", response_model=List[schemas.Permission])
 def read_permissions(
@@ -99,6 +163,7 @@ def read_permissions(
 @app.post("/roles", response_model=schemas.Role)
 def create_role(
     role: schemas.RoleCreate,
+    request: Request,
     db: Session = Depends(get_db),
     current_user = Depends(middleware.has_permission("manage_roles"))
 ):
@@ -108,7 +173,10 @@ def create_role(
             status_code=400,
             detail="Rôle déjà existant"
         )
-    return crud.create_role(db=db, role=role)
+    db_role = crud.create_role(db=db, role=role)
+    audit_log.record("role_created", actor=current_user.email, target=db_role.id,
+                     ip=client_ip(request), name=db_role.name)
+    return db_role
 
 @app.get("/roles", response_model=List[schemas.Role])
 def read_roles(
@@ -124,32 +192,91 @@ def read_roles(
 def add_permission_to_role(
     role_id: int,
     permission_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user = Depends(middleware.has_permission("manage_roles"))
+):
+    role = crud.add_permission_to_role(db, role_id=role_id, permission_id=permission_id)
+    audit_log.record("role_permission_added", actor=current_user.email, target=role_id,
+                     ip=client_ip(request), permission_id=permission_id)
+    return role
+
+@app.post("/roles/{role_id}/inherits/{inherited_role_id}", response_model=schemas.Role)
+def add_role_inheritance(
+    role_id: int,
+    inherited_role_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user = Depends(middleware.has_permission("manage_roles"))
+):
+    """
+    Le rôle role_id reçoit toutes les permissions de inherited_role_id (et de ses propres rôles hérités)
+    """
+    try:
+        role = crud.add_role_inheritance(db, role_id=role_id, inherited_role_id=inherited_role_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if role is None:
+        raise HTTPException(status_code=404, detail="Rôle non trouvé")
+    audit_log.record("role_inheritance_added", actor=current_user.email, target=role_id,
+                     ip=client_ip(request), inherited_role_id=inherited_role_id)
+    return role
+
+@app.delete("/roles/{role_id}/inherits/{inherited_role_id}")
+def remove_role_inheritance(
+    role_id: int,
+    inherited_role_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user = Depends(middleware.has_permission("manage_roles"))
 ):
-    return crud.add_permission_to_role(db, role_id=role_id, permission_id=permission_id)
+    if not crud.remove_role_inheritance(db, role_id=role_id, inherited_role_id=inherited_role_id):
+        raise HTTPException(status_code=404, detail="Héritage non trouvé")
+    audit_log.record("role_inheritance_removed", actor=current_user.email, target=role_id,
+                     ip=client_ip(request), inherited_role_id=inherited_role_id)
+    return {"message": "Héritage supprimé avec succès"}
+
+@app.get("/roles/{role_id}/inherits", response_model=List[schemas.Role])
+def read_role_inheritance(
+    role_id: int,
+    transitive: bool = False,
+    db: Session = Depends(get_db),
+    current_user = Depends(middleware.has_permission("view_roles"))
+):
+    """
+    Rôles hérités directement, ou tous les rôles inclus avec transitive=true
+    """
+    if crud.get_role(db, role_id) is None:
+        raise HTTPException(status_code=404, detail="Rôle non trouvé")
+    return crud.get_inherited_roles(db, role_id, transitive=transitive)
 
 @app.post("/users/{user_id}/roles/{role_id}")
 def add_role_to_user(
     user_id: int,
     role_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user = Depends(middleware.has_permission("manage_users"))
 ):
-    return crud.add_role_to_user(db, user_id=user_id, role_id=role_id)
+    user = crud.add_role_to_user(db, user_id=user_id, role_id=role_id)
+    audit_log.record("user_role_added", actor=current_user.email, target=user_id,
+                     ip=client_ip(request), role_id=role_id)
+    return user
 
 @app.post("/register", response_model=schemas.User)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+def register_user(user: schemas.UserCreate, request: Request, db: Session = Depends(get_db)):
     db_user = crud.get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(
             status_code=400,
             detail="Email déjà enregistré"
         )
-    return crud.create_user(db=db, user=user)
+    db_user = crud.create_user(db=db, user=user)
+    audit_log.record("register", actor=db_user.email, target=db_user.id, ip=client_ip(request))
+    return db_user
 
 @app.get("/users/me", response_model=schemas.User)
-async def read_users_me(
+def read_users_me(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
 ):
@@ -168,6 +295,46 @@ async def read_users_me(
         )
     return user
 
+@app.get("/users/me/roles", response_model=schemas.UserAccess)
+def read_my_roles(
+    current_user = Depends(middleware.get_current_user),
+    db: Session = Depends(get_db)
+):
+    if current_user.is_superuser:
+        permissions = crud.get_permissions(db, limit=None)
+    else:
+        permissions = crud.get_user_permissions(db, current_user.id)
+    return {
+        "user_id": current_user.id,
+        "roles": [role.name for role in crud.get_user_roles(db, current_user.id)],
+        "permissions": sorted(perm.name for perm in permissions)
+    }
+
+@app.get("/stats/users-per-role", response_model=rollup.StatSeries)
+def read_user_stats(
+    db: Session = Depends(get_db),
+    current_user = Depends(middleware.has_permission("view_users"))
+):
+    return crud.get_user_stats(db)
+
+@app.get("/audit", response_model=audit.AuditPage)
+def read_audit_log(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    actor: Optional[str] = None,
+    action: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    current_user = Depends(middleware.has_permission("view_audit"))
+):
+    """
+    Événements d'audit du plus récent au plus ancien, sur [since, until[ ; next_cursor pour la page suivante
+    """
+    try:
+        return audit_log.query(since=since, until=until, actor=actor, action=action, cursor=cursor, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8002)
+    uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -5,6 +5,7 @@ from typing import List, Optional
 from database import get_db
 import auth
 import crud
+from shared import tracing
 
 def get_current_user(
     token: str = Depends(auth.oauth2_scheme),
@@ -13,7 +14,8 @@ def get_current_user(
     """
     Middleware pour obtenir l'utilisateur courant à partir du token
     """
-    email = auth.verify_token(token)
+    with tracing.span("auth.verify_token"):
+        email = auth.verify_token(token)
     if email is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -21,7 +23,8 @@ def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = crud.get_user_by_email(db, email=email)
+    with tracing.span("auth.load_user"):
+        user = crud.get_user_by_email(db, email=email)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -42,11 +45,10 @@ def has_permission(permission_name: str):
         if current_user.is_superuser:
             return current_user
         
-        # Vérifier les permissions de l'utilisateur
-        user_permissions = crud.get_user_permissions(db, current_user.id)
-        permission_names = [perm.name for perm in user_permissions]
-        
-        if permission_name not in permission_names:
+        # Vérifier les permissions de l'utilisateur (rôles hérités compris, une seule requête)
+        with tracing.span("rbac.check", permission=permission_name):
+            allowed = crud.user_has_permission(db, current_user.id, permission_name)
+        if not allowed:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Permission '{permission_name}' requise"
@@ -67,10 +69,10 @@ def has_any_permission(permission_names: List[str]):
         if current_user.is_superuser:
             return current_user
         
-        user_permissions = crud.get_user_permissions(db, current_user.id)
-        user_permission_names = [perm.name for perm in user_permissions]
+        with tracing.span("rbac.check", permissions=",".join(permission_names)):
+            user_permission_names = crud.get_user_permission_names(db, current_user.id, permission_names)
         
-        if not any(perm in user_permission_names for perm in permission_names):
+        if not user_permission_names:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Au moins une des permissions suivantes est requise: {permission_names}"
@@ -91,10 +93,10 @@ def has_all_permissions(permission_names: List[str]):
         if current_user.is_superuser:
             return current_user
         
-        user_permissions = crud.get_user_permissions(db, current_user.id)
-        user_permission_names = [perm.name for perm in user_permissions]
+        with tracing.span("rbac.check", permissions=",".join(permission_names)):
+            user_permission_names = crud.get_user_permission_names(db, current_user.id, permission_names)
         
-        if not all(perm in user_permission_names for perm in permission_names):
+        if not set(permission_names) <= user_permission_names:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Toutes les permissions suivantes sont requises: {permission_names}"
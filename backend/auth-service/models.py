@@ -3,8 +3,17 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
+from shared import audit, outbox, rollup
+
 Base = declarative_base()
 
+# Événements de changement, écrits dans la même transaction que les données
+OutboxEvent = outbox.declare_outbox(Base)
+# Compteurs agrégés des statistiques, eux aussi mis à jour dans la transaction d'écriture
+Rollup = rollup.declare_rollup(Base)
+# Journal d'audit, alimenté par lots en arrière-plan (jamais dans la transaction de la requête)
+AuditEvent = audit.declare_audit(Base)
+
 # Table de liaison pour les permissions des rôles
 role_permission = Table(
     'role_permission', Base.metadata,
@@ -19,6 +28,25 @@ user_role = Table(
     Column('role_id', Integer, ForeignKey('roles.id'), primary_key=True)
 )
 
+# Héritage entre rôles : role_id reçoit toutes les permissions de inherited_role_id
+role_inheritance = Table(
+    'role_inheritance', Base.metadata,
+    Column('role_id', Integer, ForeignKey('roles.id'), primary_key=True),
+    Column('inherited_role_id', Integer, ForeignKey('roles.id'), primary_key=True)
+)
+
+class RoleClosure(Base):
+    """
+    Fermeture transitive de l'héritage : une ligne par couple (rôle, rôle inclus),
+    lui-même compris. paths compte les chemins d'héritage distincts, ce qui permet
+    de retirer une arête sans tout recalculer.
+    """
+    __tablename__ = "role_closure"
+
+    role_id = Column(Integer, ForeignKey('roles.id'), primary_key=True)
+    included_role_id = Column(Integer, ForeignKey('roles.id'), primary_key=True, index=True)
+    paths = Column(Integer, nullable=False, default=1)
+
 class Permission(Base):
     __tablename__ = "permissions"
 
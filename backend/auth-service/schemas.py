@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional
+from datetime import datetime
 
 class UserBase(BaseModel):
     email: EmailStr
@@ -26,7 +27,7 @@ class PermissionCreate(PermissionBase):
 
 class Permission(PermissionBase):
     id: int
-    created_at: str
+    created_at: datetime
 
     class Config:
         orm_mode = True
@@ -42,12 +43,17 @@ class RoleCreate(RoleBase):
 
 class Role(RoleBase):
     id: int
-    created_at: str
+    created_at: datetime
     permissions: List[Permission] = []
 
     class Config:
         orm_mode = True
 
+class UserAccess(BaseModel):
+    user_id: int
+    roles: List[str] = []
+    permissions: List[str] = []
+
 # Schémas pour les tokens
 class Token(BaseModel):
     access_token: str
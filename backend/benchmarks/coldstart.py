@@ -0,0 +1,204 @@
+"""
+Mesure du démarrage à froid de chaque service du backend MindGraphix.
+
+Lance chaque service dans un interpréteur neuf avec `python -X importtime`,
+importe main.py puis exécute ses hooks de démarrage, et relève le temps total
+(interpréteur compris), le temps d'import, le temps des hooks et les imports
+les plus lourds. Échoue si un service dépasse son budget, importe au démarrage
+une dépendance censée être chargée à la demande, ou régresse par rapport à une
+référence.
+
+    python benchmarks/coldstart.py --output coldstart.json
+    python benchmarks/coldstart.py --budgets auth=1200,gateway=900 --compare coldstart.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    # nom: (répertoire, variables d'environnement propres à la cible)
+    "gateway": ("gateway", {}),
+    "auth": ("auth-service", {}),
+    "users": ("user-service", {}),
+    "projects": ("project-service", {}),
+    "services": ("service-service", {}),
+    "contact": ("contact-service", {}),
+    "monolith": ("gateway", {"GATEWAY_MODE": "monolith"}),
+}
+
+# Dépendances coûteuses qui ne doivent être importées qu'au premier usage
+LAZY_MODULES = {
+    "auth": ("jose", "passlib", "bcrypt"),
+    "monolith": ("jose", "passlib", "bcrypt"),
+}
+
+# Budget par défaut du démarrage à froid (médiane, millisecondes)
+DEFAULT_BUDGET_MS = 1500.0
+# Le monolithe importe les cinq services : budget propre, surchargeable par --budgets
+TARGET_BUDGETS_MS = {"monolith": 2500.0}
+
+# Exécuté dans le processus mesuré : chronomètre l'import puis les hooks de démarrage
+PROBE = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+asyncio.run(main.app.router.startup())
+ready = time.perf_counter()
+asyncio.run(main.app.router.shutdown())
+print(json.dumps({"import_ms": (imported - started) * 1000, "startup_ms": (ready - imported) * 1000}))
+"""
+
+
+def target_env(workdir: str, extra: dict) -> dict:
+    env = dict(os.environ)
+    env.update(extra)
+    # Bases neuves : le coût de create_all et des index FTS est inclus dans la mesure
+    env["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'service.db')}"
+    for prefix in ("AUTH", "USER", "PROJECT", "SERVICE", "CONTACT"):
+        env[f"{prefix}_DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, prefix.lower() + '.db')}"
+    env["CONTACT_LOG_DIR"] = os.path.join(workdir, "contact_log")
+    env["CONTACT_ARCHIVE_DIR"] = os.path.join(workdir, "contact_archive")
+    env["SNAPSHOT_DIR"] = os.path.join(workdir, "snapshots")
+    env.pop("PYTHONPROFILEIMPORTTIME", None)
+    return env
+
+
+def parse_importtime(stderr: str):
+    """
+    Lignes "import time: <self us> | <cumulé us> | <module indenté>" -> [(module, niveau, self_ms, cumulé_ms)]
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # Le nom est précédé d'un espace puis de deux espaces par niveau d'imbrication
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((name.strip(), depth, int(self_us) / 1000, int(cumulative_us) / 1000))
+    return entries
+
+
+def direct_imports(entries, module: str):
+    """
+    Imports directs d'un module de premier niveau. La sortie de -X importtime est
+    en ordre postfixe : ses descendants le précèdent immédiatement.
+    """
+    index = next(i for i, entry in enumerate(entries) if entry[0] == module and entry[1] == 0)
+    children = []
+    for entry in reversed(entries[:index]):
+        if entry[1] == 0:
+            break
+        if entry[1] == 1:
+            children.append(entry)
+    return children
+
+
+def measure_once(name: str) -> dict:
+    directory, extra = TARGETS[name]
+    with tempfile.TemporaryDirectory(prefix="mindgraphix-coldstart-") as workdir:
+        started = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE],
+            cwd=os.path.join(BACKEND_DIR, directory), env=target_env(workdir, extra),
+            capture_output=True, text=True
+        )
+        wall_ms = (time.perf_counter() - started) * 1000
+    if process.returncode != 0:
+        raise RuntimeError(f"{name} n'a pas démarré :\n{process.stderr[-2000:]}")
+    probe = json.loads(process.stdout.strip().splitlines()[-1])
+    entries = parse_importtime(process.stderr)
+    return {"wall_ms": wall_ms, **probe, "imports": entries}
+
+
+def measure(name: str, repeat: int, top: int) -> dict:
+    runs = [measure_once(name) for _ in range(repeat)]
+    last = runs[-1]["imports"]
+    heaviest = sorted(direct_imports(last, "main"), key=lambda e: e[3], reverse=True)[:top]
+    imported = {entry[0] for entry in last}
+    eager = sorted(module for module in LAZY_MODULES.get(name, ()) if module in imported)
+    return {
+        "cold_start_ms": round(statistics.median(r["wall_ms"] for r in runs), 1),
+        "import_ms": round(statistics.median(r["import_ms"] for r in runs), 1),
+        "startup_hooks_ms": round(statistics.median(r["startup_ms"] for r in runs), 1),
+        "modules_imported": len(imported),
+        "heaviest_imports_ms": {entry[0]: round(entry[3], 1) for entry in heaviest},
+        "eager_lazy_modules": eager,
+    }
+
+
+def parse_budgets(value: str) -> dict:
+    """
+    "auth=1200,gateway=900" -> {"auth": 1200.0, "gateway": 900.0}
+    """
+    budgets = {}
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        name, _, limit = item.partition("=")
+        budgets[name.strip()] = float(limit)
+    return budgets
+
+
+def violations(report: dict, budgets: dict, default_budget: float, baseline: dict = None, tolerance: float = 0.2):
+    found = []
+    for name, result in report["targets"].items():
+        budget = budgets.get(name, TARGET_BUDGETS_MS.get(name, default_budget))
+        if result["cold_start_ms"] > budget:
+            found.append({"target": name, "reason": "budget", "budget_ms": budget, "current_ms": result["cold_start_ms"]})
+        if result["eager_lazy_modules"]:
+            found.append({"target": name, "reason": "eager_import", "modules": result["eager_lazy_modules"]})
+        base = (baseline or {}).get("targets", {}).get(name)
+        if base and result["cold_start_ms"] > base["cold_start_ms"] * (1 + tolerance):
+            found.append({"target": name, "reason": "regression",
+                          "baseline_ms": base["cold_start_ms"], "current_ms": result["cold_start_ms"]})
+    return found
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--targets", default=",".join(TARGETS), help="services mesurés, séparés par des virgules")
+    parser.add_argument("--repeat", type=int, default=3, help="démarrages par service (médiane)")
+    parser.add_argument("--top", type=int, default=8, help="nombre d'imports les plus lourds rapportés")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="budget par défaut du démarrage à froid")
+    parser.add_argument("--budgets", help="budgets par service, ex. auth=1200,gateway=900")
+    parser.add_argument("--output", help="fichier JSON du rapport (sortie standard sinon)")
+    parser.add_argument("--compare", help="rapport de référence à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="hausse relative tolérée en mode comparaison")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    names = [name for name in args.targets.split(",") if name]
+    unknown = set(names) - set(TARGETS)
+    if unknown:
+        raise SystemExit(f"Cibles inconnues : {', '.join(sorted(unknown))}")
+
+    report = {
+        "config": {"repeat": args.repeat, "python": sys.version.split()[0]},
+        "targets": {name: measure(name, args.repeat, args.top) for name in names},
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report["violations"] = violations(report, parse_budgets(args.budgets), args.budget_ms, baseline, args.tolerance)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 1 if report["violations"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
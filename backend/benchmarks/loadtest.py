@@ -0,0 +1,511 @@
+"""
+Banc de charge de bout en bout pour le backend MindGraphix.
+
+Démarre le gateway et les cinq services sur localhost avec des bases SQLite
+temporaires alimentées à la taille voulue, rejoue un mélange de requêtes
+réalistes à concurrence fixe ou à débit d'arrivée fixe, puis écrit débit et
+latences p50/p95/p99 par endpoint au format JSON.
+
+    python benchmarks/loadtest.py --duration 30 --concurrency 32 --output run.json
+    python benchmarks/loadtest.py --rate 200 --mix read-heavy --compare baseline.json
+    python benchmarks/loadtest.py --layout both   # distribué vs monolithe (GATEWAY_MODE=monolith)
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVICES = {
+    # nom: (répertoire, variable d'URL lue par le gateway, fichier SQLite, préfixe en mode monolithe)
+    "auth": ("auth-service", "AUTH_SERVICE_URL", "auth.db", "AUTH"),
+    "users": ("user-service", "USER_SERVICE_URL", "users.db", "USER"),
+    "projects": ("project-service", "PROJECT_SERVICE_URL", "projects.db", "PROJECT"),
+    "services": ("service-service", "SERVICE_SERVICE_URL", "services.db", "SERVICE"),
+    "contact": ("contact-service", "CONTACT_SERVICE_URL", "contacts.db", "CONTACT"),
+}
+
+LAYOUTS = ("distributed", "monolith")
+
+ADMIN_EMAIL = "admin@bench.example.com"
+USER_PASSWORD = "bench-password"
+
+# Poids relatifs des scénarios pour chaque mélange
+MIXES = {
+    "default": {
+        "catalog_list": 30, "catalog_facets": 10, "project_list": 15, "project_detail": 15,
+        "user_view": 10, "login": 5, "admin_roles": 5, "contact_submit": 10,
+    },
+    "read-heavy": {
+        "catalog_list": 40, "catalog_facets": 15, "project_list": 20, "project_detail": 20, "user_view": 5,
+    },
+    "write-heavy": {
+        "contact_submit": 60, "login": 20, "catalog_list": 20,
+    },
+    "snapshot": {
+        "catalog_snapshot": 35, "project_snapshot": 35, "catalog_list": 15, "project_list": 15,
+    },
+    "auth": {
+        "login": 40, "admin_roles": 30, "user_view": 30,
+    },
+}
+
+CATEGORIES = ["design", "web", "branding", "marketing", "conseil", "print"]
+
+
+# --- Démarrage des services ---
+
+def free_port() -> int:
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def service_env(workdir: str, urls: dict, db_file: str) -> dict:
+    env = dict(os.environ)
+    env.update(urls)
+    env["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, db_file)}"
+    env["CONTACT_LOG_DIR"] = os.path.join(workdir, "contact_log")
+    env["CONTACT_ARCHIVE_DIR"] = os.path.join(workdir, "contact_archive")
+    env["SNAPSHOT_DIR"] = os.path.join(workdir, "snapshots")
+    return env
+
+
+def spawn_uvicorn(directory: str, port: int, env: dict, output):
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=os.path.join(BACKEND_DIR, directory), env=env, stdout=output, stderr=output
+    )
+
+
+def stop_processes(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def init_auth_db(env: dict, output):
+    # Rôles et permissions de base avant le démarrage
+    subprocess.run([sys.executable, "init_db.py"], cwd=os.path.join(BACKEND_DIR, SERVICES["auth"][0]),
+                   env=env, stdout=output, check=True)
+
+
+def wait_healthy(url: str, process, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} s'est arrêté au démarrage (code {process.returncode})")
+        try:
+            # Toute réponse HTTP suffit : le serveur écoute
+            httpx.get(url, timeout=0.5)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} n'a pas démarré en {timeout}s")
+
+
+@contextmanager
+def distributed_stack(workdir: str, quiet: bool = True):
+    """
+    Un processus uvicorn par service, comme en production
+    """
+    ports = {name: free_port() for name in SERVICES}
+    urls = {SERVICES[name][1]: f"http://127.0.0.1:{port}" for name, port in ports.items()}
+    processes = []
+    output = subprocess.DEVNULL if quiet else None
+
+    try:
+        for name, (directory, _, db_file, _) in SERVICES.items():
+            env = service_env(workdir, urls, db_file)
+            if name == "auth":
+                init_auth_db(env, output)
+            processes.append(spawn_uvicorn(directory, ports[name], env, output))
+            wait_healthy(f"http://127.0.0.1:{ports[name]}/docs", processes[-1])
+
+        gateway_port = free_port()
+        processes.append(spawn_uvicorn("gateway", gateway_port, service_env(workdir, urls, "gateway.db"), output))
+        wait_healthy(f"http://127.0.0.1:{gateway_port}/health", processes[-1])
+
+        yield {
+            "gateway": f"http://127.0.0.1:{gateway_port}",
+            **{name: f"http://127.0.0.1:{port}" for name, port in ports.items()},
+        }
+    finally:
+        stop_processes(processes)
+
+
+@contextmanager
+def monolith_stack(workdir: str, quiet: bool = True):
+    """
+    Un seul processus : le gateway charge les services (GATEWAY_MODE=monolith).
+    Les appels directs aux services passent par son port interne (GATEWAY_INTERNAL_PORT).
+    """
+    output = subprocess.DEVNULL if quiet else None
+    env = service_env(workdir, {}, "gateway.db")
+    env["GATEWAY_MODE"] = "monolith"
+    internal_port = free_port()
+    env["GATEWAY_INTERNAL_PORT"] = str(internal_port)
+    for _, _, db_file, prefix in SERVICES.values():
+        env[f"{prefix}_DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, db_file)}"
+    init_auth_db(dict(env, DATABASE_URL=env["AUTH_DATABASE_URL"]), output)
+
+    gateway_port = free_port()
+    process = spawn_uvicorn("gateway", gateway_port, env, output)
+    try:
+        wait_healthy(f"http://127.0.0.1:{gateway_port}/health", process)
+        gateway = f"http://127.0.0.1:{gateway_port}"
+        yield {"gateway": gateway, **{name: f"http://127.0.0.1:{internal_port}/{name}" for name in SERVICES}}
+    finally:
+        stop_processes([process])
+
+
+STACKS = {"distributed": distributed_stack, "monolith": monolith_stack}
+
+
+# --- Données de départ ---
+
+def seed(workdir: str, size: dict, rng: random.Random):
+    """
+    Insère directement en SQLite (les tables ont été créées au démarrage des services)
+    """
+    from passlib.context import CryptContext
+    hashed = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(USER_PASSWORD)
+
+    def db(name):
+        return sqlite3.connect(os.path.join(workdir, SERVICES[name][2]))
+
+    with db("auth") as conn:
+        conn.execute(
+            "INSERT INTO users (email, hashed_password, full_name, is_active, is_superuser, created_at, updated_at) "
+            "VALUES (?, ?, 'Admin', 1, 0, datetime('now'), datetime('now'))", (ADMIN_EMAIL, hashed)
+        )
+        conn.execute(
+            "INSERT INTO user_role (user_id, role_id) SELECT u.id, r.id FROM users u, roles r "
+            "WHERE u.email = ? AND r.name = 'admin'", (ADMIN_EMAIL,)
+        )
+        conn.executemany(
+            "INSERT INTO users (email, hashed_password, full_name, is_active, is_superuser, created_at, updated_at) "
+            "VALUES (?, ?, ?, 1, 0, datetime('now'), datetime('now'))",
+            ((f"user{i}@bench.example.com", hashed, f"Utilisateur {i}") for i in range(size["users"]))
+        )
+    with db("users") as conn:
+        conn.executemany(
+            "INSERT INTO user_profiles (user_id, bio, company, location, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, datetime('now'), datetime('now'))",
+            ((i + 1, f"Bio de l'utilisateur {i}", f"Société {i % 50}", "Paris") for i in range(size["users"] + 1))
+        )
+    with db("projects") as conn:
+        conn.executemany(
+            "INSERT INTO projects (title, description, created_at, updated_at) "
+            "VALUES (?, ?, datetime('now'), datetime('now'))",
+            ((f"Projet {i}", "Refonte graphique et développement web " * 8) for i in range(size["projects"]))
+        )
+    with db("services") as conn:
+        conn.executemany(
+            "INSERT INTO services (name, description, price, category) VALUES (?, ?, ?, ?)",
+            ((f"Service {i}", "Prestation sur mesure " * 6, round(rng.uniform(50, 8000), 2), rng.choice(CATEGORIES))
+             for i in range(size["services"]))
+        )
+    with db("contact") as conn:
+        conn.executemany(
+            "INSERT INTO contacts (name, email, message, created_at) VALUES (?, ?, ?, datetime('now'))",
+            ((f"Client {i}", f"client{i}@example.com", "Demande de devis " * 10) for i in range(size["contacts"]))
+        )
+    # Les messages insérés dans l'ancienne table sont répartis dans les partitions mensuelles
+    subprocess.run(
+        [sys.executable, "partitions.py", "maintain"], cwd=os.path.join(BACKEND_DIR, SERVICES["contact"][0]),
+        env=service_env(workdir, {}, SERVICES["contact"][2]), stdout=subprocess.DEVNULL, check=True
+    )
+    # Données insérées hors des services : les instantanés précompressés sont republiés
+    for name in ("projects", "services"):
+        env = service_env(workdir, {}, SERVICES[name][2])
+        env["PYTHONPATH"] = BACKEND_DIR
+        subprocess.run(
+            [sys.executable, "-m", "shared.snapshot", "publish-here"], cwd=os.path.join(BACKEND_DIR, SERVICES[name][0]),
+            env=env, stdout=subprocess.DEVNULL, check=True
+        )
+
+
+# --- Scénarios ---
+
+class Scenarios:
+    def __init__(self, urls: dict, size: dict, client: httpx.AsyncClient, rng: random.Random):
+        self.urls = urls
+        self.size = size
+        self.client = client
+        self.rng = rng
+        self.admin_token = None
+        self.user_tokens = []
+
+    async def prepare(self):
+        self.admin_token = await self._login(ADMIN_EMAIL)
+        for i in range(min(10, self.size["users"])):
+            self.user_tokens.append(await self._login(f"user{i}@bench.example.com"))
+
+    async def _login(self, email):
+        response = await self.client.post(
+            f"{self.urls['auth']}/token", data={"username": email, "password": USER_PASSWORD}
+        )
+        response.raise_for_status()
+        return response.json()["access_token"]
+
+    def request(self, name: str):
+        """
+        Renvoie (méthode, url, options) pour un scénario
+        """
+        gateway = self.urls["gateway"]
+        if name == "catalog_list":
+            return "GET", f"{gateway}/api/services/services", {"params": {"limit": 50, "sort": "price"}}
+        if name == "catalog_facets":
+            return "GET", f"{gateway}/api/services/services/catalog", {
+                "params": {"category": self.rng.choice(CATEGORIES), "max_price": 2000, "limit": 20}
+            }
+        if name == "catalog_snapshot":
+            return "GET", f"{gateway}/api/services/services/snapshot", {}
+        if name == "project_snapshot":
+            return "GET", f"{gateway}/api/projects/projects/snapshot", {}
+        if name == "project_list":
+            return "GET", f"{gateway}/api/projects/projects", {"params": {"limit": 20}}
+        if name == "project_detail":
+            project_id = self.rng.randint(1, max(1, self.size["projects"]))
+            return "GET", f"{gateway}/api/projects/projects/{project_id}", {}
+        if name == "user_view":
+            token = self.rng.choice(self.user_tokens or [self.admin_token])
+            return "GET", f"{gateway}/me", {"headers": {"Authorization": f"Bearer {token}"}}
+        if name == "login":
+            email = f"user{self.rng.randrange(max(1, self.size['users']))}@bench.example.com"
+            return "POST", f"{self.urls['auth']}/token", {"data": {"username": email, "password": USER_PASSWORD}}
+        if name == "admin_roles":
+            return "GET", f"{self.urls['auth']}/roles", {"headers": {"Authorization": f"Bearer {self.admin_token}"}}
+        if name == "contact_submit":
+            return "POST", f"{self.urls['contact']}/contacts", {
+                "json": {"name": "Client", "email": "client@example.com", "message": "Bonjour, un devis ?"}
+            }
+        raise ValueError(f"Scénario inconnu: {name}")
+
+
+# --- Exécution et mesures ---
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, name: str, seconds: float, ok: bool):
+        self.latencies.setdefault(name, []).append(seconds)
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+
+async def timed_call(scenarios: Scenarios, recorder: Recorder, name: str):
+    method, url, options = scenarios.request(name)
+    started = time.perf_counter()
+    try:
+        response = await scenarios.client.request(method, url, **options)
+        ok = response.status_code < 400
+    except httpx.HTTPError:
+        ok = False
+    recorder.record(name, time.perf_counter() - started, ok)
+
+
+async def run_closed_loop(scenarios, recorder, weights, concurrency, duration):
+    names, cumulative = list(weights), list(weights.values())
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            await timed_call(scenarios, recorder, scenarios.rng.choices(names, cumulative)[0])
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+
+async def run_open_loop(scenarios, recorder, weights, rate, duration):
+    """
+    Arrivées de Poisson à débit fixe : la latence inclut l'attente côté serveur
+    au lieu d'être masquée par la boucle fermée
+    """
+    names, cumulative = list(weights), list(weights.values())
+    deadline = time.perf_counter() + duration
+    pending = set()
+    while time.perf_counter() < deadline:
+        task = asyncio.ensure_future(timed_call(scenarios, recorder, scenarios.rng.choices(names, cumulative)[0]))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        await asyncio.sleep(scenarios.rng.expovariate(rate))
+    if pending:
+        await asyncio.gather(*pending)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    # Rang le plus proche
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    endpoints = {}
+    for name, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        endpoints[name] = {
+            "count": len(values),
+            "errors": recorder.errors.get(name, 0),
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "mean_ms": round(1000 * sum(values) / len(values), 3),
+            "p50_ms": round(1000 * percentile(values, 0.50), 3),
+            "p95_ms": round(1000 * percentile(values, 0.95), 3),
+            "p99_ms": round(1000 * percentile(values, 0.99), 3),
+        }
+    total = sum(e["count"] for e in endpoints.values())
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "total_requests": total,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+async def drive(urls: dict, args, size: dict, rng: random.Random) -> dict:
+    limits = httpx.Limits(max_connections=max(args.concurrency, 100), max_keepalive_connections=max(args.concurrency, 100))
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        scenarios = Scenarios(urls, size, client, rng)
+        await scenarios.prepare()
+        weights = MIXES[args.mix]
+
+        if args.warmup:
+            await run_closed_loop(scenarios, Recorder(), weights, args.concurrency, args.warmup)
+
+        recorder = Recorder()
+        started = time.perf_counter()
+        if args.rate:
+            await run_open_loop(scenarios, recorder, weights, args.rate, args.duration)
+        else:
+            await run_closed_loop(scenarios, recorder, weights, args.concurrency, args.duration)
+        return summarize(recorder, time.perf_counter() - started)
+
+
+# --- Comparaison avec une référence ---
+
+def layout_savings(distributed: dict, monolith: dict) -> dict:
+    """
+    Latence gagnée par le mode monolithe, par endpoint (valeurs positives = plus rapide)
+    """
+    savings = {}
+    for name, base in distributed["endpoints"].items():
+        now = monolith["endpoints"].get(name)
+        if now is None:
+            continue
+        savings[name] = {
+            metric: round(base[metric] - now[metric], 3) for metric in ("p50_ms", "p95_ms", "p99_ms")
+        }
+    return savings
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Liste des régressions : latence p50/p95/p99 plus haute ou débit plus bas que la référence
+    au-delà de la tolérance relative
+    """
+    regressions = []
+    for name, base in baseline.get("endpoints", {}).items():
+        now = current["endpoints"].get(name)
+        if now is None:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if base[metric] and now[metric] > base[metric] * (1 + tolerance):
+                regressions.append({"endpoint": name, "metric": metric, "baseline": base[metric], "current": now[metric]})
+        if base["throughput_rps"] and now["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append({"endpoint": name, "metric": "throughput_rps",
+                                "baseline": base["throughput_rps"], "current": now["throughput_rps"]})
+        if now["errors"] > base["errors"]:
+            regressions.append({"endpoint": name, "metric": "errors", "baseline": base["errors"], "current": now["errors"]})
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mix", choices=sorted(MIXES), default="default")
+    parser.add_argument("--layout", choices=LAYOUTS + ("both",), default="distributed",
+                        help="un processus par service, monolithe, ou les deux pour comparer")
+    parser.add_argument("--duration", type=float, default=15.0, help="durée mesurée (secondes)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="chauffe non mesurée (secondes)")
+    parser.add_argument("--concurrency", type=int, default=16, help="requêtes simultanées (boucle fermée)")
+    parser.add_argument("--rate", type=float, default=None, help="requêtes/s en arrivées de Poisson (boucle ouverte)")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--projects", type=int, default=1000)
+    parser.add_argument("--services", type=int, default=500)
+    parser.add_argument("--contacts", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42, help="graine aléatoire (reproductibilité)")
+    parser.add_argument("--output", help="fichier JSON du rapport (sortie standard sinon)")
+    parser.add_argument("--compare", help="rapport de référence à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="écart relatif toléré en mode comparaison")
+    parser.add_argument("--verbose", action="store_true", help="afficher les journaux des services")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    size = {"projects": args.projects, "services": args.services, "contacts": args.contacts, "users": args.users}
+    layouts = LAYOUTS if args.layout == "both" else (args.layout,)
+
+    results = {}
+    for layout in layouts:
+        # Même graine pour chaque disposition : données et séquence de requêtes identiques
+        rng = random.Random(args.seed)
+        with tempfile.TemporaryDirectory(prefix="mindgraphix-bench-") as workdir:
+            with STACKS[layout](workdir, quiet=not args.verbose) as urls:
+                seed(workdir, size, rng)
+                results[layout] = asyncio.run(drive(urls, args, size, rng))
+
+    report = {
+        "config": {
+            "mix": args.mix, "layout": args.layout, "duration_s": args.duration,
+            "concurrency": None if args.rate else args.concurrency,
+            "rate_rps": args.rate, "size": size, "seed": args.seed, "python": sys.version.split()[0],
+        },
+    }
+    if args.layout == "both":
+        report["layouts"] = results
+        report["monolith_savings_ms"] = layout_savings(results["distributed"], results["monolith"])
+        # La comparaison avec une référence porte sur le mode monolithe
+        report.update(results["monolith"])
+    else:
+        report.update(results[args.layout])
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+        exit_code = 1 if regressions else 0
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
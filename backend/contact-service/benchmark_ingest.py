@@ -0,0 +1,114 @@
+"""
+Mesure du débit soutenu de soumissions de contact.
+
+Compare l'écriture directe (un commit par message, crud.create_contact) à la file
+d'ingestion (journal local + écriture par lots). Usage :
+
+    python benchmark_ingest.py --messages 5000 --threads 8
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Rendre le paquet backend/shared importable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import models
+import schemas
+import crud
+import ingest
+
+
+def make_session_factory(directory):
+    engine = create_engine(
+        f"sqlite:///{os.path.join(directory, 'bench.db')}",
+        connect_args={"check_same_thread": False}
+    )
+    models.Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def sample_contact(i):
+    return {"name": f"Client {i}", "email": f"client{i}@example.com", "message": "Bonjour, je souhaite un devis." * 4}
+
+
+def run_threads(count, threads, submit_one):
+    def worker(start):
+        for i in range(start, count, threads):
+            submit_one(i)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def bench_direct(count, threads):
+    with tempfile.TemporaryDirectory() as directory:
+        engine, session_factory = make_session_factory(directory)
+        lock = threading.Lock()
+
+        def submit_one(i):
+            # SQLite n'accepte qu'un écrivain : on sérialise comme le ferait le verrou de la base
+            with lock:
+                db = session_factory()
+                try:
+                    crud.create_contact(db, schemas.ContactCreate(**sample_contact(i)))
+                finally:
+                    db.close()
+
+        elapsed = run_threads(count, threads, submit_one)
+        engine.dispose()
+    return {"mode": "direct", "messages": count, "seconds": round(elapsed, 3),
+            "per_second": round(count / elapsed, 1)}
+
+
+def bench_queue(count, threads, fsync):
+    with tempfile.TemporaryDirectory() as directory:
+        engine, session_factory = make_session_factory(directory)
+        queue = ingest.ContactIngestQueue(
+            log_dir=os.path.join(directory, "log"), session_factory=session_factory,
+            max_pending=count + 1, fsync=fsync
+        )
+        queue.start()
+
+        started = time.perf_counter()
+        acked = run_threads(count, threads, lambda i: queue.submit(sample_contact(i)))
+        while queue.pending():
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - started
+        queue.stop()
+        engine.dispose()
+    return {"mode": "queue" + ("+fsync" if fsync else ""), "messages": count,
+            "ack_seconds": round(acked, 3), "ack_per_second": round(count / acked, 1),
+            "seconds": round(elapsed, 3), "per_second": round(count / elapsed, 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--skip-direct", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = []
+    if not args.skip_direct:
+        results.append(bench_direct(args.messages, args.threads))
+    results.append(bench_queue(args.messages, args.threads, fsync=True))
+    results.append(bench_queue(args.messages, args.threads, fsync=False))
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,375 @@
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import case, func, text
 from sqlalchemy.orm import Session
-from . import models, schemas
+import models
+import notify
+import partitions
+import schemas
+from shared import jobs, multiget, outbox, rollup
+
+Partition = models.ContactPartition
+CONTACTS_PER_DAY = "contacts_per_day"
+# Champs exposés, sélectionnables avec ?fields=
+FIELDS = ("id", "name", "email", "message", "created_at")
+# Période de la maintenance des partitions (archivage, rétention, cache) service démarré ; 0 : au démarrage seulement
+MAINTENANCE_INTERVAL = float(os.getenv("CONTACT_MAINTENANCE_INTERVAL", "3600"))
+
+JOBS = jobs.JobQueue("contact", models.Job)
+JOBS.task("notify_contact")(notify.send_contact_notification)
+
+@JOBS.task("rebuild_rollups", exclusive=True)
+def rebuild_rollups_job(db: Session, payload: dict):
+    rebuild_rollups(db)
+
+@JOBS.task("maintain_partitions", exclusive=True)
+def maintain_partitions_job(db: Session, payload: dict):
+    run_partition_maintenance(db)
+    schedule_partition_maintenance(db)
+    db.commit()
+
+def schedule_partition_maintenance(db: Session):
+    """
+    Met en file la prochaine maintenance, au début de la période suivante (sans commit).
+    Clé par période : plusieurs workers ne la planifient qu'une fois.
+    """
+    if not MAINTENANCE_INTERVAL:
+        return None
+    period = int(time.time() // MAINTENANCE_INTERVAL) + 1
+    return JOBS.enqueue(db, "maintain_partitions", key=f"maintain_partitions:{period}",
+                        delay=max(0.0, period * MAINTENANCE_INTERVAL - time.time()))
+
+# --- Routage vers les partitions mensuelles ---
+
+def list_partitions(db: Session, created_after: datetime = None, created_before: datetime = None):
+    """
+    Partitions dont le mois recoupe l'intervalle [created_after, created_before[
+    """
+    query = db.query(Partition)
+    if created_after is not None:
+        query = query.filter(Partition.ends_at > created_after)
+    if created_before is not None:
+        query = query.filter(Partition.starts_at < created_before)
+    return query.order_by(Partition.month).all()
+
+def _select(partition, where: str = "", suffix: str = "", columns=partitions.FIELDS) -> str:
+    return f"SELECT {', '.join(columns)} FROM {partitions.table_name(partition.month)}{where}{suffix}"
+
+def _columns(fields, extra=()):
+    # Projection poussée dans le SELECT : seules ces colonnes sont lues
+    return tuple(dict.fromkeys([*fields, *extra])) if fields else partitions.FIELDS
+
+def _execute(db: Session, partition, sql: str, params: dict):
+    # Même SQL pour une partition en table et pour son archive compressée
+    if partition.archive_path:
+        return partitions.query_archive(partition.archive_path, sql, params)
+    return db.execute(text(sql), params).fetchall()
+
+def _count(db: Session, partition, created_after: datetime = None, created_before: datetime = None) -> int:
+    covered = (created_after is None or partition.starts_at >= created_after) and \
+              (created_before is None or partition.ends_at <= created_before)
+    if covered:
+        # Partition entièrement dans l'intervalle : le catalogue suffit
+        return partition.row_count
+    where, params = partitions.range_filter(created_after, created_before)
+    sql = f"SELECT COUNT(*) FROM {partitions.table_name(partition.month)}{where}"
+    return _execute(db, partition, sql, params)[0][0]
+
+def get_contact(db: Session, contact_id: int, fields=None):
+    # id et created_at servent à l'ETag du détail
+    columns = _columns(fields, extra=("id", "created_at"))
+    candidates = db.query(Partition).filter(Partition.min_id <= contact_id, Partition.max_id >= contact_id)
+    for partition in candidates.order_by(Partition.month):
+        rows = _execute(db, partition, _select(partition, " WHERE id = :id", columns=columns), {"id": contact_id})
+        if rows:
+            return partitions.to_record(rows[0], columns)
+    return None
+
+def get_contacts_by_ids(db: Session, ids, fields=None):
+    """
+    {id: contact} : une requête IN par partition concernée (bornes du catalogue) et par paquet
+    """
+    columns = _columns(fields, extra=("id", "created_at"))
+    remaining = set(ids)
+    found = {}
+    if not remaining:
+        return found
+    candidates = db.query(Partition).filter(Partition.min_id <= max(remaining), Partition.max_id >= min(remaining))
+    for partition in candidates.order_by(Partition.month):
+        in_range = sorted(key for key in remaining if partition.min_id <= key <= partition.max_id)
+        for chunk in multiget.chunks(in_range):
+            params = {f"id{index}": key for index, key in enumerate(chunk)}
+            where = f" WHERE id IN ({', '.join(':' + name for name in params)})"
+            for row in _execute(db, partition, _select(partition, where, columns=columns), params):
+                record = partitions.to_record(row, columns)
+                found[record.id] = record
+        remaining.difference_update(found)
+        if not remaining:
+            break
+    multiget.batch_sizes.observe(len(ids), loader="contacts")
+    return found
+
+def get_contacts(db: Session, skip: int = 0, limit: int = 100,
+                 created_after: datetime = None, created_before: datetime = None, fields=None):
+    """
+    Parcourt les partitions dans l'ordre chronologique : les partitions entièrement
+    sautées par l'offset ne sont pas lues, seul leur volume est compté
+    """
+    where, params = partitions.range_filter(created_after, created_before)
+    columns = _columns(fields)
+    results = []
+    for partition in list_partitions(db, created_after, created_before):
+        if len(results) >= limit:
+            break
+        if skip:
+            count = _count(db, partition, created_after, created_before)
+            if skip >= count:
+                skip -= count
+                continue
+        rows = _execute(db, partition, _select(partition, where, " ORDER BY id LIMIT :limit OFFSET :offset", columns),
+                        dict(params, limit=limit - len(results), offset=skip))
+        skip = 0
+        results.extend(partitions.to_record(row, columns) for row in rows)
+    return results
+
+def get_contact_stats(db: Session, since: str = None, until: str = None):
+    return rollup.series(db, models.Rollup, CONTACTS_PER_DAY, since=since, until=until)
+
+def get_contacts_version(db: Session):
+    # Les messages ne sont jamais modifiés : volume et dernier id du catalogue suffisent
+    return db.query(func.coalesce(func.sum(Partition.row_count), 0), func.max(Partition.max_id)).one()
+
+# --- Écritures ---
+
+def _ensure_sequence(db: Session):
+    if db.query(models.ContactSequence).get(1) is None:
+        last_id = max(db.query(func.max(Partition.max_id)).scalar() or 0,
+                      db.query(func.max(models.Contact.id)).scalar() or 0)
+        db.add(models.ContactSequence(id=1, next_id=last_id + 1))
+        db.flush()
+        return True
+    return False
 
-def get_contact(db: Session, contact_id: int):
-    return db.query(models.Contact).filter(models.Contact.id == contact_id).first()
+def _allocate_ids(db: Session, count: int) -> int:
+    """
+    Réserve count identifiants consécutifs et renvoie le premier.
+    L'UPDATE prend le verrou d'écriture avant la lecture.
+    """
+    _ensure_sequence(db)
+    sequence = models.ContactSequence
+    db.query(sequence).filter(sequence.id == 1).update(
+        {sequence.next_id: sequence.next_id + count}, synchronize_session=False
+    )
+    return db.query(sequence.next_id).filter(sequence.id == 1).scalar() - count
 
-def get_contacts(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Contact).offset(skip).limit(limit).all()
+def _open_partition(db: Session, key: str):
+    partition = db.query(Partition).get(key)
+    if partition is not None and partition.archive_path:
+        raise ValueError(f"La partition {key} est archivée et en lecture seule")
+    if partition is None:
+        partitions.partition_table(key).create(db.connection(), checkfirst=True)
+        starts_at = partitions.month_start(key)
+        partition = Partition(month=key, starts_at=starts_at, ends_at=partitions.add_months(starts_at, 1), row_count=0)
+        db.add(partition)
+        db.flush()
+    return partition
+
+def _write_rows(db: Session, rows: list):
+    """
+    Insère des lignes déjà identifiées dans la partition de leur mois et met à jour le catalogue
+    """
+    by_month = defaultdict(list)
+    for row in rows:
+        by_month[partitions.month_key(row["created_at"])].append(row)
+    for key, month_rows in by_month.items():
+        _open_partition(db, key)
+        db.execute(partitions.partition_table(key).insert(), month_rows)
+        low = min(row["id"] for row in month_rows)
+        high = max(row["id"] for row in month_rows)
+        db.query(Partition).filter(Partition.month == key).update({
+            Partition.row_count: Partition.row_count + len(month_rows),
+            Partition.min_id: case((Partition.min_id.is_(None) | (Partition.min_id > low), low), else_=Partition.min_id),
+            Partition.max_id: case((Partition.max_id.is_(None) | (Partition.max_id < high), high), else_=Partition.max_id),
+        }, synchronize_session=False)
+    days = defaultdict(int)
+    for row in rows:
+        days[row["created_at"].strftime("%Y-%m-%d")] += 1
+    rollup.increment_many(db, models.Rollup, CONTACTS_PER_DAY, days)
+
+def _existing_ingest_ids(db: Session, contacts: list) -> set:
+    by_month = defaultdict(list)
+    for contact in contacts:
+        by_month[partitions.month_key(contact["created_at"])].append(contact["ingest_id"])
+    existing = set()
+    # Archives comprises : une entrée rejouée après l'archivage de son mois n'est pas réinsérée.
+    # Limite : un mois supprimé par la rétention ne garde pas trace de ses entrées.
+    for partition in db.query(Partition).filter(Partition.month.in_(list(by_month))):
+        ingest_ids = by_month[partition.month]
+        params = {f"i{index}": ingest_id for index, ingest_id in enumerate(ingest_ids)}
+        where = f" WHERE ingest_id IN ({', '.join(':' + name for name in params)})"
+        existing.update(row[0] for row in _execute(db, partition, _select(partition, where, columns=("ingest_id",)), params))
+    return existing
+
+def _enqueue_notifications(db: Session, rows: list):
+    # Clé stable : un lot rejoué après un crash n'envoie pas le message deux fois
+    if notify.ENABLED:
+        JOBS.enqueue_many(db, "notify_contact", [(row, f"notify:{row['ingest_id'] or row['id']}") for row in rows])
 
 def create_contact(db: Session, contact: schemas.ContactCreate):
-    db_contact = models.Contact(**contact.dict())
-    db.add(db_contact)
+    row = dict(contact.dict(), created_at=datetime.utcnow(), ingest_id=None)
+    row["id"] = _allocate_ids(db, 1)
+    _write_rows(db, [row])
+    outbox.record(db, models.OutboxEvent, "contact", "created", row["id"])
+    _enqueue_notifications(db, [row])
+    db.commit()
+    return partitions.ContactRecord(**row)
+
+def create_contacts_batch(db: Session, contacts: list):
+    # Les entrées déjà présentes (rejouées après un crash) sont ignorées
+    existing = _existing_ingest_ids(db, contacts)
+    rows = [dict(contact) for contact in contacts if contact["ingest_id"] not in existing]
+    if rows:
+        first_id = _allocate_ids(db, len(rows))
+        for offset, row in enumerate(rows):
+            row["id"] = first_id + offset
+        _write_rows(db, rows)
+        for row in rows:
+            outbox.record(db, models.OutboxEvent, "contact", "created", row["id"])
+        _enqueue_notifications(db, rows)
+    db.commit()
+    return len(rows)
+
+# --- Import / export en masse (python -m shared.bulk) ---
+
+def import_contacts(db: Session, rows: list):
+    """
+    Insère un paquet de lignes dans leurs partitions, sans événement par ligne.
+    Les identifiants fournis sont conservés, les autres sont attribués par la séquence.
+    """
+    missing = [row for row in rows if row.get("id") is None]
+    if missing:
+        first_id = _allocate_ids(db, len(missing))
+        for offset, row in enumerate(missing):
+            row["id"] = first_id + offset
+    now = datetime.utcnow()
+    rows = [dict({field: row.get(field) for field in partitions.FIELDS}, created_at=row.get("created_at") or now)
+            for row in rows]
+    _write_rows(db, rows)
+    # La séquence reste au-delà des identifiants importés
+    _ensure_sequence(db)
+    high = max(row["id"] for row in rows)
+    sequence = models.ContactSequence
+    db.query(sequence).filter(sequence.id == 1, sequence.next_id <= high).update(
+        {sequence.next_id: high + 1}, synchronize_session=False
+    )
+
+def export_contacts(db: Session):
+    # Partition par partition, archives comprises, dans l'ordre des identifiants de chaque mois
+    for partition in list_partitions(db):
+        sql = _select(partition, suffix=" ORDER BY id")
+        if partition.archive_path:
+            rows = partitions.iter_archive(partition.archive_path, sql, {})
+        else:
+            rows = db.execute(text(sql))
+        for row in rows:
+            yield partitions.to_record(row)._asdict()
+
+# --- Maintenance des partitions ---
+
+def migrate_legacy(db: Session, chunk_size: int = 5000) -> int:
+    """
+    Déplace les lignes de l'ancienne table contacts vers les partitions. À la première
+    migration les identifiants sont conservés ; ensuite (lignes écrites par un ancien
+    client) ils sont réattribués par la séquence pour éviter toute collision.
+    """
+    keep_ids = _ensure_sequence(db)
+    moved = 0
+    while True:
+        legacy = db.query(models.Contact).order_by(models.Contact.id).limit(chunk_size).all()
+        if not legacy:
+            break
+        first_id = None if keep_ids else _allocate_ids(db, len(legacy))
+        rows = [{
+            "id": contact.id if keep_ids else first_id + offset,
+            "name": contact.name,
+            "email": contact.email,
+            "message": contact.message,
+            "created_at": contact.created_at or datetime.utcnow(),
+            "ingest_id": contact.ingest_id,
+        } for offset, contact in enumerate(legacy)]
+        _write_rows(db, rows)
+        db.query(models.Contact).filter(models.Contact.id.in_([contact.id for contact in legacy])) \
+            .delete(synchronize_session=False)
+        db.commit()
+        moved += len(rows)
+    db.commit()
+    return moved
+
+def archive_partition(db: Session, month: str):
+    partition = db.query(Partition).get(month)
+    if partition is None or partition.archive_path:
+        return partition
+    table = partitions.partition_table(month)
+    rows = db.execute(text(_select(partition, suffix=" ORDER BY id")))
+    partition.archive_path = partitions.write_archive(month, rows)
+    partition.archived_at = datetime.utcnow()
+    table.drop(db.connection(), checkfirst=True)
+    outbox.record(db, models.OutboxEvent, "contact_partition", "archived", month, {"rows": partition.row_count})
+    db.commit()
+    partitions.forget_table(month)
+    return partition
+
+def drop_partition(db: Session, month: str):
+    """
+    Rétention : suppression d'un mois entier, sans DELETE ligne à ligne
+    """
+    partition = db.query(Partition).get(month)
+    if partition is None:
+        return None
+    path = partition.archive_path
+    if path is None:
+        partitions.partition_table(month).drop(db.connection(), checkfirst=True)
+    outbox.record(db, models.OutboxEvent, "contact_partition", "dropped", month, {"rows": partition.row_count})
+    # Les statistiques suivent les données conservées
+    rollup.remove_buckets(db, models.Rollup, CONTACTS_PER_DAY, month.replace("_", "-"))
+    db.delete(partition)
     db.commit()
-    db.refresh(db_contact)
-    return db_contact
+    partitions.forget_table(month)
+    if path:
+        partitions.remove_archive(path)
+    return partition
+
+def run_partition_maintenance(db: Session, now: datetime = None) -> dict:
+    now = now or datetime.utcnow()
+    current = datetime(now.year, now.month, 1)
+    report = {"migrated": migrate_legacy(db), "archived": [], "dropped": []}
+
+    if partitions.RETENTION_MONTHS:
+        cutoff = partitions.add_months(current, -(partitions.RETENTION_MONTHS - 1))
+        for partition in list_partitions(db, created_before=cutoff):
+            if partition.ends_at <= cutoff:
+                drop_partition(db, partition.month)
+                report["dropped"].append(partition.month)
+
+    if partitions.ARCHIVE_AFTER_MONTHS:
+        cutoff = partitions.add_months(current, -partitions.ARCHIVE_AFTER_MONTHS)
+        for partition in list_partitions(db, created_before=cutoff):
+            if partition.ends_at <= cutoff and not partition.archive_path:
+                archive_partition(db, partition.month)
+                report["archived"].append(partition.month)
+
+    report["evicted"] = partitions.evict_cache()
+    return report
+
+def rebuild_rollups(db: Session):
+    # Une requête GROUP BY par partition, archives comprises
+    counts = defaultdict(int)
+    for partition in list_partitions(db):
+        sql = f"SELECT substr(created_at, 1, 10), COUNT(*) FROM {partitions.table_name(partition.month)} GROUP BY 1"
+        for day, count in _execute(db, partition, sql, {}):
+            counts[day] += count
+    rollup.rebuild(db, models.Rollup, CONTACTS_PER_DAY, counts)
+    return {CONTACTS_PER_DAY: sum(counts.values())}
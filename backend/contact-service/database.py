@@ -2,10 +2,11 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
-from dotenv import load_dotenv
 
-# Charger les variables d'environnement
-load_dotenv()
+from shared import config
+
+# Charger les variables d'environnement (une seule fois par processus)
+config.load_env()
 
 # Configuration de la base de données SQLite
 SQLALCHEMY_DATABASE_URL = os.getenv(
@@ -0,0 +1,246 @@
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+
+from database import SessionLocal
+import crud
+from shared import config
+
+logger = logging.getLogger("contact-service.ingest")
+
+# Configuration du journal d'ingestion
+LOG_DIR = os.getenv("CONTACT_LOG_DIR") or config.data_dir(__file__, "contact_log")
+BATCH_SIZE = int(os.getenv("CONTACT_BATCH_SIZE", "500"))
+FLUSH_INTERVAL = float(os.getenv("CONTACT_FLUSH_INTERVAL", "0.05"))
+MAX_PENDING = int(os.getenv("CONTACT_MAX_PENDING", "10000"))
+COMPACT_BYTES = int(os.getenv("CONTACT_LOG_COMPACT_BYTES", str(16 * 1024 * 1024)))
+FSYNC = os.getenv("CONTACT_LOG_FSYNC", "1") == "1"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class ContactIngestQueue:
+    """
+    Journal local en ajout seul : chaque message est écrit sur disque puis acquitté,
+    un thread d'écriture l'insère ensuite en base par lots dans une seule transaction.
+
+    Un journal par processus (workers uvicorn) : chacun réserve au démarrage un
+    emplacement libre (verrou flock, relâché à sa mort) et reprend le journal
+    de cet emplacement ; les journaux d'emplacements abandonnés sont vidés en base.
+    """
+
+    def __init__(self, log_dir: str = LOG_DIR, session_factory=SessionLocal,
+                 batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL,
+                 max_pending: int = MAX_PENDING, fsync: bool = FSYNC):
+        self.log_dir = log_dir
+        self.log_path = self.checkpoint_path = None
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.fsync = fsync
+
+        os.makedirs(log_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        # File des entrées non encore en base : (entrée, offset de fin dans le journal)
+        self._pending = deque()
+        self._stopping = False
+        self._thread = None
+        self._log = None
+        self._slot_lock = None
+        self.flushed = 0
+
+    # --- Emplacements, journal et point de reprise ---
+
+    def _slot_paths(self, slot: int):
+        # L'emplacement 0 garde les noms d'origine (journal d'un processus unique)
+        base = os.path.join(self.log_dir, "contacts" if slot == 0 else f"contacts.{slot}")
+        return base + ".log", base + ".checkpoint", base + ".lock"
+
+    def _lock_slot(self, slot: int):
+        lock = open(self._slot_paths(slot)[2], "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return None
+        return lock
+
+    def _acquire_slot(self):
+        slot = 0
+        while True:
+            lock = self._lock_slot(slot)
+            if lock is not None:
+                return slot, lock
+            slot += 1
+
+    def _read_checkpoint(self, checkpoint_path: str) -> int:
+        try:
+            with open(checkpoint_path) as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_checkpoint(self, offset: int, checkpoint_path: str = None):
+        checkpoint_path = checkpoint_path or self.checkpoint_path
+        tmp_path = checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, checkpoint_path)
+
+    def _read_log(self, log_path: str, checkpoint_path: str) -> list:
+        """
+        Entrées écrites après le dernier point de reprise : [(entrée, offset de fin)]
+        """
+        offset = self._read_checkpoint(checkpoint_path)
+        entries = []
+        with open(log_path, "ab+") as log:
+            log.seek(offset)
+            for line in iter(log.readline, b""):
+                if not line.endswith(b"\n"):
+                    # Ligne incomplète : écriture interrompue par le crash, jamais acquittée
+                    log.truncate(offset)
+                    break
+                offset += len(line)
+                entries.append((json.loads(line), offset))
+        return entries
+
+    def _replay(self):
+        """
+        Relit les entrées écrites après le dernier point de reprise (redémarrage après crash)
+        """
+        self._pending.extend(self._read_log(self.log_path, self.checkpoint_path))
+        if self._pending:
+            logger.info("%d message(s) de contact rejoué(s) depuis le journal", len(self._pending))
+
+    def _drain_abandoned(self):
+        """
+        Journaux d'emplacements sans processus (moins de workers qu'avant) : écrits en base puis vidés
+        """
+        for log_path in glob.glob(os.path.join(self.log_dir, "contacts*.log")):
+            name = os.path.basename(log_path)[len("contacts"):-len(".log")]
+            if log_path == self.log_path or not (name == "" or name[1:].isdigit()):
+                continue
+            slot = int(name[1:]) if name else 0
+            lock = self._lock_slot(slot)
+            if lock is None:
+                continue
+            try:
+                _, checkpoint_path, _ = self._slot_paths(slot)
+                entries = self._read_log(log_path, checkpoint_path)
+                for start in range(0, len(entries), self.batch_size):
+                    self._flush_entries([entry for entry, _ in entries[start:start + self.batch_size]])
+                if entries:
+                    logger.info("%d message(s) de contact repris du journal abandonné %s", len(entries), name or "0")
+                # Point de reprise d'abord : un arrêt entre les deux rejoue, sans perte
+                self._write_checkpoint(0, checkpoint_path)
+                with open(log_path, "ab") as log:
+                    log.truncate(0)
+            except Exception:
+                logger.exception("Reprise du journal abandonné %s impossible", log_path)
+            finally:
+                lock.close()
+
+    # --- API publique ---
+
+    def start(self):
+        slot, self._slot_lock = self._acquire_slot()
+        self.log_path, self.checkpoint_path, _ = self._slot_paths(slot)
+        self._replay()
+        self._drain_abandoned()
+        self._log = open(self.log_path, "ab")
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="contact-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopping = True
+            self._not_empty.notify()
+        if self._thread:
+            self._thread.join()
+        if self._log:
+            self._log.close()
+            self._log = None
+        if self._slot_lock:
+            self._slot_lock.close()
+            self._slot_lock = None
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def submit(self, contact: dict) -> str:
+        entry = dict(contact)
+        entry["ingest_id"] = uuid.uuid4().hex
+        entry["created_at"] = datetime.utcnow().isoformat()
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                raise QueueFullError()
+            self._log.write(line)
+            self._log.flush()
+            if self.fsync:
+                os.fsync(self._log.fileno())
+            self._pending.append((entry, self._log.tell()))
+            if len(self._pending) >= self.batch_size:
+                self._not_empty.notify()
+        return entry["ingest_id"]
+
+    # --- Thread d'écriture ---
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._pending and not self._stopping:
+                    self._not_empty.wait(self.flush_interval)
+                if not self._pending:
+                    if self._stopping:
+                        return
+                    continue
+                batch = [self._pending[i] for i in range(min(self.batch_size, len(self._pending)))]
+            try:
+                self._flush(batch)
+            except Exception:
+                logger.exception("Échec de l'écriture d'un lot de contacts, nouvel essai")
+                with self._lock:
+                    if self._stopping:
+                        return
+                    self._not_empty.wait(1.0)
+
+    def _flush_entries(self, entries: list):
+        db = self.session_factory()
+        try:
+            for entry in entries:
+                if isinstance(entry["created_at"], str):
+                    entry["created_at"] = datetime.fromisoformat(entry["created_at"])
+            crud.create_contacts_batch(db, entries)
+        finally:
+            db.close()
+
+    def _flush(self, batch):
+        self._flush_entries([entry for entry, _ in batch])
+
+        end_offset = batch[-1][1]
+        self._write_checkpoint(end_offset)
+        with self._lock:
+            for _ in batch:
+                self._pending.popleft()
+            self.flushed += len(batch)
+            # Journal entièrement appliqué : on le tronque pour borner sa taille. Point de
+            # reprise d'abord : un arrêt entre les deux rejoue des entrées déjà en base (ignorées)
+            if not self._pending and end_offset >= COMPACT_BYTES and self._log.tell() == end_offset:
+                self._write_checkpoint(0)
+                self._log.truncate(0)
+                self._log.seek(0)
@@ -1,19 +1,23 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 import os
-from dotenv import load_dotenv
+import sys
+
+# Rendre le paquet backend/shared importable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database import SessionLocal, engine
 import models
 import schemas
 import crud
-
-# Charger les variables d'environnement
-load_dotenv()
+import ingest
+from shared import admission, authz, conditional, jobs, looplag, metrics, multiget, outbox, profiler, rollup, sparse, sqlprofile, tracing
 
 # Créer les tables
 models.Base.metadata.create_all(bind=engine)
+models.upgrade_schema(engine)
 
 app = FastAPI(
     title="Contact Service",
@@ -21,6 +25,57 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Profilage SQL par requête : en-tête Server-Timing, métriques et détection des N+1
+sqlprofile.instrument_engine(engine)
+tracing.instrument_engine(engine)
+app.add_middleware(sqlprofile.SQLProfilingMiddleware, service="contact")
+metrics.install(app)
+# Profilage à la demande (permission debug_profile)
+profiler.install(app, "contact")
+# Retard de la boucle asyncio et détection des appels bloquants
+looplag.install(app, "contact")
+
+# Contrôle d'admission : compartiments par route, délestage en 503 + Retry-After
+app.add_middleware(admission.AdmissionMiddleware, service="contact", routes=[
+    # Dépôts de messages séparés des lectures du back-office
+    ("POST", "/contacts", "submit"),
+], limits={"submit": 64})
+
+# Traçage distribué : ajouté en dernier, le span serveur couvre toute la requête
+app.add_middleware(tracing.TracingMiddleware, service="contact")
+
+# File d'ingestion des messages : journal local puis écriture en base par lots
+contact_queue = ingest.ContactIngestQueue()
+
+@app.on_event("startup")
+def maintain_partitions():
+    # Migration de l'ancienne table, archivage des mois froids, rétention et cache ; ensuite périodique (tâche de fond)
+    db = SessionLocal()
+    try:
+        crud.run_partition_maintenance(db)
+        crud.schedule_partition_maintenance(db)
+        db.commit()
+    finally:
+        db.close()
+
+@app.on_event("startup")
+def start_ingest_queue():
+    contact_queue.start()
+
+@app.on_event("shutdown")
+def stop_ingest_queue():
+    contact_queue.stop()
+
+# Flux des événements de changement (outbox) pour l'invalidation des caches
+event_stream = outbox.EventStream("contact", models.OutboxEvent, SessionLocal)
+outbox.install(app, event_stream)
+
+# Lectures unitaires concurrentes regroupées en une requête IN
+contact_loader = multiget.Batcher("contacts", SessionLocal, crud.get_contacts_by_ids)
+
+# Tâches de fond (notification par e-mail des nouveaux messages, recalculs), exécutées hors des requêtes
+jobs.install(app, crud.JOBS, SessionLocal)
+
 # Dépendance pour obtenir la session de base de données
 def get_db():
     db = SessionLocal()
@@ -30,17 +85,92 @@ def get_db():
         db.close()
 
 @app.get("/contacts", response_model=List[schemas.Contact])
-def read_contacts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    contacts = crud.get_contacts(db, skip=skip, limit=limit)
+def read_contacts(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    ids: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Liste paginée, ou ?ids=3,1,7 : contacts demandés dans cet ordre (filtres ignorés),
+    absents dans X-Missing-Ids
+    """
+    selected = sparse.parse(fields, crud.FIELDS)
+    count, last_id = crud.get_contacts_version(db)
+    etag = conditional.make_etag("contacts", count, last_id, conditional.query_key(request))
+    cached = conditional.not_modified(request, response, etag)
+    if cached is not None:
+        return cached
+    if ids is not None:
+        requested = multiget.parse_ids(ids)
+        contacts = multiget.ordered(crud.get_contacts_by_ids(db, requested, fields=selected), requested, response)
+    else:
+        # Seules les partitions mensuelles qui recoupent l'intervalle sont lues
+        contacts = crud.get_contacts(
+            db, skip=skip, limit=limit, created_after=created_after, created_before=created_before, fields=selected
+        )
+    if selected:
+        return sparse.response([sparse.project(contact, selected) for contact in contacts], response)
     return contacts
 
+@app.post("/contacts", response_model=schemas.ContactAccepted, status_code=status.HTTP_202_ACCEPTED)
+def create_contact(contact: schemas.ContactCreate):
+    try:
+        ingest_id = contact_queue.submit(contact.dict())
+    except ingest.QueueFullError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Trop de messages en attente, réessayez plus tard",
+            headers={"Retry-After": "1"},
+        )
+    return {"id": ingest_id, "status": "accepted"}
+
 @app.get("/contacts/{contact_id}", response_model=schemas.Contact)
-def read_contact(contact_id: int, db: Session = Depends(get_db)):
-    db_contact = crud.get_contact(db, contact_id=contact_id)
+async def read_contact(
+    contact_id: int,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = None
+):
+    selected = sparse.parse(fields, crud.FIELDS)
+    db_contact = await contact_loader.load(contact_id)
     if db_contact is None:
         raise HTTPException(status_code=404, detail="Contact non trouvé")
+    etag = conditional.make_etag("contact", db_contact.id, db_contact.created_at, fields)
+    cached = conditional.not_modified(request, response, etag, db_contact.created_at)
+    if cached is not None:
+        return cached
+    if selected:
+        return sparse.response(sparse.project(db_contact, selected), response)
     return db_contact
 
+@app.get("/stats/contacts-per-day", response_model=rollup.StatSeries)
+def read_contact_stats(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    db: Session = Depends(get_db),
+    access: dict = Depends(authz.require_permission("view_contacts"))
+):
+    """
+    Messages reçus par jour (AAAA-MM-JJ) ; since/until acceptent aussi un mois (AAAA-MM)
+    """
+    return crud.get_contact_stats(db, since=since, until=until)
+
+@app.post("/stats/rebuild", response_model=jobs.JobStatus, status_code=202)
+def rebuild_stats(db: Session = Depends(get_db), access: dict = Depends(authz.require_permission("manage_contacts"))):
+    """
+    Recalcule les statistiques depuis les données, en tâche de fond (suivi : GET /jobs/{id})
+    """
+    job = crud.JOBS.enqueue(db, "rebuild_rollups", coalesce=True)
+    db.commit()
+    db.refresh(job)
+    return job
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8004)
+    uvicorn.run(app, host="0.0.0.0", port=8005)
@@ -1,10 +1,23 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy import Column, Integer, String, Text, DateTime, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 
+from shared import jobs, outbox, rollup
+
 Base = declarative_base()
 
+# Événements de changement, écrits dans la même transaction que les données
+OutboxEvent = outbox.declare_outbox(Base)
+# Compteurs agrégés des statistiques, eux aussi mis à jour dans la transaction d'écriture
+Rollup = rollup.declare_rollup(Base)
+# Tâches de fond (notification des nouveaux messages, recalculs), validées avec l'écriture
+Job = jobs.declare_jobs(Base)
+
 class Contact(Base):
+    """
+    Table historique non partitionnée : ses lignes sont déplacées vers les
+    partitions mensuelles au démarrage (voir partitions.migrate_legacy)
+    """
     __tablename__ = "contacts"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -12,3 +25,43 @@ class Contact(Base):
     email = Column(String, index=True, nullable=False)
     message = Column(Text, nullable=False)
     created_at = Column(DateTime, default=func.now())
+    # Identifiant attribué à la réception, avant l'écriture en base
+    ingest_id = Column(String, unique=True, index=True, nullable=True)
+
+class ContactPartition(Base):
+    """
+    Catalogue des partitions mensuelles contacts_AAAA_MM : bornes, volume et plage
+    d'identifiants servent au routage sans ouvrir les partitions
+    """
+    __tablename__ = "contact_partitions"
+
+    month = Column(String, primary_key=True)  # "2024_05"
+    starts_at = Column(DateTime, nullable=False)
+    ends_at = Column(DateTime, nullable=False)
+    row_count = Column(Integer, nullable=False, default=0)
+    min_id = Column(Integer, nullable=True)
+    max_id = Column(Integer, nullable=True)
+    # Renseignés une fois la partition archivée (fichier compressé en lecture seule)
+    archive_path = Column(String, nullable=True)
+    archived_at = Column(DateTime, nullable=True)
+
+class ContactSequence(Base):
+    """
+    Séquence d'identifiants commune à toutes les partitions
+    """
+    __tablename__ = "contact_id_sequence"
+
+    id = Column(Integer, primary_key=True)
+    next_id = Column(Integer, nullable=False)
+
+
+def upgrade_schema(engine):
+    """
+    create_all ne modifie pas une table existante : ajoute ingest_id aux bases
+    créées avant son introduction (les lignes existantes restent à NULL)
+    """
+    columns = {column["name"] for column in inspect(engine).get_columns(Contact.__tablename__)}
+    if "ingest_id" not in columns:
+        with engine.begin() as connection:
+            connection.execute(text("ALTER TABLE contacts ADD COLUMN ingest_id VARCHAR"))
+            connection.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_contacts_ingest_id ON contacts (ingest_id)"))
@@ -0,0 +1,43 @@
+import os
+import smtplib
+from email.message import EmailMessage
+
+from shared import config
+
+config.load_env()
+
+# Notification de chaque nouveau message ; désactivée sans SMTP_HOST (docker-compose : mailhog)
+SMTP_HOST = os.getenv("SMTP_HOST")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "1025"))
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASS = os.getenv("SMTP_PASS")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "10"))
+NOTIFY_TO = os.getenv("CONTACT_NOTIFY_TO", "contact@mindgraphix.local")
+NOTIFY_FROM = os.getenv("CONTACT_NOTIFY_FROM", "noreply@mindgraphix.local")
+
+ENABLED = bool(SMTP_HOST and NOTIFY_TO)
+
+
+def build_message(contact: dict) -> EmailMessage:
+    message = EmailMessage()
+    message["Subject"] = f"Nouveau message de contact : {contact['name']}"
+    message["From"] = NOTIFY_FROM
+    message["To"] = NOTIFY_TO
+    message["Reply-To"] = contact["email"]
+    # Identifiant stable : un nouvel essai après coupure reste reconnaissable côté serveur
+    message["Message-ID"] = f"<contact-{contact['ingest_id'] or contact['id']}@mindgraphix.local>"
+    message.set_content(
+        f"{contact['name']} <{contact['email']}> a écrit le {contact['created_at']} :\n\n{contact['message']}\n"
+    )
+    return message
+
+
+def send_contact_notification(db, contact: dict):
+    """
+    Tâche de fond : envoie la notification d'un message de contact
+    """
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT) as smtp:
+        if SMTP_USER:
+            smtp.starttls()
+            smtp.login(SMTP_USER, SMTP_PASS or "")
+        smtp.send_message(build_message(contact))
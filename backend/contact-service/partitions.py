@@ -0,0 +1,291 @@
+"""
+Partitionnement mensuel des messages de contact.
+
+Chaque mois a sa table contacts_AAAA_MM (mêmes colonnes, index propres) ; le
+catalogue contact_partitions en garde les bornes, le volume et la plage
+d'identifiants pour que crud.py n'interroge que les partitions utiles.
+Les mois froids sont archivés dans un fichier SQLite compressé (gzip) en
+lecture seule, toujours interrogeable ; la rétention supprime des partitions
+entières. Les copies décompressées des archives (.cache) sont évincées après
+CONTACT_ARCHIVE_CACHE_IDLE secondes sans lecture ou au-delà de
+CONTACT_ARCHIVE_CACHE_MB.
+
+    python partitions.py list
+    python partitions.py maintain            # migration, archivage, rétention et cache
+    python partitions.py archive 2024_01
+"""
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, Text
+
+# Même emplacement que config.data_dir (shared n'est pas importable avant main() en ligne de commande)
+ARCHIVE_DIR = os.getenv("CONTACT_ARCHIVE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "contact_archive")
+# Mois complets conservés en table avant archivage (0 : pas d'archivage)
+ARCHIVE_AFTER_MONTHS = int(os.getenv("CONTACT_ARCHIVE_AFTER_MONTHS", "6"))
+# Mois conservés au total, archives comprises (0 : conservation illimitée)
+RETENTION_MONTHS = int(os.getenv("CONTACT_RETENTION_MONTHS", "0"))
+# Copies décompressées des archives : taille totale et inactivité maximales
+ARCHIVE_CACHE_MAX_BYTES = int(os.getenv("CONTACT_ARCHIVE_CACHE_MB", "512")) * 1024 * 1024
+ARCHIVE_CACHE_IDLE = float(os.getenv("CONTACT_ARCHIVE_CACHE_IDLE", "3600"))
+# Une copie lue il y a moins longtemps peut être en cours d'ouverture par un autre processus
+ARCHIVE_CACHE_MIN_AGE = 60
+
+FIELDS = ("id", "name", "email", "message", "created_at", "ingest_id")
+# Les champs non sélectionnés (?fields=) restent à None
+ContactRecord = namedtuple("ContactRecord", FIELDS, defaults=(None,) * len(FIELDS))
+
+_metadata = MetaData()
+_tables = {}
+_tables_lock = threading.Lock()
+_archive_lock = threading.Lock()
+
+
+# --- Mois ---
+
+def month_key(moment: datetime) -> str:
+    return f"{moment.year:04d}_{moment.month:02d}"
+
+
+def month_start(key: str) -> datetime:
+    year, month = key.split("_")
+    return datetime(int(year), int(month), 1)
+
+
+def add_months(moment: datetime, months: int) -> datetime:
+    index = moment.year * 12 + moment.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def table_name(key: str) -> str:
+    return f"contacts_{key}"
+
+
+# --- Tables de partition ---
+
+def partition_table(key: str) -> Table:
+    with _tables_lock:
+        table = _tables.get(key)
+        if table is None:
+            name = table_name(key)
+            table = _tables[key] = Table(
+                name, _metadata,
+                # Identifiant attribué par la séquence commune, pas par la partition
+                Column("id", Integer, primary_key=True, autoincrement=False),
+                Column("name", String, nullable=False),
+                Column("email", String, nullable=False),
+                Column("message", Text, nullable=False),
+                Column("created_at", DateTime, nullable=False),
+                Column("ingest_id", String, nullable=True),
+                Index(f"ix_{name}_name", "name"),
+                Index(f"ix_{name}_email", "email"),
+                Index(f"ix_{name}_created_at", "created_at"),
+                Index(f"ix_{name}_ingest_id", "ingest_id", unique=True),
+            )
+    return table
+
+
+def forget_table(key: str):
+    with _tables_lock:
+        table = _tables.pop(key, None)
+        if table is not None:
+            _metadata.remove(table)
+
+
+# --- Requêtes communes aux partitions en table et aux archives ---
+
+def sql_datetime(moment: datetime) -> str:
+    # Format de stockage des DateTime SQLAlchemy sous SQLite : comparable comme texte
+    return moment.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def range_filter(created_after: datetime = None, created_before: datetime = None):
+    """
+    Clause WHERE sur created_at, valable en SQLAlchemy text() comme en sqlite3
+    """
+    clauses, params = [], {}
+    if created_after is not None:
+        clauses.append("created_at >= :created_after")
+        params["created_after"] = sql_datetime(created_after)
+    if created_before is not None:
+        clauses.append("created_at < :created_before")
+        params["created_before"] = sql_datetime(created_before)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def to_record(row, columns=FIELDS) -> ContactRecord:
+    values = dict(zip(columns, row))
+    if isinstance(values.get("created_at"), str):
+        values["created_at"] = datetime.fromisoformat(values["created_at"])
+    return ContactRecord(**values)
+
+
+# --- Archives ---
+
+def archive_path(key: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f"{table_name(key)}.db.gz")
+
+
+def write_archive(key: str, rows) -> str:
+    """
+    Écrit les lignes d'une partition dans une base SQLite autonome compressée,
+    en lecture seule. Les lignes sont des tuples dans l'ordre de FIELDS.
+    """
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    # Chemin absolu : le catalogue reste valable quel que soit le répertoire courant
+    path = os.path.abspath(archive_path(key))
+    name = table_name(key)
+    raw = f"{path}.tmp.db"
+    if os.path.exists(raw):
+        os.remove(raw)
+    conn = sqlite3.connect(raw)
+    try:
+        conn.execute(
+            f"CREATE TABLE {name} (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, email VARCHAR NOT NULL, "
+            f"message TEXT NOT NULL, created_at DATETIME NOT NULL, ingest_id VARCHAR)"
+        )
+        conn.executemany(f"INSERT INTO {name} VALUES (?, ?, ?, ?, ?, ?)", (
+            tuple(sql_datetime(v) if isinstance(v, datetime) else v for v in row) for row in rows
+        ))
+        conn.execute(f"CREATE INDEX ix_{name}_name ON {name} (name)")
+        conn.execute(f"CREATE INDEX ix_{name}_email ON {name} (email)")
+        conn.execute(f"CREATE INDEX ix_{name}_created_at ON {name} (created_at)")
+        # Dédoublonnage des ingestions rejouées après archivage
+        conn.execute(f"CREATE UNIQUE INDEX ix_{name}_ingest_id ON {name} (ingest_id)")
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+    compressed = f"{path}.tmp"
+    with open(raw, "rb") as source, gzip.open(compressed, "wb", compresslevel=9) as target:
+        shutil.copyfileobj(source, target)
+    os.remove(raw)
+    os.chmod(compressed, 0o444)
+    os.replace(compressed, path)
+    return path
+
+
+def _cached_copy(path: str) -> str:
+    """
+    Copie décompressée d'une archive, créée au premier accès puis réutilisée ;
+    sa date de modification sert de date de dernière lecture pour l'éviction
+    """
+    cache_dir = os.path.join(os.path.dirname(path), ".cache")
+    cached = os.path.join(cache_dir, os.path.basename(path)[:-len(".gz")])
+    with _archive_lock:
+        if not os.path.exists(cached) or os.path.getmtime(cached) < os.path.getmtime(path):
+            os.makedirs(cache_dir, exist_ok=True)
+            with gzip.open(path, "rb") as source, open(f"{cached}.tmp", "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.replace(f"{cached}.tmp", cached)
+            _evict(cache_dir, ARCHIVE_CACHE_MAX_BYTES, ARCHIVE_CACHE_IDLE)
+        else:
+            os.utime(cached)
+    return cached
+
+
+def _evict(cache_dir: str, max_bytes: int, max_idle: float) -> list:
+    now = time.time()
+    entries = []
+    for name in os.listdir(cache_dir) if os.path.isdir(cache_dir) else ():
+        candidate = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(candidate)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, candidate))
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    # Les moins récemment lues d'abord
+    for mtime, size, candidate in sorted(entries):
+        idle = now - mtime
+        if idle < ARCHIVE_CACHE_MIN_AGE or (idle < max_idle and total <= max_bytes):
+            break
+        try:
+            # Une lecture déjà ouverte garde le fichier jusqu'à sa fermeture
+            os.remove(candidate)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed.append(os.path.basename(candidate))
+    return removed
+
+
+def evict_cache(max_bytes: int = None, max_idle: float = None) -> list:
+    """
+    Supprime les copies décompressées inactives depuis max_idle secondes, puis les
+    moins récemment lues tant que le cache dépasse max_bytes ; renvoie leurs noms
+    """
+    max_bytes = ARCHIVE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_idle = ARCHIVE_CACHE_IDLE if max_idle is None else max_idle
+    with _archive_lock:
+        return _evict(os.path.join(ARCHIVE_DIR, ".cache"), max_bytes, max_idle)
+
+
+def query_archive(path: str, sql: str, params: dict):
+    # immutable=1 : aucun verrou ni journal, le fichier ne change plus
+    conn = sqlite3.connect(f"file:{_cached_copy(path)}?mode=ro&immutable=1", uri=True)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def iter_archive(path: str, sql: str, params: dict):
+    # Lecture en flux d'une archive (export) : le curseur reste ouvert jusqu'à la dernière ligne
+    conn = sqlite3.connect(f"file:{_cached_copy(path)}?mode=ro&immutable=1", uri=True)
+    try:
+        yield from conn.execute(sql, params)
+    finally:
+        conn.close()
+
+
+def remove_archive(path: str):
+    cached = os.path.join(os.path.dirname(path), ".cache", os.path.basename(path)[:-len(".gz")])
+    for candidate in (path, cached):
+        if os.path.exists(candidate):
+            os.remove(candidate)
+
+
+# --- Maintenance en ligne de commande ---
+
+def main(argv=None):
+    # Rendre le paquet backend/shared importable
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from database import SessionLocal, engine
+    import models
+    import crud
+
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else "list"
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if command == "maintain":
+            print(crud.run_partition_maintenance(db))
+        elif command == "archive" and len(argv) == 2:
+            crud.archive_partition(db, argv[1])
+        elif command == "drop" and len(argv) == 2:
+            crud.drop_partition(db, argv[1])
+        elif command == "list":
+            for partition in crud.list_partitions(db):
+                state = "archivée" if partition.archive_path else "en table"
+                print(f"{partition.month}  {partition.row_count:>10}  id {partition.min_id}-{partition.max_id}  {state}")
+        else:
+            print(__doc__)
+            return 2
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,3 +16,7 @@ class Contact(ContactBase):
 
     class Config:
         orm_mode = True
+
+class ContactAccepted(BaseModel):
+    id: str
+    status: str = "accepted"
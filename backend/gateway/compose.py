@@ -0,0 +1,103 @@
+import asyncio
+import base64
+import json
+import os
+
+import httpx
+
+from shared import admission
+
+# Délais maximum par partie de la vue composée (secondes)
+IDENTITY_TIMEOUT = float(os.getenv("COMPOSE_IDENTITY_TIMEOUT", "2.0"))
+ROLES_TIMEOUT = float(os.getenv("COMPOSE_ROLES_TIMEOUT", "1.0"))
+PROFILE_TIMEOUT = float(os.getenv("COMPOSE_PROFILE_TIMEOUT", "1.0"))
+
+
+class PartError(Exception):
+    def __init__(self, reason: str, status_code: int = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.status_code = status_code
+
+
+def unverified_claims(authorization: str) -> dict:
+    """
+    Lit les claims du JWT sans vérifier la signature.
+    Sert uniquement à lancer les appels en parallèle : l'identité renvoyée par
+    le service d'authentification reste la seule source de vérité.
+    """
+    try:
+        token = authorization.split(" ", 1)[1]
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))
+    except (IndexError, ValueError, AttributeError):
+        return {}
+
+
+async def fetch_part(client: httpx.AsyncClient, url: str, timeout: float, headers: dict = None):
+    try:
+        response = await asyncio.wait_for(client.get(url, headers=headers), timeout)
+    except asyncio.TimeoutError:
+        raise PartError("timeout")
+    except httpx.RequestError:
+        raise PartError("unavailable")
+    except admission.Overloaded:
+        # Compartiment du service amont plein : partie omise comme une indisponibilité
+        raise PartError("overloaded")
+    if response.status_code == 404:
+        return None
+    if response.status_code >= 400:
+        raise PartError("error", response.status_code)
+    return response.json()
+
+
+async def compose_user_view(client: httpx.AsyncClient, auth_url: str, user_url: str, authorization: str):
+    """
+    Identité, rôles et profil d'un utilisateur en un seul appel.
+    Les parties indépendantes sont récupérées en parallèle ; une partie lente ou
+    en erreur est omise et signalée dans "errors" plutôt que de bloquer la réponse.
+    """
+    headers = {"Authorization": authorization}
+    uid = unverified_claims(authorization).get("uid")
+
+    identity_task = asyncio.ensure_future(fetch_part(client, f"{auth_url}/users/me", IDENTITY_TIMEOUT, headers))
+    roles_task = asyncio.ensure_future(fetch_part(client, f"{auth_url}/users/me/roles", ROLES_TIMEOUT, headers))
+    profile_task = None
+    if uid is not None:
+        profile_task = asyncio.ensure_future(fetch_part(client, f"{user_url}/users/{uid}", PROFILE_TIMEOUT))
+
+    try:
+        identity = await identity_task
+    except PartError:
+        for task in (roles_task, profile_task):
+            if task:
+                task.cancel()
+        raise
+
+    # Ancien token sans "uid" : le profil dépend de l'identité, appel séquentiel
+    if profile_task is None or identity is None or identity["id"] != uid:
+        if profile_task:
+            profile_task.cancel()
+        profile_task = None
+        if identity is not None:
+            profile_task = asyncio.ensure_future(
+                fetch_part(client, f"{user_url}/users/{identity['id']}", PROFILE_TIMEOUT)
+            )
+
+    view = {"user": identity, "roles": [], "permissions": [], "profile": None, "errors": {}}
+    for name, task in (("roles", roles_task), ("profile", profile_task)):
+        if task is None:
+            continue
+        try:
+            result = await task
+        except PartError as exc:
+            view["errors"][name] = exc.reason
+            continue
+        if name == "roles" and result is not None:
+            view["roles"] = result["roles"]
+            view["permissions"] = result["permissions"]
+        elif name == "profile":
+            view["profile"] = result
+    view["partial"] = bool(view["errors"])
+    return view
@@ -1,11 +1,22 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 import httpx
 import os
-from dotenv import load_dotenv
+import sys
 
-# Charger les variables d'environnement
-load_dotenv()
+# Rendre le paquet backend/shared importable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared import config
+
+# Charger les variables d'environnement (une seule fois par processus), avant les
+# modules qui lisent leur configuration à l'import
+config.load_env()
+
+import compose
+import upstream
+from shared import admission, authz, looplag, metrics, profiler, tracing
 
 app = FastAPI(
     title="MindGraphix API Gateway",
@@ -13,6 +24,17 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Contrôle d'admission du gateway ; les flux SSE (/api/<service>/events), refusés par
+# proxy_request, ne prennent pas de créneau. Ajouté avant CORS : les réponses 503 gardent leurs en-têtes CORS
+app.add_middleware(admission.AdmissionMiddleware, service="gateway", routes=[
+    *[("GET", f"/api/{name}/events", None) for name in ("auth", "users", "projects", "services", "contact")],
+    # Connexions (bcrypt côté auth) : un afflux de logins ne retient pas les lectures
+    ("POST", "/api/auth/", "login"),
+    ("GET", "/api/auth/", "auth"),
+    ("GET", "/me", "auth"),
+    ("GET", "/search", "search"),
+], limits={"search": 16, "login": 8})
+
 # Configuration CORS
 app.add_middleware(
     CORSMiddleware,
@@ -20,8 +42,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Identifiants introuvables d'une lecture groupée (?ids=), trace de la requête échantillonnée
+    expose_headers=["X-Missing-Ids", tracing.TRACE_ID_HEADER],
 )
 
+# Traçage distribué : ajouté en dernier, le span serveur couvre toute la requête,
+# son contexte est propagé aux services (en-tête traceparent) ; l'échantillonnage
+# est décidé ici, pas par le client
+app.add_middleware(tracing.TracingMiddleware, service="gateway", edge=True)
+
+metrics.install(app)
+# Retard de la boucle asyncio ; démarré avant les services montés, il les couvre en monolithe
+looplag.install(app, "gateway")
+
 # URLs des services
 AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://localhost:8001")
 USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://localhost:8002")
@@ -29,32 +62,241 @@ PROJECT_SERVICE_URL = os.getenv("PROJECT_SERVICE_URL", "http://localhost:8003")
 SERVICE_SERVICE_URL = os.getenv("SERVICE_SERVICE_URL", "http://localhost:8004")
 CONTACT_SERVICE_URL = os.getenv("CONTACT_SERVICE_URL", "http://localhost:8005")
 
+# Mode monolithe : les services tournent dans ce processus, appelés en ASGI direct
+MONOLITH = os.getenv("GATEWAY_MODE", "distributed") == "monolith"
+# Monolithe : accès direct à toutes les routes des services, sur 127.0.0.1 uniquement (0 : désactivé)
+INTERNAL_PORT = int(os.getenv("GATEWAY_INTERNAL_PORT", "0"))
+service_apps = {}
+internal_server = None
+if MONOLITH:
+    import monolith
+    service_apps = monolith.load_services()
+    AUTH_SERVICE_URL = monolith.internal_url("auth")
+    USER_SERVICE_URL = monolith.internal_url("users")
+    PROJECT_SERVICE_URL = monolith.internal_url("projects")
+    SERVICE_SERVICE_URL = monolith.internal_url("services")
+    CONTACT_SERVICE_URL = monolith.internal_url("contact")
+
+UPSTREAM_URLS = {
+    "auth": AUTH_SERVICE_URL,
+    "users": USER_SERVICE_URL,
+    "projects": PROJECT_SERVICE_URL,
+    "services": SERVICE_SERVICE_URL,
+    "contact": CONTACT_SERVICE_URL
+}
+
+# Client HTTP partagé : les connexions vers les services sont réutilisées
+http_client: httpx.AsyncClient = None
+
+@app.on_event("startup")
+async def open_http_client():
+    global http_client, internal_server
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("GATEWAY_MAX_CONNECTIONS", "200")),
+        max_keepalive_connections=int(os.getenv("GATEWAY_MAX_KEEPALIVE", "50"))
+    )
+    http_client = httpx.AsyncClient(
+        limits=limits,
+        timeout=float(os.getenv("GATEWAY_UPSTREAM_TIMEOUT", "10")),
+        # Un compartiment par service amont, quel que soit le mode de déploiement
+        mounts=upstream.mounts(
+            UPSTREAM_URLS, monolith.transports(service_apps) if MONOLITH else None, limits
+        )
+    )
+    if MONOLITH:
+        await monolith.startup(service_apps)
+        if INTERNAL_PORT:
+            internal_server = await monolith.serve_internal(service_apps, INTERNAL_PORT)
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await http_client.aclose()
+    if internal_server is not None:
+        await monolith.stop_internal(internal_server)
+    if MONOLITH:
+        await monolith.shutdown(service_apps)
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "gateway"}
+    return {"status": "healthy", "service": "gateway", "mode": "monolith" if MONOLITH else "distributed"}
 
-@app.get("/api/{service}/{path:path}")
-async def proxy_request(service: str, path: str):
-    service_urls = {
-        "auth": AUTH_SERVICE_URL,
-        "users": USER_SERVICE_URL,
-        "projects": PROJECT_SERVICE_URL,
-        "services": SERVICE_SERVICE_URL,
-        "contact": CONTACT_SERVICE_URL
+async def fetch_access(authorization: str = Header(None)) -> dict:
+    """
+    Rôles et permissions du porteur du token, selon auth-service
+    """
+    if not authorization:
+        raise HTTPException(
+            status_code=401,
+            detail="Token manquant",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    try:
+        response = await http_client.get(f"{AUTH_SERVICE_URL}/users/me/roles", headers={"Authorization": authorization})
+    except httpx.RequestError:
+        raise HTTPException(status_code=503, detail="Service d'authentification indisponible")
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=response.status_code if response.status_code in (401, 404) else 502,
+            detail="Vérification du token impossible"
+        )
+    return response.json()
+
+async def require_profile_permission(authorization: str = Header(None)):
+    """
+    Permission debug_profile du porteur du token, vérifiée par auth-service
+    """
+    profiler.check_access(await fetch_access(authorization))
+
+# Profilage à la demande du gateway (en monolithe : de tout le processus)
+profiler.install(app, "gateway", dependency=require_profile_permission)
+# Services montés : permissions vérifiées par appel ASGI direct à auth-service
+for service_app in service_apps.values():
+    service_app.dependency_overrides[authz.current_access] = fetch_access
+
+# Services indexés pour la recherche plein texte
+SEARCH_TARGETS = {
+    "projects": PROJECT_SERVICE_URL,
+    "services": SERVICE_SERVICE_URL,
+    "users": USER_SERVICE_URL
+}
+# Fenêtre de fusion : chaque service renvoie au plus MAX_LIMIT résultats (shared.search),
+# une page de la recherche globale doit donc tenir dans les MAX_LIMIT premiers de chacun
+SEARCH_MAX_LIMIT = 50
+
+async def fetch_search_results(client: httpx.AsyncClient, url: str, q: str, limit: int):
+    try:
+        response = await client.get(f"{url}/search", params={"q": q, "skip": 0, "limit": limit})
+        response.raise_for_status()
+        return response.json()
+    except (httpx.RequestError, httpx.HTTPStatusError, admission.Overloaded):
+        # Service indisponible ou délesté : signalé dans "unavailable"
+        return None
+
+def normalize_scores(hits: list):
+    """
+    Scores bm25 d'index distincts, sans échelle commune : rapportés au meilleur score de leur source
+    """
+    best = max((hit["score"] for hit in hits), default=0)
+    for hit in hits:
+        hit["score"] = hit["score"] / best if best > 0 else 1.0
+    return hits
+
+@app.get("/search")
+async def search(q: str, skip: int = 0, limit: int = 20, types: str = None):
+    targets = list(SEARCH_TARGETS) if not types else [t for t in types.split(",") if t in SEARCH_TARGETS]
+    skip = max(0, skip)
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    if skip + limit > SEARCH_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"skip + limit ne peut dépasser {SEARCH_MAX_LIMIT}")
+
+    # Chaque service renvoie ses meilleurs résultats, fusionnés ici par score normalisé
+    pages = await asyncio.gather(*[
+        fetch_search_results(http_client, SEARCH_TARGETS[target], q, skip + limit)
+        for target in targets
+    ])
+
+    results = []
+    unavailable = []
+    has_more = False
+    for target, page in zip(targets, pages):
+        if page is None:
+            unavailable.append(target)
+            continue
+        results.extend(normalize_scores(page["results"]))
+        has_more = has_more or page.get("next_offset") is not None
+
+    results.sort(key=lambda hit: hit["score"], reverse=True)
+    has_more = has_more or len(results) > skip + limit
+    # Pas de page suivante annoncée au-delà de la fenêtre de fusion
+    next_offset = skip + limit if has_more and skip + 2 * limit <= SEARCH_MAX_LIMIT else None
+    return {
+        "query": q,
+        "results": results[skip:skip + limit],
+        "next_offset": next_offset,
+        "unavailable": unavailable
     }
-    
-    if service not in service_urls:
+
+@app.get("/me")
+async def read_user_view(authorization: str = Header(None)):
+    if not authorization:
+        raise HTTPException(
+            status_code=401,
+            detail="Token manquant",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    try:
+        view = await compose.compose_user_view(http_client, AUTH_SERVICE_URL, USER_SERVICE_URL, authorization)
+    except compose.PartError as exc:
+        if exc.status_code in (401, 403):
+            raise HTTPException(status_code=exc.status_code, detail="Token invalide")
+        if exc.reason == "timeout":
+            raise HTTPException(status_code=504, detail="Service d'authentification trop lent")
+        if exc.reason == "overloaded":
+            raise admission.Overloaded("auth", exc.reason)
+        raise HTTPException(status_code=502, detail="Service indisponible")
+    if view["user"] is None:
+        raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
+    return view
+
+# En-têtes de revalidation transmis au service, et validateurs renvoyés au client
+FORWARDED_REQUEST_HEADERS = ("authorization", "if-none-match", "if-modified-since", "content-type")
+FORWARDED_RESPONSE_HEADERS = (
+    "etag", "last-modified", "cache-control", "vary", "retry-after", "content-encoding", "x-missing-ids"
+)
+
+# Seules écritures relayées : connexion, rafraîchissement du token et inscription
+AUTH_POST_PATHS = ("token", "refresh", "register")
+
+@app.post("/api/auth/{path}")
+async def proxy_auth_request(path: str, request: Request):
+    if path not in AUTH_POST_PATHS:
+        raise HTTPException(status_code=404, detail="Route non trouvée")
+    return await relay(request, "auth", path, "POST", await request.body())
+
+@app.get("/api/{service}/{path:path}")
+async def proxy_request(service: str, path: str, request: Request):
+    if service not in UPSTREAM_URLS:
         raise HTTPException(status_code=404, detail="Service non trouvé")
+    if path.strip("/") == "events":
+        # Flux SSE sans fin : relayé, il retiendrait un créneau et une connexion par client
+        raise HTTPException(status_code=404, detail="Flux d'événements non relayé : GET /events du service")
+    return await relay(request, service, path, "GET")
+
+async def relay(request: Request, service: str, path: str, method: str, content: bytes = None):
+    target_url = f"{UPSTREAM_URLS[service]}/{path}"
+    if request.url.query:
+        target_url = f"{target_url}?{request.url.query}"
+    headers = {name: request.headers[name] for name in FORWARDED_REQUEST_HEADERS if name in request.headers}
+    # Encodages du client, pas ceux de httpx : un corps précompressé est relayé sans décompression
+    headers["accept-encoding"] = request.headers.get("accept-encoding", "identity")
     
-    target_url = f"{service_urls[service]}/{path}"
+    upstream_request = http_client.build_request(method, target_url, headers=headers, content=content)
+    if path == "debug/profile":
+        # Le profil répond après sa fenêtre d'échantillonnage, au-delà du délai habituel
+        seconds = request.query_params.get("seconds", "10")
+        read_timeout = float(seconds) + 10 if seconds.replace(".", "", 1).isdigit() else None
+        upstream_request.extensions["timeout"] = httpx.Timeout(http_client.timeout.connect, read=read_timeout).as_dict()
     
-    async with httpx.AsyncClient() as client:
+    try:
+        response = await http_client.send(upstream_request, stream=True)
         try:
-            response = await client.get(target_url)
-            return response.json()
-        except httpx.RequestError:
-            raise HTTPException(status_code=502, detail="Service indisponible")
+            content = b"".join([chunk async for chunk in response.aiter_raw()])
+        finally:
+            await response.aclose()
+    except httpx.RequestError:
+        raise HTTPException(status_code=502, detail="Service indisponible")
+
+    # Le corps est relayé tel quel (pas de décodage / ré-encodage JSON) ; un 304 reste un 304
+    relayed = {name: response.headers[name] for name in FORWARDED_RESPONSE_HEADERS if name in response.headers}
+    if response.status_code == 304:
+        return Response(status_code=304, headers=relayed)
+    return Response(
+        content=content,
+        status_code=response.status_code,
+        headers=relayed,
+        media_type=response.headers.get("content-type")
+    )
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,132 @@
+"""
+Mode monolithe : le gateway charge les applications FastAPI des cinq services
+dans son propre processus et leur transmet les requêtes par appel ASGI direct,
+sans passer par le réseau. Chaque service garde sa propre base de données.
+
+Le gateway public ne relaie que ses routes /api/... (lectures, connexion) :
+les services ne sont pas montés dessus. Un accès direct à toutes leurs routes
+(bancs de charge, tests) est servi à part, sur 127.0.0.1:GATEWAY_INTERNAL_PORT
+(désactivé par défaut), jamais sur le port public.
+"""
+import asyncio
+import contextlib
+import importlib
+import os
+import sys
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.routing import Mount
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# nom: (répertoire du service, préfixe des variables d'environnement)
+SERVICES = {
+    "auth": ("auth-service", "AUTH"),
+    "users": ("user-service", "USER"),
+    "projects": ("project-service", "PROJECT"),
+    "services": ("service-service", "SERVICE"),
+    "contact": ("contact-service", "CONTACT"),
+}
+
+
+def internal_url(name: str) -> str:
+    return f"http://{name}.internal"
+
+
+def _module_dir(module):
+    path = getattr(module, "__file__", None)
+    return os.path.dirname(os.path.abspath(path)) if path else None
+
+
+def load_service(name: str):
+    """
+    Importe main.py d'un service de façon isolée.
+    Les services utilisent tous des modules de premier niveau du même nom
+    (main, models, crud...) : ils sont renommés "<service>_service.<module>"
+    après l'import pour ne pas entrer en collision.
+    """
+    directory, env_prefix = SERVICES[name]
+    directory = os.path.join(BACKEND_DIR, directory)
+    # Modules homonymes déjà chargés (dont le main du gateway) mis de côté pendant l'import
+    local_modules = [filename[:-3] for filename in os.listdir(directory) if filename.endswith(".py")]
+    shadowed = {module_name: sys.modules.pop(module_name) for module_name in local_modules if module_name in sys.modules}
+    before = set(sys.modules)
+
+    # Base de données propre au service : <PREFIX>_DATABASE_URL, sinon le défaut du service
+    saved_database_url = os.environ.pop("DATABASE_URL", None)
+    if os.getenv(f"{env_prefix}_DATABASE_URL"):
+        os.environ["DATABASE_URL"] = os.environ[f"{env_prefix}_DATABASE_URL"]
+    sys.path.insert(0, directory)
+    try:
+        module = importlib.import_module("main")
+    finally:
+        sys.path.remove(directory)
+        os.environ.pop("DATABASE_URL", None)
+        if saved_database_url is not None:
+            os.environ["DATABASE_URL"] = saved_database_url
+        for module_name in set(sys.modules) - before:
+            loaded = sys.modules[module_name]
+            if _module_dir(loaded) == directory:
+                sys.modules[f"{name}_service.{module_name}"] = sys.modules.pop(module_name)
+        sys.modules.update(shadowed)
+    return module.app
+
+
+def load_services():
+    return {name: load_service(name) for name in SERVICES}
+
+
+def transports(apps: dict) -> dict:
+    """
+    Transports httpx appelant directement l'application de chaque service (nom -> transport)
+    """
+    return {name: httpx.ASGITransport(app=app) for name, app in apps.items()}
+
+
+async def startup(apps: dict):
+    # Ni ASGITransport ni Mount ne propagent le lifespan : on déclenche les hooks nous-mêmes
+    for app in apps.values():
+        await app.router.startup()
+
+
+async def shutdown(apps: dict):
+    for app in apps.values():
+        await app.router.shutdown()
+
+
+# --- Accès direct interne ---
+
+class InternalServer(uvicorn.Server):
+    """
+    Serveur uvicorn lancé dans la boucle du gateway : les signaux restent au serveur public
+    """
+
+    def install_signal_handlers(self):
+        pass
+
+    @contextlib.contextmanager
+    def capture_signals(self):
+        yield
+
+
+async def serve_internal(apps: dict, port: int) -> InternalServer:
+    """
+    Sert chaque service sous /<nom> sur 127.0.0.1:port, dans ce processus ; arrêt : stop_internal()
+    """
+    app = Starlette(routes=[Mount(f"/{name}", app=service_app) for name, service_app in apps.items()])
+    server = InternalServer(uvicorn.Config(app, host="127.0.0.1", port=port, lifespan="off", log_level="warning"))
+    server.task = asyncio.ensure_future(server.serve())
+    while not server.started and not server.task.done():
+        await asyncio.sleep(0.01)
+    if server.task.done():
+        # Port occupé : l'erreur du serveur interne remonte au démarrage du gateway
+        server.task.result()
+        raise RuntimeError(f"Serveur interne arrêté au démarrage (port {port})")
+    return server
+
+
+async def stop_internal(server: InternalServer):
+    server.should_exit = True
+    await server.task
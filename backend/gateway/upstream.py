@@ -0,0 +1,130 @@
+"""
+Compartiments par service amont : chaque service appelé par le gateway a sa
+propre limite d'appels simultanés. Un service lent (auth sous une vague de
+logins) épuise son compartiment sans retenir les appels vers les autres.
+Chaque appel est aussi un span de la trace de la requête entrante.
+"""
+import os
+
+import httpx
+
+from shared import admission, tracing
+
+DEFAULT_LIMIT = int(os.getenv("GATEWAY_UPSTREAM_LIMIT", "64"))
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    # Le créneau est rendu à la fermeture du corps, pas à la réception des en-têtes
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+
+
+class BulkheadTransport(httpx.AsyncBaseTransport):
+    """
+    Transport httpx qui réserve un créneau du compartiment avant chaque appel,
+    avec la priorité de la requête entrante
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, bulkhead: admission.Bulkhead):
+        self.transport = transport
+        self.bulkhead = bulkhead
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await self.bulkhead.acquire(admission.current_priority())
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self.bulkhead.release()
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(response.stream, self.bulkhead.release),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """
+    Transport httpx qui ouvre un span client par appel et propage son contexte
+    (en-tête traceparent) au service amont ; le span inclut l'attente du compartiment
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, name: str):
+        self.transport = transport
+        self.name = name
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        span = tracing.start_span(f"{request.method} {self.name}", tracing.CLIENT)
+        span.set(**{"http.method": request.method, "http.url": str(request.url), "peer.service": self.name})
+        request.headers["traceparent"] = span.traceparent
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException as exc:
+            span.error = True
+            span.set(**{"error.type": type(exc).__name__})
+            span.finish()
+            raise
+        span.set(**{"http.status_code": response.status_code})
+        span.error = response.status_code >= 500
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            # Le span se termine à la fin de la lecture du corps
+            stream=_ReleasingStream(response.stream, span.finish),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class _SharedTransport(httpx.AsyncBaseTransport):
+    # Pool de connexions commun à plusieurs montages : fermé une seule fois, par le dernier
+    def __init__(self, transport: httpx.AsyncBaseTransport, users: int):
+        self.transport = transport
+        self.users = users
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self):
+        self.users -= 1
+        if self.users == 0:
+            await self.transport.aclose()
+
+
+def mounts(urls: dict, transports: dict = None, limits: httpx.Limits = None) -> dict:
+    """
+    Montages httpx : un transport compartimenté par service amont.
+    urls : nom -> URL de base ; transports : nom -> transport existant (mode monolithe).
+    Les services sans transport propre partagent un seul pool de connexions :
+    limits borne le total, pas chaque service.
+    """
+    configured = admission.parse_limits(os.getenv("GATEWAY_UPSTREAM_LIMITS"), "gateway")
+    remote = [name for name in urls if name not in (transports or {})]
+    pool = _SharedTransport(httpx.AsyncHTTPTransport(limits=limits), len(remote)) if remote else None
+    result = {}
+    for name, url in urls.items():
+        parsed = httpx.URL(url)
+        pattern = f"all://{parsed.host}" + (f":{parsed.port}" if parsed.port else "")
+        transport = (transports or {}).get(name) or pool
+        bulkhead = admission.Bulkhead(name, configured.get(name, DEFAULT_LIMIT), service="gateway-upstream")
+        result[pattern] = TracingTransport(BulkheadTransport(transport, bulkhead), name)
+    return result
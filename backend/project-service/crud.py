@@ -1,15 +1,87 @@
+from datetime import datetime
+
+from sqlalchemy import String, cast, func
 from sqlalchemy.orm import Session
-from . import models, schemas
+import models
+import schemas
+from shared import cache, conditional, jobs, multiget, outbox, rollup, search, snapshot, sparse
+
+SEARCH_COLUMNS = ["title", "description"]
+# Champs exposés, sélectionnables avec ?fields=
+FIELDS = ("id", "title", "description", "created_at", "updated_at")
+PROJECTS_PER_MONTH = "projects_per_month"
+
+def _snapshot_payload(db: Session):
+    # Même représentation que GET /projects, liste complète triée par id
+    return [
+        {name: getattr(project, name) for name in FIELDS}
+        for project in db.query(models.Project).order_by(models.Project.id)
+    ]
+
+# Liste publique des projets, republiée après chaque écriture par une tâche de fond
+SNAPSHOT = snapshot.SnapshotStore("projects", _snapshot_payload)
+
+JOBS = jobs.JobQueue("project", models.Job)
+
+@JOBS.task("publish_snapshot", exclusive=True)
+def publish_snapshot(db: Session, payload: dict):
+    SNAPSHOT.publish(db)
+
+@JOBS.task("rebuild_rollups", exclusive=True)
+def rebuild_rollups_job(db: Session, payload: dict):
+    rebuild_rollups(db)
 
-def get_project(db: Session, project_id: int):
-    return db.query(models.Project).filter(models.Project.id == project_id).first()
+# Lectures par id mises en cache (hors ?fields=), invalidées à chaque écriture d'un projet
+projects_by_id = cache.Cache("projects", models.Project, topic="project")
 
-def get_projects(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Project).offset(skip).limit(limit).all()
+def _projects(db: Session, fields=None, extra=()):
+    query = db.query(models.Project)
+    if fields:
+        query = query.options(sparse.load_only(models.Project, fields, extra))
+    return query
+
+@projects_by_id.cached
+def get_project(db: Session, project_id: int, fields=None):
+    # updated_at sert à l'ETag du détail
+    return _projects(db, fields, extra=("updated_at",)).filter(models.Project.id == project_id).first()
+
+@projects_by_id.cached_many
+def get_projects_by_ids(db: Session, ids, fields=None):
+    # {id: projet} ; id et updated_at servent à l'ordre de la réponse et à l'ETag
+    return multiget.fetch(_projects(db, fields, extra=("id", "updated_at")), models.Project.id, ids)
+
+def get_projects(db: Session, skip: int = 0, limit: int = 100, fields=None):
+    return _projects(db, fields).offset(skip).limit(limit).all()
 
 def create_project(db: Session, project: schemas.ProjectCreate):
     db_project = models.Project(**project.dict())
     db.add(db_project)
+    db.flush()
+    outbox.record(db, models.OutboxEvent, "project", "created", db_project.id)
+    conditional.bump(db, models.CollectionVersion, "projects")
+    # created_at vaut func.now() (UTC) : le mois courant évite de relire la ligne
+    rollup.increment(db, models.Rollup, PROJECTS_PER_MONTH, datetime.utcnow().strftime("%Y-%m"))
+    # Écritures rapprochées : une seule republication en attente suffit
+    JOBS.enqueue(db, "publish_snapshot", coalesce=True)
     db.commit()
     db.refresh(db_project)
     return db_project
+
+def search_projects(db: Session, query: str, skip: int = 0, limit: int = 20):
+    return search.search(
+        db, "projects", SEARCH_COLUMNS, query, hit_type="project",
+        skip=skip, limit=limit
+    )
+
+def get_projects_version(db: Session):
+    # (version, dernière écriture) : incrémentée à chaque ajout, modification ou suppression
+    return conditional.collection_version(db, models.CollectionVersion, "projects")
+
+def get_project_stats(db: Session, since: str = None, until: str = None):
+    return rollup.series(db, models.Rollup, PROJECTS_PER_MONTH, since=since, until=until)
+
+def rebuild_rollups(db: Session):
+    month = func.substr(cast(models.Project.created_at, String), 1, 7)
+    counts = dict(db.query(month, func.count(models.Project.id)).group_by(month))
+    rollup.rebuild(db, models.Rollup, PROJECTS_PER_MONTH, counts)
+    return {PROJECTS_PER_MONTH: sum(counts.values())}
@@ -1,26 +1,61 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import os
-from dotenv import load_dotenv
+import sys
+
+# Rendre le paquet backend/shared importable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database import SessionLocal, engine
 import models
 import schemas
 import crud
-
-# Charger les variables d'environnement
-load_dotenv()
+from shared import admission, authz, cache, conditional, jobs, looplag, metrics, multiget, outbox, profiler, rollup, search, sparse, sqlprofile, tracing
 
 # Créer les tables
 models.Base.metadata.create_all(bind=engine)
 
+# Index plein texte mis à jour par triggers à chaque écriture
+search.ensure_fts_index(engine, "projects", crud.SEARCH_COLUMNS)
+
 app = FastAPI(
     title="Project Service",
     description="Service de gestion des projets pour MindGraphix",
     version="1.0.0"
 )
 
+# Profilage SQL par requête : en-tête Server-Timing, métriques et détection des N+1
+sqlprofile.instrument_engine(engine)
+tracing.instrument_engine(engine)
+app.add_middleware(sqlprofile.SQLProfilingMiddleware, service="project")
+metrics.install(app)
+# Profilage à la demande (permission debug_profile)
+profiler.install(app, "project")
+# Retard de la boucle asyncio et détection des appels bloquants
+looplag.install(app, "project")
+
+# Contrôle d'admission : compartiments par route, délestage en 503 + Retry-After
+app.add_middleware(admission.AdmissionMiddleware, service="project", routes=[
+    ("GET", "/search", "search"),
+    ("POST", "/", "write"),
+], limits={"search": 8, "write": 8})
+
+# Traçage distribué : ajouté en dernier, le span serveur couvre toute la requête
+app.add_middleware(tracing.TracingMiddleware, service="project")
+
+# Flux des événements de changement (outbox) pour l'invalidation des caches
+event_stream = outbox.EventStream("project", models.OutboxEvent, SessionLocal)
+outbox.install(app, event_stream)
+# Caches en mémoire invalidés par les écritures des autres processus
+cache.install(app, event_stream)
+
+# Lectures unitaires concurrentes regroupées en une requête IN
+project_loader = multiget.Batcher("projects", SessionLocal, crud.get_projects_by_ids)
+
+# Tâches de fond (republication de l'instantané, recalculs), exécutées hors des requêtes
+jobs.install(app, crud.JOBS, SessionLocal)
+
 # Dépendance pour obtenir la session de base de données
 def get_db():
     db = SessionLocal()
@@ -29,22 +64,99 @@ def get_db():
     finally:
         db.close()
 
+@app.on_event("startup")
+def publish_snapshot():
+    # Écritures faites pendant l'arrêt du service : l'instantané repart de la base
+    db = SessionLocal()
+    try:
+        crud.SNAPSHOT.publish(db)
+    finally:
+        db.close()
+
+@app.get("/projects/snapshot", response_model=List[schemas.Project])
+def read_projects_snapshot(request: Request, response: Response):
+    """
+    Liste complète des projets, servie depuis un fichier précompressé (gzip / brotli)
+    """
+    return crud.SNAPSHOT.response(request, response, SessionLocal)
+
 @app.get("/projects", response_model=List[schemas.Project])
-def read_projects(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    projects = crud.get_projects(db, skip=skip, limit=limit)
+def read_projects(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    ids: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Liste paginée, ou ?ids=3,1,7 : projets demandés dans cet ordre, absents dans X-Missing-Ids
+    """
+    selected = sparse.parse(fields, crud.FIELDS)
+    version, last_modified = crud.get_projects_version(db)
+    etag = conditional.make_etag("projects", version, conditional.query_key(request))
+    cached = conditional.not_modified(request, response, etag, last_modified)
+    if cached is not None:
+        return cached
+    if ids is not None:
+        requested = multiget.parse_ids(ids)
+        projects = multiget.ordered(crud.get_projects_by_ids(db, requested, fields=selected), requested, response)
+    else:
+        projects = crud.get_projects(db, skip=skip, limit=limit, fields=selected)
+    if selected:
+        return sparse.response([sparse.project(project, selected) for project in projects], response)
     return projects
 
 @app.get("/projects/{project_id}", response_model=schemas.Project)
-def read_project(project_id: int, db: Session = Depends(get_db)):
-    db_project = crud.get_project(db, project_id=project_id)
+async def read_project(
+    project_id: int,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = None
+):
+    selected = sparse.parse(fields, crud.FIELDS)
+    db_project = await project_loader.load(project_id)
     if db_project is None:
         raise HTTPException(status_code=404, detail="Projet non trouvé")
+    etag = conditional.make_etag("project", db_project.id, db_project.updated_at, fields)
+    cached = conditional.not_modified(request, response, etag, db_project.updated_at)
+    if cached is not None:
+        return cached
+    if selected:
+        return sparse.response(sparse.project(db_project, selected), response)
     return db_project
 
 @app.post("/projects", response_model=schemas.Project)
 def create_project(project: schemas.ProjectCreate, db: Session = Depends(get_db)):
     return crud.create_project(db=db, project=project)
 
+@app.get("/search", response_model=search.SearchPage)
+def search_projects(q: str, skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
+    return crud.search_projects(db, query=q, skip=skip, limit=limit)
+
+@app.get("/stats/projects-per-month", response_model=rollup.StatSeries)
+def read_project_stats(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    db: Session = Depends(get_db),
+    access: dict = Depends(authz.require_permission("view_projects"))
+):
+    """
+    Projets créés par mois (AAAA-MM)
+    """
+    return crud.get_project_stats(db, since=since, until=until)
+
+@app.post("/stats/rebuild", response_model=jobs.JobStatus, status_code=202)
+def rebuild_stats(db: Session = Depends(get_db), access: dict = Depends(authz.require_permission("manage_projects"))):
+    """
+    Recalcule les statistiques depuis les données, en tâche de fond (suivi : GET /jobs/{id})
+    """
+    job = crud.JOBS.enqueue(db, "rebuild_rollups", coalesce=True)
+    db.commit()
+    db.refresh(job)
+    return job
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8002)
+    uvicorn.run(app, host="0.0.0.0", port=8003)
@@ -1,9 +1,22 @@
+from datetime import datetime
+
 from sqlalchemy import Column, Integer, String, DateTime, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 
+from shared import conditional, jobs, outbox, rollup
+
 Base = declarative_base()
 
+# Événements de changement, écrits dans la même transaction que les données
+OutboxEvent = outbox.declare_outbox(Base)
+# Compteurs agrégés des statistiques, eux aussi mis à jour dans la transaction d'écriture
+Rollup = rollup.declare_rollup(Base)
+# Tâches de fond (republication de l'instantané, recalculs), validées avec l'écriture
+Job = jobs.declare_jobs(Base)
+# Version de chaque collection (ETag / Last-Modified des listes), suppressions comprises
+CollectionVersion = conditional.declare_versions(Base)
+
 class Project(Base):
     __tablename__ = "projects"
 
@@ -11,4 +24,5 @@ class Project(Base):
     title = Column(String, index=True, nullable=False)
     description = Column(Text, nullable=True)
     created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    # Horodatage côté Python : à la microseconde (sert à l'ETag du détail), func.now() de SQLite est à la seconde
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
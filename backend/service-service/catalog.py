@@ -0,0 +1,173 @@
+import bisect
+import hashlib
+import heapq
+import threading
+from typing import Dict, List, Optional
+
+import models
+from shared import conditional
+
+# Tranches de prix utilisées pour les facettes (bornes inférieures incluses)
+PRICE_BUCKETS = [0, 100, 500, 1000, 5000]
+NO_PRICE_BUCKET = "sans_prix"
+
+# Compteur de la table collection_versions incrémenté à chaque écriture sur services
+COLLECTION = "services"
+
+SORT_KEYS = {"id", "-id", "name", "-name", "price", "-price"}
+
+
+def price_bucket(price: Optional[float]) -> str:
+    if price is None:
+        return NO_PRICE_BUCKET
+    index = bisect.bisect_right(PRICE_BUCKETS, price) - 1
+    if index < 0:
+        return f"<{PRICE_BUCKETS[0]}"
+    if index == len(PRICE_BUCKETS) - 1:
+        return f"{PRICE_BUCKETS[-1]}+"
+    return f"{PRICE_BUCKETS[index]}-{PRICE_BUCKETS[index + 1]}"
+
+
+class CatalogSnapshot:
+    """
+    Copie en mémoire du catalogue, stockée par colonnes avec des index précalculés
+    """
+
+    def __init__(self, services, source_version: int = 0):
+        rows = sorted(services, key=lambda s: s.id)
+        # Version de la collection lue avant les lignes
+        self.source_version = source_version
+        self.ids = [s.id for s in rows]
+        self.names = [s.name for s in rows]
+        self.descriptions = [s.description for s in rows]
+        self.prices = [s.price for s in rows]
+        self.categories = [s.category for s in rows]
+        self.buckets = [price_bucket(p) for p in self.prices]
+
+        # Positions par catégorie, et positions triées par prix / par nom
+        self.by_category: Dict[str, List[int]] = {}
+        for pos, category in enumerate(self.categories):
+            self.by_category.setdefault(category, []).append(pos)
+        priced = [pos for pos, price in enumerate(self.prices) if price is not None]
+        self.price_order = sorted(priced, key=lambda pos: self.prices[pos])
+        self.sorted_prices = [self.prices[pos] for pos in self.price_order]
+        name_order = sorted(range(len(rows)), key=lambda pos: (self.names[pos].lower(), self.ids[pos]))
+        # Services sans prix en fin de liste dans les deux sens
+        unpriced = [pos for pos, price in enumerate(self.prices) if price is None]
+
+        # Ordre complet des positions et rang de chaque position, par clé de tri :
+        # une page est une tranche, ou les premiers rangs des seules positions retenues
+        self.orders = {
+            "id": list(range(len(rows))),
+            "-id": list(reversed(range(len(rows)))),
+            "name": name_order,
+            "-name": name_order[::-1],
+            "price": self.price_order + unpriced,
+            "-price": self.price_order[::-1] + unpriced,
+        }
+        self.ranks = {}
+        for key, order in self.orders.items():
+            rank = [0] * len(rows)
+            for index, pos in enumerate(order):
+                rank[pos] = index
+            self.ranks[key] = rank
+
+        # Version du contenu, calculée une fois par reconstruction (sert d'ETag)
+        digest = hashlib.sha1()
+        for pos in range(len(rows)):
+            digest.update(repr(tuple(self.row(pos).values())).encode("utf-8"))
+        self.version = digest.hexdigest()[:24]
+
+    def row(self, pos: int, fields: List[str] = None) -> dict:
+        if fields:
+            # Champs partiels : seules les colonnes demandées sont lues
+            columns = {
+                "id": self.ids, "name": self.names, "description": self.descriptions,
+                "price": self.prices, "category": self.categories,
+            }
+            return {name: columns[name][pos] for name in fields}
+        return {
+            "id": self.ids[pos],
+            "name": self.names[pos],
+            "description": self.descriptions[pos],
+            "price": self.prices[pos],
+            "category": self.categories[pos],
+        }
+
+    def _price_positions(self, min_price, max_price):
+        if min_price is None and max_price is None:
+            return None
+        lo = 0 if min_price is None else bisect.bisect_left(self.sorted_prices, min_price)
+        hi = len(self.sorted_prices) if max_price is None else bisect.bisect_right(self.sorted_prices, max_price)
+        return set(self.price_order[lo:hi])
+
+    def _category_positions(self, categories):
+        if not categories:
+            return None
+        positions = set()
+        for category in categories:
+            positions.update(self.by_category.get(category, ()))
+        return positions
+
+    def query(self, categories: List[str] = None, min_price: float = None, max_price: float = None,
+              sort: str = "id", skip: int = 0, limit: int = 100, with_facets: bool = False,
+              fields: List[str] = None) -> dict:
+        by_category = self._category_positions(categories)
+        by_price = self._price_positions(min_price, max_price)
+
+        if by_category is None and by_price is None:
+            matches = range(len(self.ids))
+        elif by_category is None:
+            matches = by_price
+        elif by_price is None:
+            matches = by_category
+        else:
+            matches = by_category & by_price
+
+        # Sans filtre, la page est une tranche de l'ordre précalculé ; sinon seules
+        # les positions retenues sont classées, jusqu'à la fin de la page
+        if isinstance(matches, range):
+            page = self.orders[sort][skip:skip + limit]
+        else:
+            page = heapq.nsmallest(skip + limit, matches, key=self.ranks[sort].__getitem__)[skip:]
+
+        result = {
+            "total": len(matches),
+            "items": [self.row(pos, fields) for pos in page],
+        }
+
+        if with_facets:
+            # Chaque facette ignore son propre filtre pour proposer les alternatives
+            category_counts: Dict[str, int] = {}
+            for pos in (range(len(self.ids)) if by_price is None else by_price):
+                category_counts[self.categories[pos]] = category_counts.get(self.categories[pos], 0) + 1
+            bucket_counts: Dict[str, int] = {}
+            for pos in (range(len(self.ids)) if by_category is None else by_category):
+                bucket_counts[self.buckets[pos]] = bucket_counts.get(self.buckets[pos], 0) + 1
+            result["facets"] = {"categories": category_counts, "price_buckets": bucket_counts}
+        return result
+
+
+_snapshot: Optional[CatalogSnapshot] = None
+_lock = threading.Lock()
+
+
+def get_snapshot(db) -> CatalogSnapshot:
+    """
+    Copie du catalogue, reconstruite quand la version partagée de la collection
+    a changé : les écritures de tous les processus sont vues dès leur validation
+    """
+    global _snapshot
+    version, _ = conditional.collection_version(db, models.CollectionVersion, COLLECTION)
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.source_version == version:
+        return snapshot
+    with _lock:
+        snapshot = _snapshot
+        if snapshot is None or snapshot.source_version != version:
+            # Version relue avant les lignes : une écriture concurrente donne au pire
+            # une copie plus récente que sa version, reconstruite à la requête suivante
+            version, _ = conditional.collection_version(db, models.CollectionVersion, COLLECTION)
+            snapshot = CatalogSnapshot(db.query(models.Service).all(), version)
+            _snapshot = snapshot
+    return snapshot
@@ -1,8 +1,102 @@
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from . import models, schemas
+import models
+import schemas
+import catalog
+from shared import cache, conditional, jobs, multiget, outbox, rollup, search, snapshot, sparse
 
-def get_service(db: Session, service_id: int):
-    return db.query(models.Service).filter(models.Service.id == service_id).first()
+SEARCH_COLUMNS = ["name", "description", "category"]
+SERVICES_PER_CATEGORY = "services_per_category"
+# Champs exposés, sélectionnables avec ?fields=
+FIELDS = ("id", "name", "description", "price", "category")
+
+def _snapshot_payload(db: Session):
+    # Même représentation que GET /services/catalog, sans pagination
+    current = catalog.get_snapshot(db)
+    return current.query(limit=len(current.ids), with_facets=True)
+
+# Catalogue complet précompressé, republié après chaque écriture par une tâche de fond
+SNAPSHOT = snapshot.SnapshotStore("services", _snapshot_payload)
+
+JOBS = jobs.JobQueue("service", models.Job)
+
+@JOBS.task("publish_snapshot", exclusive=True)
+def publish_snapshot(db: Session, payload: dict):
+    SNAPSHOT.publish(db)
+
+@JOBS.task("rebuild_rollups", exclusive=True)
+def rebuild_rollups_job(db: Session, payload: dict):
+    rebuild_rollups(db)
+
+# Lectures par id mises en cache (hors ?fields=), invalidées à chaque écriture d'un service
+services_by_id = cache.Cache("services", models.Service, topic="service")
+
+@services_by_id.cached_many
+def get_services_by_ids(db: Session, ids, fields=None):
+    query = db.query(models.Service)
+    if fields:
+        query = query.options(sparse.load_only(models.Service, fields, extra=("id",)))
+    return multiget.fetch(query, models.Service.id, ids)
+
+@services_by_id.cached
+def get_service(db: Session, service_id: int, fields=None):
+    query = db.query(models.Service)
+    if fields:
+        query = query.options(sparse.load_only(models.Service, fields))
+    return query.filter(models.Service.id == service_id).first()
 
 def get_services(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Service).offset(skip).limit(limit).all()
+
+def query_catalog(db: Session, categories=None, min_price=None, max_price=None,
+                  sort: str = "id", skip: int = 0, limit: int = 100, with_facets: bool = False, fields=None):
+    # Servi depuis la copie en mémoire du catalogue, sans parcourir la table
+    return catalog.get_snapshot(db).query(
+        categories=categories, min_price=min_price, max_price=max_price,
+        sort=sort, skip=skip, limit=limit, with_facets=with_facets, fields=fields
+    )
+
+def get_catalog_version(db: Session):
+    return catalog.get_snapshot(db).version
+
+def create_service(db: Session, service: schemas.ServiceCreate):
+    db_service = models.Service(**service.dict())
+    db.add(db_service)
+    db.flush()
+    outbox.record(db, models.OutboxEvent, "service", "created", db_service.id, {"category": db_service.category})
+    rollup.increment(db, models.Rollup, SERVICES_PER_CATEGORY, db_service.category)
+    conditional.bump(db, models.CollectionVersion, catalog.COLLECTION)
+    # Écritures rapprochées : une seule republication en attente suffit
+    JOBS.enqueue(db, "publish_snapshot", coalesce=True)
+    db.commit()
+    db.refresh(db_service)
+    return db_service
+
+def delete_service(db: Session, service_id: int):
+    db_service = get_service(db, service_id)
+    if db_service:
+        db.delete(db_service)
+        outbox.record(db, models.OutboxEvent, "service", "deleted", service_id, {"category": db_service.category})
+        rollup.increment(db, models.Rollup, SERVICES_PER_CATEGORY, db_service.category, -1)
+        conditional.bump(db, models.CollectionVersion, catalog.COLLECTION)
+        JOBS.enqueue(db, "publish_snapshot", coalesce=True)
+        db.commit()
+        return True
+    return False
+
+def search_services(db: Session, query: str, skip: int = 0, limit: int = 20):
+    return search.search(
+        db, "services", SEARCH_COLUMNS, query, hit_type="service",
+        extra_columns=["price"],
+        skip=skip, limit=limit
+    )
+
+def get_service_stats(db: Session):
+    return rollup.series(db, models.Rollup, SERVICES_PER_CATEGORY)
+
+def rebuild_rollups(db: Session):
+    counts = dict(
+        db.query(models.Service.category, func.count(models.Service.id)).group_by(models.Service.category)
+    )
+    rollup.rebuild(db, models.Rollup, SERVICES_PER_CATEGORY, counts)
+    return {SERVICES_PER_CATEGORY: sum(counts.values())}
@@ -1,26 +1,63 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import os
-from dotenv import load_dotenv
+import sys
+
+# Rendre le paquet backend/shared importable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database import SessionLocal, engine
 import models
 import schemas
 import crud
-
-# Charger les variables d'environnement
-load_dotenv()
+import catalog
+from shared import admission, authz, cache, conditional, jobs, looplag, metrics, multiget, outbox, profiler, rollup, search, sparse, sqlprofile, tracing
 
 # Créer les tables
 models.Base.metadata.create_all(bind=engine)
 
+# Index plein texte mis à jour par triggers à chaque écriture
+search.ensure_fts_index(engine, "services", crud.SEARCH_COLUMNS)
+
 app = FastAPI(
     title="Service Service",
     description="Service de gestion des services proposés par MindGraphix",
     version="1.0.0"
 )
 
+# Profilage SQL par requête : en-tête Server-Timing, métriques et détection des N+1
+sqlprofile.instrument_engine(engine)
+tracing.instrument_engine(engine)
+app.add_middleware(sqlprofile.SQLProfilingMiddleware, service="service")
+metrics.install(app)
+# Profilage à la demande (permission debug_profile)
+profiler.install(app, "service")
+# Retard de la boucle asyncio et détection des appels bloquants
+looplag.install(app, "service")
+
+# Contrôle d'admission : compartiments par route, délestage en 503 + Retry-After
+app.add_middleware(admission.AdmissionMiddleware, service="service", routes=[
+    ("GET", "/search", "search"),
+    ("POST", "/", "write"),
+    ("DELETE", "/", "write"),
+], limits={"search": 8, "write": 8})
+
+# Traçage distribué : ajouté en dernier, le span serveur couvre toute la requête
+app.add_middleware(tracing.TracingMiddleware, service="service")
+
+# Flux des événements de changement (outbox) pour l'invalidation des caches
+event_stream = outbox.EventStream("service", models.OutboxEvent, SessionLocal)
+outbox.install(app, event_stream)
+# Caches en mémoire invalidés par les écritures des autres processus
+cache.install(app, event_stream)
+
+# Lectures unitaires concurrentes regroupées en une requête IN
+service_loader = multiget.Batcher("services", SessionLocal, crud.get_services_by_ids)
+
+# Tâches de fond (republication de l'instantané, recalculs), exécutées hors des requêtes
+jobs.install(app, crud.JOBS, SessionLocal)
+
 # Dépendance pour obtenir la session de base de données
 def get_db():
     db = SessionLocal()
@@ -29,18 +66,157 @@ def get_db():
     finally:
         db.close()
 
+@app.on_event("startup")
+def publish_snapshot():
+    # Écritures faites pendant l'arrêt du service : l'instantané repart de la base
+    db = SessionLocal()
+    try:
+        crud.SNAPSHOT.publish(db)
+    finally:
+        db.close()
+
+def check_sort(sort: str):
+    if sort not in catalog.SORT_KEYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tri invalide, valeurs possibles: {sorted(catalog.SORT_KEYS)}"
+        )
+
+def catalog_not_modified(request: Request, response: Response, db: Session):
+    etag = conditional.make_etag("services", crud.get_catalog_version(db), conditional.query_key(request))
+    return conditional.not_modified(request, response, etag)
+
 @app.get("/services", response_model=List[schemas.Service])
-def read_services(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    services = crud.get_services(db, skip=skip, limit=limit)
-    return services
+def read_services(
+    request: Request,
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1),
+    category: Optional[List[str]] = Query(None),
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    sort: str = "id",
+    ids: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Catalogue filtré, ou ?ids=3,1,7 : services demandés dans cet ordre (filtres ignorés),
+    absents dans X-Missing-Ids
+    """
+    check_sort(sort)
+    selected = sparse.parse(fields, crud.FIELDS)
+    cached = catalog_not_modified(request, response, db)
+    if cached is not None:
+        return cached
+    if ids is not None:
+        requested = multiget.parse_ids(ids)
+        services = multiget.ordered(crud.get_services_by_ids(db, requested, fields=selected), requested, response)
+        if selected:
+            return sparse.response([sparse.project(service, selected) for service in services], response)
+        return services
+    page = crud.query_catalog(
+        db, categories=category, min_price=min_price, max_price=max_price,
+        sort=sort, skip=skip, limit=limit, fields=selected
+    )
+    if selected:
+        return sparse.response(page["items"], response)
+    return page["items"]
+
+@app.get("/services/catalog", response_model=schemas.ServiceCatalogPage)
+def read_catalog(
+    request: Request,
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1),
+    category: Optional[List[str]] = Query(None),
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    sort: str = "id",
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    check_sort(sort)
+    selected = sparse.parse(fields, crud.FIELDS)
+    cached = catalog_not_modified(request, response, db)
+    if cached is not None:
+        return cached
+    page = crud.query_catalog(
+        db, categories=category, min_price=min_price, max_price=max_price,
+        sort=sort, skip=skip, limit=limit, with_facets=True, fields=selected
+    )
+    if selected:
+        return sparse.response(page, response)
+    return page
+
+@app.get("/services/snapshot", response_model=schemas.ServiceCatalogPage)
+def read_catalog_snapshot(request: Request, response: Response):
+    """
+    Catalogue complet avec facettes, servi depuis un fichier précompressé (gzip / brotli)
+    """
+    return crud.SNAPSHOT.response(request, response, SessionLocal)
+
+@app.post("/services", response_model=schemas.Service)
+def create_service(
+    service: schemas.ServiceCreate,
+    db: Session = Depends(get_db),
+    access: dict = Depends(authz.require_permission("manage_services"))
+):
+    return crud.create_service(db=db, service=service)
 
 @app.get("/services/{service_id}", response_model=schemas.Service)
-def read_service(service_id: int, db: Session = Depends(get_db)):
-    db_service = crud.get_service(db, service_id=service_id)
+async def read_service(
+    service_id: int,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = None
+):
+    selected = sparse.parse(fields, crud.FIELDS)
+    db_service = await service_loader.load(service_id)
     if db_service is None:
         raise HTTPException(status_code=404, detail="Service non trouvé")
+    if selected:
+        # Pas de date de modification : l'ETag porte sur le contenu renvoyé
+        body = sparse.project(db_service, selected)
+        cached = conditional.not_modified(request, response, conditional.make_etag("service", fields, *body.values()))
+        return cached if cached is not None else sparse.response(body, response)
+    etag = conditional.make_etag(
+        "service", db_service.id, db_service.name, db_service.description, db_service.price, db_service.category
+    )
+    cached = conditional.not_modified(request, response, etag)
+    if cached is not None:
+        return cached
     return db_service
 
+@app.delete("/services/{service_id}")
+def delete_service(
+    service_id: int,
+    db: Session = Depends(get_db),
+    access: dict = Depends(authz.require_permission("manage_services"))
+):
+    success = crud.delete_service(db, service_id=service_id)
+    if not success:
+        raise HTTPException(status_code=404, detail="Service non trouvé")
+    return {"message": "Service supprimé avec succès"}
+
+@app.get("/search", response_model=search.SearchPage)
+def search_services(q: str, skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
+    return crud.search_services(db, query=q, skip=skip, limit=limit)
+
+@app.get("/stats/services-per-category", response_model=rollup.StatSeries)
+def read_service_stats(db: Session = Depends(get_db), access: dict = Depends(authz.require_permission("view_services"))):
+    return crud.get_service_stats(db)
+
+@app.post("/stats/rebuild", response_model=jobs.JobStatus, status_code=202)
+def rebuild_stats(db: Session = Depends(get_db), access: dict = Depends(authz.require_permission("manage_services"))):
+    """
+    Recalcule les statistiques depuis les données, en tâche de fond (suivi : GET /jobs/{id})
+    """
+    job = crud.JOBS.enqueue(db, "rebuild_rollups", coalesce=True)
+    db.commit()
+    db.refresh(job)
+    return job
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8003)
+    uvicorn.run(app, host="0.0.0.0", port=8004)
@@ -1,8 +1,19 @@
 from sqlalchemy import Column, Integer, String, Text, Float
 from sqlalchemy.ext.declarative import declarative_base
 
+from shared import conditional, jobs, outbox, rollup
+
 Base = declarative_base()
 
+# Événements de changement, écrits dans la même transaction que les données
+OutboxEvent = outbox.declare_outbox(Base)
+# Compteurs agrégés des statistiques, eux aussi mis à jour dans la transaction d'écriture
+Rollup = rollup.declare_rollup(Base)
+# Tâches de fond (republication de l'instantané, recalculs), validées avec l'écriture
+Job = jobs.declare_jobs(Base)
+# Version de chaque collection, partagée par les processus (reconstruction de la copie du catalogue)
+CollectionVersion = conditional.declare_versions(Base)
+
 class Service(Base):
     __tablename__ = "services"
 
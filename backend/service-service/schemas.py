@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, List, Optional
 
 class ServiceBase(BaseModel):
     name: str
@@ -7,8 +7,20 @@ class ServiceBase(BaseModel):
     price: Optional[float] = None
     category: str
 
+class ServiceCreate(ServiceBase):
+    pass
+
 class Service(ServiceBase):
     id: int
 
     class Config:
         orm_mode = True
+
+class CatalogFacets(BaseModel):
+    categories: Dict[str, int] = {}
+    price_buckets: Dict[str, int] = {}
+
+class ServiceCatalogPage(BaseModel):
+    total: int
+    items: List[Service] = []
+    facets: Optional[CatalogFacets] = None
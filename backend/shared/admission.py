@@ -0,0 +1,287 @@
+"""
+Contrôle d'admission et délestage.
+
+Chaque requête est rangée dans un compartiment (bulkhead) selon sa route : un
+compartiment borne le nombre de requêtes en cours, les suivantes attendent dans
+une file ordonnée par classe de priorité. Une requête qui attendrait plus que
+le temps toléré pour sa classe est refusée tout de suite (503 + Retry-After)
+au lieu d'encombrer le pool de threads et les verrous SQLite.
+
+Classes : health / metrics (jamais mises en file), administrateur authentifié,
+utilisateur authentifié, anonyme.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from shared import metrics
+
+CRITICAL, ADMIN, AUTHENTICATED, ANONYMOUS = range(4)
+PRIORITY_NAMES = {CRITICAL: "critical", ADMIN: "admin", AUTHENTICATED: "authenticated", ANONYMOUS: "anonymous"}
+
+ENABLED = os.getenv("ADMISSION_CONTROL", "on") != "off"
+DEFAULT_LIMIT = int(os.getenv("ADMISSION_DEFAULT_LIMIT", "32"))
+# Taille maximale de la file d'un compartiment, en multiple de sa limite
+QUEUE_FACTOR = int(os.getenv("ADMISSION_QUEUE_FACTOR", "4"))
+RETRY_AFTER = os.getenv("ADMISSION_RETRY_AFTER", "1")
+# Attente maximale en file par classe (secondes)
+MAX_QUEUE_TIME = {
+    CRITICAL: float("inf"),
+    ADMIN: float(os.getenv("ADMISSION_ADMIN_QUEUE_TIME", "2.0")),
+    AUTHENTICATED: float(os.getenv("ADMISSION_USER_QUEUE_TIME", "1.0")),
+    ANONYMOUS: float(os.getenv("ADMISSION_ANONYMOUS_QUEUE_TIME", "0.25")),
+}
+# Jamais mis en file : sondes, métriques et flux longs (SSE)
+BYPASS_PATHS = ("/health", "/metrics", "/events")
+
+shed_total = metrics.registry.counter(
+    "admission_shed_total", "Requêtes refusées par le contrôle d'admission"
+)
+queue_seconds = metrics.registry.histogram(
+    "admission_queue_seconds", "Temps d'attente avant admission"
+)
+in_flight = metrics.registry.gauge(
+    "admission_in_flight", "Requêtes admises en cours par compartiment"
+)
+
+_priority: ContextVar[int] = ContextVar("admission_priority", default=ANONYMOUS)
+
+
+def current_priority() -> int:
+    # Priorité de la requête en cours, reprise par les appels sortants du gateway
+    return _priority.get()
+
+
+class Overloaded(HTTPException):
+    def __init__(self, bulkhead: str, reason: str):
+        super().__init__(
+            status_code=503,
+            detail=f"Service surchargé ({bulkhead}), réessayez plus tard",
+            headers={"Retry-After": RETRY_AFTER},
+        )
+        self.bulkhead = bulkhead
+        self.reason = reason
+
+
+def _b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def token_claims(authorization: Optional[str], secret: str) -> dict:
+    """
+    Claims d'un JWT HS256 dont la signature et l'expiration sont valides, {} sinon.
+    Sert uniquement à ordonner les requêtes : l'autorisation reste faite par les services.
+    """
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return {}
+    try:
+        header, payload, signature = authorization[7:].strip().split(".")
+        expected = hmac.new(secret.encode("utf-8"), f"{header}.{payload}".encode("ascii"), hashlib.sha256).digest()
+        if not hmac.compare_digest(_b64decode(signature), expected):
+            return {}
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, binascii.Error, UnicodeEncodeError):
+        return {}
+    if not isinstance(claims, dict) or claims.get("exp", float("inf")) < time.time():
+        return {}
+    return claims
+
+
+def parse_limits(value: Optional[str], service: str) -> Dict[str, int]:
+    """
+    "login=4,auth.default=16" -> limites du service ; la forme qualifiée <service>.<compartiment> l'emporte
+    """
+    limits, qualified = {}, {}
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        name, _, limit = item.partition("=")
+        owner, _, pool = name.strip().rpartition(".")
+        if not owner:
+            limits[pool] = int(limit)
+        elif owner == service:
+            qualified[pool] = int(limit)
+    limits.update(qualified)
+    return limits
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "enqueued_at", "future")
+
+    def __init__(self, priority: int, seq: int):
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class Bulkhead:
+    """
+    Compartiment : au plus `limit` requêtes en cours, file d'attente bornée par priorité
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int = None, service: str = ""):
+        self.name = name
+        self.service = service
+        self.limit = limit
+        self.max_queue = max_queue if max_queue is not None else limit * QUEUE_FACTOR
+        self.active = 0
+        self.waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+
+    def _shed(self, priority: int, reason: str):
+        shed_total.inc(service=self.service, bulkhead=self.name, priority=PRIORITY_NAMES[priority], reason=reason)
+        return Overloaded(self.name, reason)
+
+    def _admitted(self, waited: float):
+        queue_seconds.observe(waited, service=self.service, bulkhead=self.name)
+        in_flight.set(self.active, service=self.service, bulkhead=self.name)
+
+    async def acquire(self, priority: int = ANONYMOUS):
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            self._admitted(0.0)
+            return
+
+        max_wait = MAX_QUEUE_TIME[priority]
+        now = time.monotonic()
+        # File déjà trop ancienne pour cette classe : refus immédiat plutôt qu'une attente vaine
+        ahead = [w for w in self.waiters if w.priority <= priority]
+        if ahead and now - min(w.enqueued_at for w in ahead) >= max_wait:
+            raise self._shed(priority, "queue_time")
+        if len(self.waiters) >= self.max_queue:
+            # File pleine : la requête la moins prioritaire (la plus récente) cède sa place
+            victim = max(self.waiters, key=lambda w: (w.priority, w.seq))
+            if victim.priority <= priority:
+                raise self._shed(priority, "queue_full")
+            self.waiters.remove(victim)
+            victim.future.set_exception(self._shed(victim.priority, "preempted"))
+
+        waiter = _Waiter(priority, next(self._seq))
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), None if max_wait == float("inf") else max_wait)
+        except asyncio.TimeoutError:
+            # Un créneau a pu être attribué juste à l'échéance
+            if not waiter.future.done():
+                self.waiters.remove(waiter)
+                waiter.future.cancel()
+                raise self._shed(priority, "queue_time")
+            waiter.future.result()
+        except asyncio.CancelledError:
+            # Client parti pendant l'attente : rendre le créneau s'il avait été attribué
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                self.release()
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+                waiter.future.cancel()
+            raise
+        self._admitted(time.monotonic() - waiter.enqueued_at)
+
+    def release(self):
+        while self.waiters:
+            # Le créneau passe directement au meilleur candidat : priorité puis ordre d'arrivée
+            waiter = min(self.waiters, key=lambda w: (w.priority, w.seq))
+            self.waiters.remove(waiter)
+            if not waiter.future.done():
+                waiter.future.set_result(True)
+                return
+        self.active -= 1
+        in_flight.set(self.active, service=self.service, bulkhead=self.name)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = None):
+        await self.acquire(current_priority() if priority is None else priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class AdmissionMiddleware:
+    """
+    Range chaque requête dans le compartiment de sa route.
+    routes : [(méthode ou None, préfixe de chemin, compartiment ou None pour ne pas limiter)],
+    la première règle qui correspond l'emporte ; sinon compartiment "default".
+    """
+
+    def __init__(self, app, service: str, routes: List[Tuple[Optional[str], str, Optional[str]]] = (),
+                 limits: Dict[str, int] = None, enabled: bool = None):
+        self.app = app
+        self.service = service
+        self.routes = list(routes)
+        self.enabled = ENABLED if enabled is None else enabled
+        self.limits = dict(limits or {})
+        self.limits.update(parse_limits(os.getenv("ADMISSION_LIMITS"), service))
+        self.secret = os.getenv("SECRET_KEY", "your-secret-key-here")
+        self.bulkheads: Dict[str, Bulkhead] = {}
+
+    def bulkhead(self, name: str) -> Bulkhead:
+        bulkhead = self.bulkheads.get(name)
+        if bulkhead is None:
+            bulkhead = self.bulkheads[name] = Bulkhead(
+                name, self.limits.get(name, DEFAULT_LIMIT), service=self.service
+            )
+        return bulkhead
+
+    def classify(self, method: str, path: str) -> Optional[str]:
+        if path.startswith(BYPASS_PATHS):
+            return None
+        for route_method, prefix, name in self.routes:
+            if (route_method is None or route_method == method) and path.startswith(prefix):
+                return name
+        return "default"
+
+    def priority(self, scope) -> int:
+        authorization = None
+        for key, value in scope.get("headers", ()):
+            if key == b"authorization":
+                authorization = value.decode("latin-1")
+                break
+        claims = token_claims(authorization, self.secret)
+        if not claims:
+            return ANONYMOUS
+        # "adm" est posé par le service d'authentification pour les administrateurs
+        return ADMIN if claims.get("adm") else AUTHENTICATED
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+        name = self.classify(scope["method"], scope["path"])
+        if name is None:
+            token = _priority.set(CRITICAL)
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _priority.reset(token)
+            return
+
+        priority = self.priority(scope)
+        bulkhead = self.bulkhead(name)
+        try:
+            await bulkhead.acquire(priority)
+        except Overloaded as exc:
+            body = json.dumps({"detail": exc.detail}).encode("utf-8")
+            await send({"type": "http.response.start", "status": 503,
+                        "headers": [(b"content-type", b"application/json"),
+                                    (b"content-length", str(len(body)).encode()),
+                                    (b"retry-after", RETRY_AFTER.encode())]})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        token = _priority.set(priority)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _priority.reset(token)
+            bulkhead.release()
@@ -0,0 +1,342 @@
+"""
+Journal d'audit non bloquant.
+
+Les événements (connexions, rafraîchissements, inscriptions, changements RBAC)
+sont posés dans un tampon circulaire en mémoire puis écrits par lots par un
+thread dédié : en base dans une seule transaction par lot, ou dans des fichiers
+en ajout seul, un par heure, avec rotation par taille. L'endpoint de requête
+pagine par (horodatage, identifiant) et ne lit que la plage demandée.
+
+Un événement devient visible à la requête après le prochain vidage du tampon
+(AUDIT_FLUSH_INTERVAL).
+"""
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import Column, DateTime, Index, String, Text, and_, or_
+
+from shared import config, metrics
+
+logger = logging.getLogger("mindgraphix.audit")
+
+SINK = os.getenv("AUDIT_SINK", "db")
+BUFFER_SIZE = int(os.getenv("AUDIT_BUFFER_SIZE", "10000"))
+# Tampon plein : "drop" écrase l'événement le plus ancien, "block" attend de la place
+OVERFLOW = os.getenv("AUDIT_OVERFLOW", "drop")
+# Attente maximale en mode "block" avant d'abandonner l'événement (secondes)
+BLOCK_TIMEOUT = float(os.getenv("AUDIT_BLOCK_TIMEOUT", "0.05"))
+BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.5"))
+# Sans AUDIT_DIR : <service>/data/audit_log
+AUDIT_DIR = os.getenv("AUDIT_DIR")
+FILE_MAX_BYTES = int(os.getenv("AUDIT_FILE_MAX_BYTES", str(64 * 1024 * 1024)))
+FILE_MAX_FILES = int(os.getenv("AUDIT_FILE_MAX_FILES", "168"))
+MAX_PAGE = 500
+
+events_total = metrics.registry.counter("audit_events_total", "Événements d'audit émis")
+dropped_total = metrics.registry.counter("audit_dropped_total", "Événements d'audit perdus (tampon plein)")
+buffered = metrics.registry.gauge("audit_buffered", "Événements d'audit en attente d'écriture")
+flush_seconds = metrics.registry.histogram("audit_flush_seconds", "Durée d'écriture d'un lot d'audit")
+
+
+class AuditEntry(BaseModel):
+    id: str
+    occurred_at: datetime
+    action: str
+    actor: Optional[str] = None
+    target: Optional[str] = None
+    ip: Optional[str] = None
+    payload: Optional[dict] = None
+
+
+class AuditPage(BaseModel):
+    items: List[AuditEntry] = []
+    next_cursor: Optional[str] = None
+
+
+def declare_audit(Base):
+    """
+    Déclare la table audit_events sur la Base d'un service
+    """
+    class AuditEvent(Base):
+        __tablename__ = "audit_events"
+        __table_args__ = (
+            # Pagination par plage de temps, globale ou par acteur
+            Index("ix_audit_events_occurred_at_id", "occurred_at", "id"),
+            Index("ix_audit_events_actor_occurred_at", "actor", "occurred_at"),
+        )
+
+        # Identifiant attribué à l'émission : l'ordre ne dépend pas du vidage
+        id = Column(String, primary_key=True)
+        occurred_at = Column(DateTime, nullable=False)
+        action = Column(String, nullable=False)
+        actor = Column(String, nullable=True)
+        target = Column(String, nullable=True)
+        ip = Column(String, nullable=True)
+        payload = Column(Text, nullable=True)
+
+    return AuditEvent
+
+
+def encode_cursor(entry: dict) -> str:
+    return f"{entry['occurred_at'].isoformat()}_{entry['id']}"
+
+
+def decode_cursor(cursor: str):
+    occurred_at, _, event_id = cursor.rpartition("_")
+    return datetime.fromisoformat(occurred_at), event_id
+
+
+# --- Destinations ---
+
+class DatabaseSink:
+    def __init__(self, session_factory, model):
+        self.session_factory = session_factory
+        self.model = model
+
+    def write(self, batch: List[dict]):
+        rows = [dict(entry, payload=json.dumps(entry["payload"], default=str) if entry["payload"] else None)
+                for entry in batch]
+        db = self.session_factory()
+        try:
+            db.execute(self.model.__table__.insert(), rows)
+            db.commit()
+        finally:
+            db.close()
+
+    def query(self, since=None, until=None, actor=None, action=None, cursor=None, limit=100) -> List[dict]:
+        model = self.model
+        db = self.session_factory()
+        try:
+            query = db.query(model)
+            if since is not None:
+                query = query.filter(model.occurred_at >= since)
+            if until is not None:
+                query = query.filter(model.occurred_at < until)
+            if actor is not None:
+                query = query.filter(model.actor == actor)
+            if action is not None:
+                query = query.filter(model.action == action)
+            if cursor is not None:
+                # Pagination par clé : on reprend strictement avant le dernier élément renvoyé
+                occurred_at, event_id = cursor
+                query = query.filter(or_(model.occurred_at < occurred_at,
+                                         and_(model.occurred_at == occurred_at, model.id < event_id)))
+            rows = query.order_by(model.occurred_at.desc(), model.id.desc()).limit(limit).all()
+            return [{
+                "id": row.id, "occurred_at": row.occurred_at, "action": row.action, "actor": row.actor,
+                "target": row.target, "ip": row.ip, "payload": json.loads(row.payload) if row.payload else None,
+            } for row in rows]
+        finally:
+            db.close()
+
+
+class FileSink:
+    """
+    Fichiers NDJSON en ajout seul, un par heure (audit-AAAAMMJJ-HH[.n].ndjson) :
+    le nom sert d'index temporel, la taille déclenche une rotation dans l'heure
+    """
+
+    def __init__(self, directory: str, max_bytes: int = FILE_MAX_BYTES, max_files: int = FILE_MAX_FILES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _hour(filename: str) -> datetime:
+        return datetime.strptime(os.path.basename(filename)[len("audit-"):len("audit-") + 11], "%Y%m%d-%H")
+
+    @staticmethod
+    def _index(filename: str) -> int:
+        # audit-AAAAMMJJ-HH.ndjson -> 0, audit-AAAAMMJJ-HH.3.ndjson -> 3
+        parts = os.path.basename(filename).split(".")
+        return int(parts[1]) if len(parts) == 3 else 0
+
+    def _files(self):
+        return sorted(glob.glob(os.path.join(self.directory, "audit-*.ndjson")),
+                      key=lambda path: (self._hour(path), self._index(path)))
+
+    def _target(self, hour: datetime) -> str:
+        base = os.path.join(self.directory, f"audit-{hour:%Y%m%d-%H}")
+        path, index = f"{base}.ndjson", 0
+        while os.path.exists(path) and os.path.getsize(path) >= self.max_bytes:
+            index += 1
+            path = f"{base}.{index}.ndjson"
+        return path
+
+    def write(self, batch: List[dict]):
+        by_hour = {}
+        for entry in batch:
+            by_hour.setdefault(entry["occurred_at"].replace(minute=0, second=0, microsecond=0), []).append(entry)
+        for hour, entries in by_hour.items():
+            data = "".join(json.dumps(dict(e, occurred_at=e["occurred_at"].isoformat()), default=str) + "\n"
+                           for e in entries).encode("utf-8")
+            # Un seul write par lot en O_APPEND : pas d'entrelacement entre processus
+            fd = os.open(self._target(hour), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+        files = self._files()
+        for path in files[:max(0, len(files) - self.max_files)]:
+            os.remove(path)
+
+    def query(self, since=None, until=None, actor=None, action=None, cursor=None, limit=100) -> List[dict]:
+        low = since.replace(minute=0, second=0, microsecond=0) if since else None
+        results = []
+        current_hour = None
+        # Fichiers du plus récent au plus ancien, hors de la plage demandée ignorés
+        for path in reversed(self._files()):
+            hour = self._hour(path)
+            if hour != current_hour and len(results) >= limit:
+                # Page complète : les heures plus anciennes ne peuvent plus y entrer
+                break
+            current_hour = hour
+            if (until is not None and hour >= until) or (low is not None and hour < low):
+                continue
+            if cursor is not None and hour > cursor[0]:
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    entry["occurred_at"] = datetime.fromisoformat(entry["occurred_at"])
+                    key = (entry["occurred_at"], entry["id"])
+                    if ((since is None or key[0] >= since) and (until is None or key[0] < until)
+                            and (actor is None or entry["actor"] == actor)
+                            and (action is None or entry["action"] == action)
+                            and (cursor is None or key < cursor)):
+                        results.append(entry)
+        results.sort(key=lambda e: (e["occurred_at"], e["id"]), reverse=True)
+        return results[:limit]
+
+
+# --- Tampon et écriture en arrière-plan ---
+
+class AuditLog:
+    def __init__(self, service: str, sink, buffer_size: int = BUFFER_SIZE, overflow: str = OVERFLOW,
+                 batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self.service = service
+        self.sink = sink
+        self.buffer_size = buffer_size
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._stopping = False
+        self._thread = None
+
+    def record(self, action: str, actor=None, target=None, ip: str = None, **payload):
+        """
+        Ajoute un événement au tampon, sans E/S ; n'attend qu'en mode "block", et au plus BLOCK_TIMEOUT
+        """
+        entry = {
+            "id": uuid.uuid4().hex,
+            "occurred_at": datetime.utcnow(),
+            "action": action,
+            "actor": None if actor is None else str(actor),
+            "target": None if target is None else str(target),
+            "ip": ip,
+            "payload": payload or None,
+        }
+        with self._lock:
+            if len(self._buffer) >= self.buffer_size:
+                if self.overflow == "block":
+                    self._not_full.wait_for(lambda: len(self._buffer) < self.buffer_size, BLOCK_TIMEOUT)
+                if len(self._buffer) >= self.buffer_size:
+                    if self.overflow == "block":
+                        dropped_total.inc(service=self.service, reason="timeout")
+                        return
+                    # Tampon circulaire : l'événement le plus ancien laisse sa place
+                    self._buffer.popleft()
+                    dropped_total.inc(service=self.service, reason="overwritten")
+            self._buffer.append(entry)
+            if len(self._buffer) >= self.batch_size:
+                self._not_empty.notify()
+        events_total.inc(service=self.service, action=action)
+
+    def start(self):
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name=f"{self.service}-audit", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopping = True
+            self._not_empty.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def flush(self):
+        """
+        Écrit tout le tampon maintenant (arrêt du service, tests)
+        """
+        while True:
+            with self._lock:
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                self._not_full.notify_all()
+            if not batch:
+                return
+            self._write(batch)
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        try:
+            self.sink.write(batch)
+        except Exception:
+            # Le journal d'audit ne doit jamais faire échouer le service : le lot est compté perdu
+            logger.exception("Échec de l'écriture de %d événement(s) d'audit", len(batch))
+            dropped_total.inc(len(batch), service=self.service, reason="write_error")
+        flush_seconds.observe(time.perf_counter() - started, service=self.service)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if len(self._buffer) < self.batch_size and not self._stopping:
+                    self._not_empty.wait(self.flush_interval)
+                stopping = self._stopping
+            self.flush()
+            buffered.set(len(self._buffer), service=self.service)
+            if stopping:
+                return
+
+    def query(self, since: datetime = None, until: datetime = None, actor: str = None, action: str = None,
+              cursor: str = None, limit: int = 100) -> dict:
+        limit = max(1, min(limit, MAX_PAGE))
+        items = self.sink.query(since=_naive_utc(since), until=_naive_utc(until), actor=actor, action=action,
+                                cursor=decode_cursor(cursor) if cursor else None, limit=limit + 1)
+        has_more = len(items) > limit
+        items = items[:limit]
+        return {"items": items, "next_cursor": encode_cursor(items[-1]) if has_more else None}
+
+
+def _naive_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    # Horodatages stockés en UTC sans fuseau : ?since=...Z ou +02:00 convertis avant comparaison
+    if moment is None or moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def create(service: str, session_factory, model) -> AuditLog:
+    """
+    Journal d'audit du service, vers la base ou vers des fichiers selon AUDIT_SINK
+    """
+    if SINK == "file":
+        sink = FileSink(AUDIT_DIR or config.data_dir(sys._getframe(1).f_globals["__file__"], "audit_log"))
+    else:
+        sink = DatabaseSink(session_factory, model)
+    return AuditLog(service, sink)
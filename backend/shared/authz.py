@@ -0,0 +1,55 @@
+"""
+Permissions du porteur d'un token dans les services autres qu'auth-service :
+le token est présenté à auth-service (GET /users/me/roles).
+
+    @app.post("/services")
+    def create_service(..., access=Depends(authz.require_permission("manage_services"))):
+
+En monolithe, le gateway remplace current_access par un appel ASGI direct
+(dependency_overrides) : le remplacement vaut pour toutes les permissions.
+"""
+import json
+import os
+import urllib.error
+import urllib.request
+from typing import Optional
+
+from fastapi import Depends, Header, HTTPException, status
+
+AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://localhost:8001")
+
+
+def current_access(authorization: Optional[str] = Header(None)) -> dict:
+    """
+    Dépendance : rôles et permissions du porteur du token, selon auth-service
+    """
+    if not authorization:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentification requise",
+                            headers={"WWW-Authenticate": "Bearer"})
+    request = urllib.request.Request(f"{AUTH_SERVICE_URL}/users/me/roles", headers={"Authorization": authorization})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as exc:
+        raise HTTPException(status_code=exc.code if exc.code in (401, 404) else 502,
+                            detail="Vérification du token impossible")
+    except (urllib.error.URLError, OSError, ValueError):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Service d'authentification indisponible")
+
+
+def check_permission(access: dict, permission: str):
+    """
+    Réponse de GET /users/me/roles -> 403 si la permission manque
+    """
+    if permission not in access.get("permissions", []):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Permission '{permission}' requise")
+
+
+def require_permission(permission: str):
+    """
+    Dépendance : le porteur du token a la permission `permission`
+    """
+    def dependency(access: dict = Depends(current_access)):
+        check_permission(access, permission)
+        return access
+    return dependency
@@ -0,0 +1,458 @@
+"""
+Import et export en masse des tables des services, en flux (NDJSON ou CSV).
+
+Les lignes sont lues et écrites par paquets (executemany) : la mémoire reste
+constante quelle que soit la taille du fichier. Chaque paquet est validé avec
+son point de reprise, dans la même transaction : un import interrompu reprend
+exactement après le dernier paquet validé. Les index secondaires et les
+triggers de recherche peuvent être retirés pendant le chargement puis
+reconstruits une seule fois à la fin.
+
+    cd backend && python -m shared.bulk import projects projects.ndjson
+    cd backend && python -m shared.bulk import contacts contacts.csv --drop-indexes
+    cd backend && python -m shared.bulk export services services.csv
+    cd backend && python -m shared.bulk export users - > users.ndjson
+
+Options : --format ndjson|csv (déduit de l'extension), --chunk-size N,
+--drop-indexes, --restart (ignore le point de reprise).
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, MetaData, String, Table, Text, select, text
+
+from shared import cache, conditional, outbox
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "5000"))
+# Intervalle minimal entre deux lignes de progression (secondes)
+PROGRESS_INTERVAL = 1.0
+
+
+class Dataset(NamedTuple):
+    directory: str
+    # Préfixe de DATABASE_URL en mode monolithe
+    prefix: str
+    table: str
+    # Fonctions de crud.py remplaçant l'insertion / la lecture génériques (tables partitionnées)
+    importer: Optional[str] = None
+    exporter: Optional[str] = None
+    # Fonction de crud.py à appeler après un import (tables dérivées)
+    after_import: Optional[str] = None
+
+
+DATASETS = {
+    "projects": Dataset("project-service", "PROJECT", "projects"),
+    "services": Dataset("service-service", "SERVICE", "services"),
+    "contacts": Dataset("contact-service", "CONTACT", "contacts",
+                        importer="import_contacts", exporter="export_contacts"),
+    "user_profiles": Dataset("user-service", "USER", "user_profiles"),
+    "users": Dataset("auth-service", "AUTH", "users"),
+    "roles": Dataset("auth-service", "AUTH", "roles", after_import="rebuild_role_closure"),
+    "permissions": Dataset("auth-service", "AUTH", "permissions"),
+    "user_role": Dataset("auth-service", "AUTH", "user_role"),
+    "role_permission": Dataset("auth-service", "AUTH", "role_permission"),
+    "role_inheritance": Dataset("auth-service", "AUTH", "role_inheritance", after_import="rebuild_role_closure"),
+}
+
+# Points de reprise, stockés dans la base cible pour être validés avec chaque paquet
+_metadata = MetaData()
+checkpoints = Table(
+    "bulk_checkpoints", _metadata,
+    Column("dataset", String, primary_key=True),
+    Column("source", String, primary_key=True),
+    # Taille et date du fichier : une reprise sur un fichier modifié est refusée
+    Column("signature", String, nullable=False),
+    Column("offset", BigInteger, nullable=False, default=0),
+    Column("rows", BigInteger, nullable=False, default=0),
+    Column("done", Boolean, nullable=False, default=False),
+    # DDL retiré pendant le chargement (triggers), rejoué à la fin même après une interruption
+    Column("restore", Text, nullable=True),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+
+def detect_format(path: str, explicit: Optional[str]) -> str:
+    if explicit:
+        return explicit
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+
+# --- Conversion des valeurs ---
+
+def _parse_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "t", "yes", "y")
+    return bool(value)
+
+
+def _parse_datetime(value):
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    return value
+
+
+def converters(table: Table, columns: List[str]) -> Dict[str, callable]:
+    """
+    Conversion de chaque colonne lue (chaîne CSV ou valeur JSON) vers le type de la colonne
+    """
+    result = {}
+    for name in columns:
+        try:
+            python_type = table.c[name].type.python_type
+        except NotImplementedError:
+            python_type = str
+        if python_type is bool:
+            result[name] = _parse_bool
+        elif python_type is datetime:
+            result[name] = _parse_datetime
+        elif python_type in (int, float):
+            result[name] = python_type
+        else:
+            result[name] = str
+    return result
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+# --- Lecture en flux, avec la position exacte après chaque enregistrement ---
+
+class Reader:
+    """
+    Enregistrements d'un fichier NDJSON ou CSV ; offset désigne l'octet suivant le
+    dernier enregistrement lu, d'où la lecture peut reprendre
+    """
+
+    def __init__(self, stream, fmt: str, offset: int = 0, header: Optional[List[str]] = None):
+        self.stream = stream
+        self.format = fmt
+        self.offset = offset
+        self.header = header
+
+    def _lines(self) -> Iterator[str]:
+        for raw in self.stream:
+            self.offset += len(raw)
+            yield raw.decode("utf-8-sig" if self.offset == len(raw) else "utf-8")
+
+    def __iter__(self) -> Iterator[dict]:
+        if self.format == "csv":
+            reader = csv.reader(self._lines())
+            if self.header is None:
+                self.header = next(reader, None) or []
+            for values in reader:
+                if values:
+                    # Cellule vide : valeur absente
+                    yield {key: (value if value != "" else None) for key, value in zip(self.header, values)}
+        else:
+            for line in self._lines():
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_header(stream) -> List[str]:
+    line = stream.readline()
+    stream.seek(0)
+    return next(csv.reader([line.decode("utf-8-sig")]), [])
+
+
+def _chunks(records: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Progress:
+    def __init__(self, label: str, total_bytes: Optional[int] = None, rows: int = 0):
+        self.label = label
+        self.total_bytes = total_bytes
+        self.rows = rows
+        self.started = time.perf_counter()
+        self.initial_rows = rows
+        self.last_report = 0.0
+        self.reported_rows = None
+
+    def update(self, rows: int, offset: Optional[int] = None, final: bool = False):
+        self.rows = rows
+        now = time.perf_counter()
+        if rows == self.reported_rows or (not final and now - self.last_report < PROGRESS_INTERVAL):
+            return
+        self.last_report = now
+        self.reported_rows = rows
+        elapsed = max(now - self.started, 1e-9)
+        rate = (rows - self.initial_rows) / elapsed
+        share = f", {100 * offset / self.total_bytes:.1f} %" if offset is not None and self.total_bytes else ""
+        print(f"{self.label}: {rows} lignes{share}, {rate:.0f} lignes/s, {elapsed:.1f} s",
+              file=sys.stderr, flush=True)
+
+
+# --- Index et triggers retirés pendant le chargement ---
+
+def _secondary_indexes(table: Table):
+    # Les index uniques restent en place : ils garantissent l'intégrité pendant le chargement
+    return [index for index in table.indexes if not index.unique]
+
+
+def _fts_triggers(conn, table: str) -> List[tuple]:
+    if conn.dialect.name != "sqlite":
+        return []
+    return conn.execute(
+        text("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = :table AND name LIKE :pattern"),
+        {"table": table, "pattern": f"{table}_fts_%"}
+    ).fetchall()
+
+
+def drop_indexes(engine, table: Table) -> List[str]:
+    """
+    Retire les index secondaires et les triggers FTS ; renvoie le DDL des triggers à rejouer
+    """
+    with engine.begin() as conn:
+        for index in _secondary_indexes(table):
+            index.drop(conn, checkfirst=True)
+        triggers = _fts_triggers(conn, table.name)
+        for name, _ in triggers:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+    return [sql for _, sql in triggers]
+
+
+def restore_indexes(engine, table: Table, trigger_ddl: List[str]):
+    """
+    Recrée les index manquants et les triggers retirés, puis reconstruit l'index FTS en une passe
+    """
+    with engine.begin() as conn:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+        for sql in trigger_ddl:
+            conn.execute(text(sql))
+        if trigger_ddl:
+            fts = f"{table.name}_fts"
+            conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+# --- Import / export dans le répertoire d'un service ---
+
+def _service_modules():
+    # Exécuté dans le répertoire d'un service : ses modules sont importables directement
+    sys.path.insert(0, os.getcwd())
+    from database import SessionLocal, engine
+    import models
+    import crud
+
+    models.Base.metadata.create_all(bind=engine)
+    return SessionLocal, engine, models, crud
+
+
+def import_here(name: str, path: str, fmt: str, chunk_size: int, drop: bool, restart: bool) -> int:
+    dataset = DATASETS[name]
+    SessionLocal, engine, models, crud = _service_modules()
+    table = models.Base.metadata.tables[dataset.table]
+    _metadata.create_all(bind=engine)
+    importer = getattr(crud, dataset.importer) if dataset.importer else None
+
+    from_stdin = path == "-"
+    stream = sys.stdin.buffer if from_stdin else open(path, "rb")
+    source = "-" if from_stdin else os.path.abspath(path)
+    signature, total_bytes = "-", None
+    if not from_stdin:
+        stat = os.fstat(stream.fileno())
+        signature, total_bytes = f"{stat.st_size}:{stat.st_mtime_ns}", stat.st_size
+    key = (checkpoints.c.dataset == name) & (checkpoints.c.source == source)
+
+    db = SessionLocal()
+    try:
+        state = db.execute(select(checkpoints).where(key)).first()
+        if state is not None and (restart or from_stdin):
+            db.execute(checkpoints.delete().where(key))
+            db.commit()
+            state = None
+        if state is not None and state.signature != signature:
+            print(f"{path} a changé depuis l'import interrompu ; relancer avec --restart", file=sys.stderr)
+            return 1
+        if state is not None and state.done:
+            print(f"{name}: {path} déjà importé ({state.rows} lignes)", file=sys.stderr)
+            return 0
+
+        offset, rows = (state.offset, state.rows) if state is not None else (0, 0)
+        trigger_ddl = json.loads(state.restore) if state is not None and state.restore else []
+        if drop:
+            if importer is not None:
+                print(f"{name}: --drop-indexes sans effet (tables partitionnées)", file=sys.stderr)
+            else:
+                trigger_ddl = drop_indexes(engine, table) or trigger_ddl
+        if state is None:
+            db.execute(checkpoints.insert().values(
+                dataset=name, source=source, signature=signature, offset=0, rows=0, done=False,
+                restore=json.dumps(trigger_ddl), updated_at=datetime.utcnow()
+            ))
+            db.commit()
+        elif offset:
+            print(f"{name}: reprise après {rows} lignes", file=sys.stderr)
+
+        header = read_header(stream) if fmt == "csv" and offset and not from_stdin else None
+        if offset:
+            stream.seek(offset)
+        reader = Reader(stream, fmt, offset=offset, header=header)
+        progress = Progress(name, total_bytes, rows)
+        columns = convert = None
+        for chunk in _chunks(iter(reader), chunk_size):
+            if columns is None:
+                columns = list(chunk[0])
+                unknown = [column for column in columns if column not in table.c]
+                if unknown:
+                    print(f"{name}: colonnes inconnues {', '.join(unknown)}", file=sys.stderr)
+                    return 1
+                convert = converters(table, columns)
+            batch = [
+                {column: None if record.get(column) is None else convert[column](record[column])
+                 for column in columns}
+                for record in chunk
+            ]
+            if importer is not None:
+                importer(db, batch)
+            else:
+                db.execute(table.insert(), batch)
+            rows += len(batch)
+            db.execute(checkpoints.update().where(key).values(
+                offset=reader.offset, rows=rows, restore=json.dumps(trigger_ddl), updated_at=datetime.utcnow()
+            ))
+            db.commit()
+            progress.update(rows, reader.offset)
+        progress.update(rows, reader.offset, final=True)
+
+        if importer is None:
+            restore_indexes(engine, table, trigger_ddl)
+        # Tables dérivées : statistiques, fermeture des rôles, instantané public
+        if dataset.after_import:
+            getattr(crud, dataset.after_import)(db)
+        if hasattr(crud, "rebuild_rollups"):
+            crud.rebuild_rollups(db)
+        if hasattr(crud, "SNAPSHOT"):
+            crud.SNAPSHOT.publish(db)
+        if hasattr(models, "CollectionVersion"):
+            # ETag / Last-Modified de la collection importée
+            conditional.bump(db, models.CollectionVersion, dataset.table)
+        if hasattr(models, "OutboxEvent"):
+            # Un seul événement pour tout l'import, pas un par ligne
+            outbox.record(db, models.OutboxEvent, "bulk", "imported", name,
+                          {"rows": rows, "source": os.path.basename(source), "table": dataset.table})
+        db.execute(checkpoints.update().where(key).values(done=True, restore=None, updated_at=datetime.utcnow()))
+        db.commit()
+        # Insertions Core : les caches en lecture de la table (entrées négatives comprises)
+        # ne sont pas invalidés par les événements de session. Les services en cours
+        # d'exécution vident les leurs à la lecture de l'événement "bulk" (cache.install).
+        cache.clear_table(dataset.table)
+        return 0
+    finally:
+        db.close()
+        if not from_stdin:
+            stream.close()
+
+
+def _rows(db, table: Table, chunk_size: int) -> Iterator[dict]:
+    # Curseur côté serveur quand le pilote le permet ; sous SQLite le curseur est déjà paresseux
+    result = db.connection().execution_options(stream_results=True).execute(
+        select(table).order_by(*table.primary_key.columns)
+    )
+    for partition in result.partitions(chunk_size):
+        for row in partition:
+            yield dict(row._mapping)
+
+
+def export_here(name: str, path: str, fmt: str, chunk_size: int) -> int:
+    dataset = DATASETS[name]
+    SessionLocal, engine, models, crud = _service_modules()
+    table = models.Base.metadata.tables[dataset.table]
+    columns = [column.name for column in table.columns]
+
+    to_stdout = path == "-"
+    stream = sys.stdout if to_stdout else open(path, "w", encoding="utf-8", newline="")
+    db = SessionLocal()
+    try:
+        rows = getattr(crud, dataset.exporter)(db) if dataset.exporter else _rows(db, table, chunk_size)
+        progress = Progress(name)
+        count = 0
+        # Un paquet est formaté en mémoire puis écrit d'un bloc
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == "csv" else None
+        if writer is not None:
+            writer.writerow(columns)
+        for row in rows:
+            if writer is not None:
+                writer.writerow(["" if row.get(column) is None else _encode(row.get(column)) for column in columns])
+            else:
+                buffer.write(json.dumps({column: _encode(row.get(column)) for column in columns}, ensure_ascii=False))
+                buffer.write("\n")
+            count += 1
+            if count % chunk_size == 0:
+                stream.write(buffer.getvalue())
+                buffer.seek(0)
+                buffer.truncate()
+                progress.update(count)
+        stream.write(buffer.getvalue())
+        stream.flush()
+        progress.update(count, final=True)
+        return 0
+    finally:
+        db.close()
+        if not to_stdout:
+            stream.close()
+
+
+# --- Ligne de commande ---
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m shared.bulk", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["import", "export", "import-here", "export-here"])
+    parser.add_argument("dataset", choices=sorted(DATASETS))
+    parser.add_argument("path", help="fichier NDJSON ou CSV, - pour l'entrée / la sortie standard")
+    parser.add_argument("--format", choices=["ndjson", "csv"])
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--drop-indexes", action="store_true")
+    parser.add_argument("--restart", action="store_true")
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = _parser().parse_args(argv)
+    fmt = detect_format(args.path, args.format)
+    if args.command == "import-here":
+        return import_here(args.dataset, args.path, fmt, args.chunk_size, args.drop_indexes, args.restart)
+    if args.command == "export-here":
+        return export_here(args.dataset, args.path, fmt, args.chunk_size)
+
+    dataset = DATASETS[args.dataset]
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR)
+    if os.getenv(f"{dataset.prefix}_DATABASE_URL"):
+        env["DATABASE_URL"] = os.environ[f"{dataset.prefix}_DATABASE_URL"]
+    # Le sous-processus s'exécute dans le répertoire du service : chemins absolus
+    path = args.path if args.path == "-" else os.path.abspath(args.path)
+    forwarded = [f"{args.command}-here", args.dataset, path, "--format", fmt, "--chunk-size", str(args.chunk_size)]
+    if args.drop_indexes:
+        forwarded.append("--drop-indexes")
+    if args.restart:
+        forwarded.append("--restart")
+    # Un processus par service : leurs modules portent les mêmes noms
+    return subprocess.call([sys.executable, "-m", "shared.bulk", *forwarded],
+                           cwd=os.path.join(BACKEND_DIR, dataset.directory), env=env)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
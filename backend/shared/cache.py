@@ -0,0 +1,519 @@
+"""
+Cache en lecture (read-through) des recherches ponctuelles des modules crud.
+
+    roles_by_name = cache.Cache("roles_by_name", models.Role, key="name")
+
+    @roles_by_name.cached
+    def get_role_by_name(db, name): ...
+
+Une entrée garde les colonnes de la ligne, pas l'objet ORM : au succès,
+l'objet est rattaché à la session de l'appelant sans SELECT (merge sans
+chargement), ses relations restent chargées à la demande. Une recherche sans
+résultat est mise en cache (cache négatif) avec un TTL plus court.
+
+Invalidation automatique : toute écriture d'une instance du modèle par une
+session (ajout, modification, suppression) retire à la validation les
+entrées de ses anciennes et nouvelles clés ; un UPDATE / DELETE en masse
+vide les caches du modèle. Les INSERT au niveau Core (table.insert(), hors
+session ORM) ne sont pas vus : l'appelant vide les caches de la table avec
+clear_table() (shared.bulk après chaque import).
+
+Course lecture / écriture : une lecture commencée avant un commit peut
+finir après son invalidation et remettre l'ancienne ligne en cache. Chaque
+stockage porte une génération, incrémentée par chaque invalidation : une
+lecture dont la génération a changé depuis son début n'est pas stockée
+(Redis : l'entrée est retirée si l'invalidation arrive pendant l'écriture).
+
+Autres processus : les invalidations par session ne touchent que le
+processus qui écrit. Avec CACHE_BACKEND=memory, install(app, stream) suit
+l'outbox du service (shared.outbox) et retire les clés des événements dont le
+sujet (topic) est celui du cache ; le TTL reste la borne pour les écritures
+sans événement.
+
+Les entrées sont copiées telles quelles (Redis compris) : ne pas mettre en
+cache un modèle portant des secrets (hash de mot de passe) ou un état dont
+la péremption ouvre un accès (compte désactivé).
+
+Stockage : LRU en mémoire du processus (CACHE_BACKEND=memory, par défaut),
+ou Redis (CACHE_BACKEND=redis, CACHE_REDIS_URL) partagé par les réplicas ;
+off désactive le cache.
+"""
+import functools
+import inspect
+import itertools
+import json
+import os
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from shared import metrics
+
+logger = logging.getLogger("mindgraphix.cache")
+
+BACKEND = os.getenv("CACHE_BACKEND", "memory")
+REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+TTL = float(os.getenv("CACHE_TTL", "60"))
+# Un identifiant absent peut être créé à tout moment par un autre processus : TTL court
+NEGATIVE_TTL = float(os.getenv("CACHE_NEGATIVE_TTL", "10"))
+MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+# Intervalle de lecture de l'outbox pour les invalidations des autres processus
+SYNC_INTERVAL = float(os.getenv("CACHE_SYNC_INTERVAL", "1.0"))
+SYNC_BATCH = 200
+
+requests_total = metrics.registry.counter(
+    "cache_requests_total", "Recherches servies par un cache (result=hit, negative_hit, miss)"
+)
+hit_ratio = metrics.registry.gauge(
+    "cache_hit_ratio", "Part des recherches servies par le cache depuis le démarrage"
+)
+invalidations_total = metrics.registry.counter(
+    "cache_invalidations_total", "Entrées retirées après une écriture"
+)
+entries = metrics.registry.gauge(
+    "cache_entries", "Entrées présentes dans un cache en mémoire"
+)
+
+# Absence d'entrée (distincte d'une entrée négative, stockée comme None)
+MISSING = object()
+
+
+# --- Stockage ---
+
+class MemoryBackend:
+    """
+    LRU borné avec expiration par entrée, propre à un cache
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[object, tuple]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return MISSING
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float, generation: int = None):
+        with self._lock:
+            # Invalidation survenue depuis le début de la lecture : valeur périmée
+            if generation is not None and generation != self._generation:
+                return
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, keys: Iterable):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return {"$dt": value.isoformat(), "$date": not isinstance(value, datetime)}
+    raise TypeError(f"Valeur non sérialisable: {type(value).__name__}")
+
+
+def _json_hook(obj):
+    if "$dt" in obj:
+        moment = datetime.fromisoformat(obj["$dt"])
+        return moment.date() if obj.get("$date") else moment
+    return obj
+
+
+class RedisBackend:
+    """
+    Entrées partagées entre réplicas ; client : toute implémentation de get / set(px=) / delete / incr / scan_iter
+    """
+
+    def __init__(self, prefix: str, client=None):
+        self.prefix = f"cache:{prefix}:"
+        # Hors du préfixe : clear() ne remet pas la génération à zéro
+        self.generation_key = f"cache-generation:{prefix}"
+        self.client = client if client is not None else _redis_client()
+
+    def generation(self) -> int:
+        return int(self.client.get(self.generation_key) or 0)
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + str(key))
+        return MISSING if raw is None else json.loads(raw, object_hook=_json_hook)
+
+    def set(self, key, value, ttl: float, generation: int = None):
+        if generation is not None and generation != self.generation():
+            return
+        name = self.prefix + str(key)
+        self.client.set(name, json.dumps(value, default=_json_default), px=max(1, int(ttl * 1000)))
+        # Invalidation entre la vérification et l'écriture : elle a pu passer avant nous
+        if generation is not None and generation != self.generation():
+            self.client.delete(name)
+
+    def delete(self, keys: Iterable):
+        names = [self.prefix + str(key) for key in keys]
+        if names:
+            # Génération d'abord : une lecture en cours qui stocke ensuite retire son entrée
+            self.client.incr(self.generation_key)
+            self.client.delete(*names)
+
+    def clear(self):
+        self.client.incr(self.generation_key)
+        names = list(self.client.scan_iter(match=self.prefix + "*"))
+        if names:
+            self.client.delete(*names)
+
+    def __len__(self):
+        return 0
+
+
+_redis = None
+
+
+def _redis_client():
+    # Dépendance optionnelle, importée seulement si CACHE_BACKEND=redis
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis.from_url(REDIS_URL)
+    return _redis
+
+
+def make_backend(name: str, max_entries: int = MAX_ENTRIES):
+    if BACKEND == "off":
+        return None
+    if BACKEND == "redis":
+        return RedisBackend(name)
+    return MemoryBackend(max_entries)
+
+
+# --- Caches ---
+
+# Modèle -> caches à invalider quand une de ses instances est écrite
+_registry: Dict[type, List["Cache"]] = {}
+
+
+class Cache:
+    """
+    Cache des lignes d'un modèle par la valeur d'une colonne (clé primaire ou unique)
+    """
+
+    def __init__(self, name: str, model, key: str = "id", ttl: float = TTL, negative_ttl: float = NEGATIVE_TTL,
+                 max_entries: int = MAX_ENTRIES, backend=MISSING, topic: str = None, topic_key: str = "id"):
+        self.name = name
+        self.model = model
+        self.key = key
+        # Événements d'outbox (topic, clé = valeur de la colonne topic_key) qui invalident le cache
+        self.topic = topic
+        self.topic_key = topic_key
+        self.key_type = sa_inspect(model).columns[key].type.python_type
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.backend = make_backend(name, max_entries) if backend is MISSING else backend
+        self.columns = [attr.key for attr in sa_inspect(model).column_attrs]
+        self._hits = 0
+        self._lookups = 0
+        _registry.setdefault(model, []).append(self)
+
+    # --- Entrées ---
+
+    def _count(self, result: str, count: int = 1):
+        requests_total.inc(count, cache=self.name, result=result)
+        self._lookups += count
+        if result != "miss":
+            self._hits += count
+        hit_ratio.set(self._hits / self._lookups, cache=self.name)
+
+    def _store(self, key, obj, generation: int):
+        if obj is None:
+            self.backend.set(key, None, self.negative_ttl, generation)
+        else:
+            self.backend.set(key, {name: getattr(obj, name) for name in self.columns}, self.ttl, generation)
+        if isinstance(self.backend, MemoryBackend):
+            entries.set(len(self.backend), cache=self.name)
+
+    def _restore(self, db: Session, values: dict):
+        # Instance détachée portant son identité, rattachée à la session sans requête
+        obj = self.model(**values)
+        make_transient_to_detached(obj)
+        return db.merge(obj, load=False)
+
+    def keys_of(self, obj) -> set:
+        """
+        Clés d'une instance écrite : valeur actuelle et valeur avant modification
+        """
+        history = sa_inspect(obj).attrs[self.key].history
+        return {value for value in itertools.chain(history.added, history.unchanged, history.deleted)
+                if value is not None}
+
+    def apply(self, evt: dict):
+        """
+        Invalide les entrées concernées par un événement d'outbox de son sujet
+        """
+        if self.topic_key != self.key:
+            # Clé de l'événement (identifiant) différente de celle du cache (nom) : tout est vidé
+            self.clear()
+            return
+        try:
+            self.invalidate([self.key_type(evt["key"])])
+        except (TypeError, ValueError):
+            self.clear()
+
+    def invalidate(self, keys: Iterable):
+        keys = list(keys)
+        if self.backend is not None and keys:
+            self.backend.delete(keys)
+            invalidations_total.inc(len(keys), cache=self.name)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+            invalidations_total.inc(cache=self.name)
+
+    # --- Décorateurs ---
+
+    def cached(self, function: Callable):
+        """
+        function(db, key, ...) -> objet ou None ; les appels avec d'autres arguments
+        que leurs valeurs par défaut (?fields=) ne passent pas par le cache
+        """
+        signature = inspect.signature(function)
+        defaults = {name: p.default for name, p in list(signature.parameters.items())[2:]}
+
+        @functools.wraps(function)
+        def wrapper(db, *args, **kwargs):
+            if self.backend is None:
+                return function(db, *args, **kwargs)
+            bound = signature.bind(db, *args, **kwargs)
+            key, *_ = list(bound.arguments.values())[1:]
+            if any(bound.arguments.get(name, default) != default for name, default in defaults.items()):
+                return function(db, *args, **kwargs)
+            value = self.backend.get(key)
+            if value is not MISSING:
+                self._count("hit" if value is not None else "negative_hit")
+                return None if value is None else self._restore(db, value)
+            self._count("miss")
+            # Relevée avant la lecture : une invalidation pendant celle-ci empêche le stockage
+            generation = self.backend.generation()
+            obj = function(db, *args, **kwargs)
+            self._store(key, obj, generation)
+            return obj
+
+        wrapper.cache = self
+        return wrapper
+
+    def cached_many(self, function: Callable):
+        """
+        function(db, keys, ...) -> {clé: objet} ; seules les clés absentes du cache sont lues
+        """
+        signature = inspect.signature(function)
+        defaults = {name: p.default for name, p in list(signature.parameters.items())[2:]}
+
+        @functools.wraps(function)
+        def wrapper(db, keys, *args, **kwargs):
+            if self.backend is None:
+                return function(db, keys, *args, **kwargs)
+            bound = signature.bind(db, keys, *args, **kwargs)
+            if any(bound.arguments.get(name, default) != default for name, default in defaults.items()):
+                return function(db, keys, *args, **kwargs)
+            found, missing, negative = {}, [], 0
+            for key in keys:
+                value = self.backend.get(key)
+                if value is MISSING:
+                    missing.append(key)
+                elif value is None:
+                    negative += 1
+                else:
+                    found[key] = self._restore(db, value)
+            if found:
+                self._count("hit", len(found))
+            if negative:
+                self._count("negative_hit", negative)
+            if missing:
+                self._count("miss", len(missing))
+                generation = self.backend.generation()
+                loaded = function(db, missing, *args, **kwargs)
+                for key in missing:
+                    self._store(key, loaded.get(key), generation)
+                found.update(loaded)
+            return found
+
+        wrapper.cache = self
+        return wrapper
+
+
+def clear_table(table: str):
+    """
+    Vide les caches des modèles projetés sur la table `table` (écritures Core, hors session)
+    """
+    for model, caches in _registry.items():
+        if model.__table__.name == table:
+            for cache in caches:
+                cache.clear()
+
+
+# --- Invalidation par les événements de session ---
+
+def _pending(session: Session) -> dict:
+    return session.info.setdefault("cache_invalidate", {})
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_written(session, flush_context):
+    # Avant la fin du flush, new / dirty / deleted et l'historique des attributs sont encore disponibles
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        for cache in _registry.get(type(obj), ()):
+            keys = _pending(session).setdefault(cache, set())
+            # None : le cache sera vidé en entier
+            if keys is not None:
+                keys.update(cache.keys_of(obj))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk(state):
+    # query.update() / delete() : lignes inconnues, tout le cache du modèle est vidé
+    if (state.is_update or state.is_delete) and state.bind_mapper is not None:
+        for cache in _registry.get(state.bind_mapper.class_, ()):
+            _pending(state.session)[cache] = None
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate(session):
+    pending = session.info.pop("cache_invalidate", None)
+    for cache, keys in (pending or {}).items():
+        if keys is None:
+            cache.clear()
+        else:
+            cache.invalidate(keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop("cache_invalidate", None)
+
+
+# --- Invalidation par l'outbox (autres processus) ---
+
+class OutboxFollower:
+    """
+    Suit l'outbox d'un service et applique ses événements aux caches en mémoire de
+    ses modèles : les écritures des autres processus (réplicas, workers) les invalident
+    """
+
+    def __init__(self, stream, interval: float = SYNC_INTERVAL):
+        self.stream = stream
+        self.interval = interval
+        self.offset = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def caches(self) -> List[Cache]:
+        # Modèles du même service : même metadata que la table d'outbox
+        metadata = self.stream.model.metadata
+        return [cache for model, caches in _registry.items() if model.metadata is metadata
+                for cache in caches if isinstance(cache.backend, MemoryBackend)]
+
+    def sync(self) -> int:
+        """
+        Applique les événements écrits depuis la dernière lecture ; renvoie leur nombre
+        """
+        caches = self.caches()
+        if self.offset is None:
+            # Démarrage : caches vides, seuls les événements à venir comptent
+            self.offset = self.stream.latest_offset()
+            return 0
+        if self.stream.purged_offset() > self.offset:
+            # Événements purgés avant d'être lus : invalidations perdues, tout est vidé
+            for cache in caches:
+                cache.clear()
+            self.offset = self.stream.latest_offset()
+            return 0
+        applied = 0
+        while True:
+            events = self.stream.read(self.offset, limit=SYNC_BATCH)
+            for evt in events:
+                self._apply(caches, evt)
+            applied += len(events)
+            if events:
+                self.offset = events[-1]["offset"]
+            if len(events) < SYNC_BATCH:
+                return applied
+
+    def _apply(self, caches: List[Cache], evt: dict):
+        if evt["topic"] == "bulk":
+            # Import en masse (shared.bulk) : insertions Core, la table est vidée
+            table = (evt.get("payload") or {}).get("table")
+            for cache in caches:
+                if table is None or cache.model.__table__.name == table:
+                    cache.clear()
+            return
+        for cache in caches:
+            if cache.topic == evt["topic"]:
+                cache.apply(evt)
+
+    def start(self):
+        if self.offset is None:
+            self.offset = self.stream.latest_offset()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"cache-sync-{self.stream.service}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("Lecture de l'outbox pour l'invalidation des caches impossible")
+            self._stop.wait(self.interval)
+
+
+def install(app, stream, interval: float = SYNC_INTERVAL):
+    """
+    Invalidation inter-processus des caches en mémoire du service par son outbox
+    (inutile avec Redis, partagé par les réplicas)
+    """
+    follower = OutboxFollower(stream, interval)
+
+    @app.on_event("startup")
+    def start_cache_sync():
+        if BACKEND == "memory":
+            follower.start()
+
+    @app.on_event("shutdown")
+    def stop_cache_sync():
+        follower.stop()
+
+    return follower
@@ -0,0 +1,112 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy import Column, DateTime, Integer, String
+
+def make_etag(*parts) -> str:
+    """
+    ETag fort calculé à partir d'une version (id, updated_at, compteur...), sans sérialiser le corps
+    """
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:24]}"'
+
+
+def http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Comparaison faible pour If-None-Match : W/"x" et "x" sont équivalents
+    candidates = [tag.strip() for tag in header.split(",")]
+    return any(tag.replace("W/", "", 1) == etag for tag in candidates)
+
+
+def _not_modified_since(header: str, last_modified: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # Les dates HTTP ont une précision à la seconde
+    return last_modified.replace(microsecond=0) <= since
+
+
+def _settled(last_modified: datetime) -> bool:
+    # Une date de la seconde en cours peut être suivie d'une autre écriture dans la même
+    # seconde, indiscernable à la précision des dates HTTP : Last-Modified attend la suivante
+    return http_date(last_modified) != http_date(datetime.now(timezone.utc))
+
+
+def not_modified(request: Request, response: Response, etag: str,
+                 last_modified: Optional[datetime] = None) -> Optional[Response]:
+    """
+    Renvoie une réponse 304 si les validateurs du client sont à jour,
+    sinon ajoute ETag / Last-Modified à la réponse et renvoie None
+    """
+    headers = {"ETag": etag}
+    if last_modified is not None and not _settled(last_modified):
+        last_modified = None
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = _etag_matches(if_none_match, etag)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        fresh = bool(if_modified_since and last_modified and _not_modified_since(if_modified_since, last_modified))
+
+    if fresh:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def declare_versions(Base):
+    """
+    Déclare la table collection_versions sur la Base d'un service : un compteur par
+    collection, incrémenté dans la transaction de chaque ajout, modification ou suppression
+    """
+    class CollectionVersion(Base):
+        __tablename__ = "collection_versions"
+
+        name = Column(String, primary_key=True)
+        version = Column(Integer, nullable=False, default=0)
+        # Date de la dernière écriture, suppressions comprises (Last-Modified de la collection)
+        modified_at = Column(DateTime, nullable=False)
+
+    return CollectionVersion
+
+
+def bump(db, model, name: str):
+    """
+    Nouvelle version de la collection, dans la transaction courante (sans commit)
+    """
+    now = datetime.utcnow()
+    updated = db.query(model).filter(model.name == name).update(
+        {model.version: model.version + 1, model.modified_at: now}, synchronize_session=False
+    )
+    if not updated:
+        db.add(model(name=name, version=1, modified_at=now))
+        db.flush()
+
+
+def collection_version(db, model, name: str) -> tuple:
+    """
+    (version, date de la dernière écriture) ; (0, None) avant la première écriture
+    """
+    row = db.query(model.version, model.modified_at).filter(model.name == name).first()
+    return (row.version, row.modified_at) if row is not None else (0, None)
+
+
+def query_key(request: Request) -> str:
+    # Les paramètres de pagination et de filtre font partie de la représentation
+    return str(request.query_params)
@@ -0,0 +1,27 @@
+import os
+
+_loaded = False
+
+
+def load_env():
+    """
+    Charge le fichier .env une seule fois par processus, quel que soit le
+    nombre de modules qui l'appellent (et en mode monolithe, de services)
+    """
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    from dotenv import find_dotenv, load_dotenv
+    # Recherche depuis le répertoire courant (celui du service) vers les parents ;
+    # les variables déjà présentes dans l'environnement restent prioritaires
+    load_dotenv(find_dotenv(usecwd=True))
+
+
+def data_dir(module_file: str, name: str) -> str:
+    """
+    Répertoire de données <service>/data/<name>, à côté du module qui l'utilise
+    (module_file : son __file__) et non relatif au répertoire courant ; en mode
+    monolithe, chaque service garde le sien
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(module_file)), "data", name)
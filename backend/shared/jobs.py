@@ -0,0 +1,610 @@
+"""
+Tâches de fond durables : effets de bord lents (e-mails, validations réseau,
+republication d'instantanés, recalculs) exécutés hors de la requête.
+
+    JOBS = jobs.JobQueue("contact", models.Job)
+
+    @JOBS.task("notify_contact")
+    def notify_contact(db, payload): ...
+
+    JOBS.enqueue(db, "notify_contact", {...}, key=f"notify:{ingest_id}")
+    db.commit()
+
+Une tâche est une ligne de la table jobs de la base du service, ajoutée à la
+session de l'appelant : elle est validée avec l'écriture qui l'a provoquée,
+jamais l'une sans l'autre. Un thread répartiteur réserve les tâches dues et
+les confie au pool (JOBS_POOL=thread, ou process pour le travail CPU) de
+JOBS_WORKERS exécutants ; un processus exécutant réimporte le module qui a
+créé la file et ouvre sa propre connexion. Échec : nouvel essai avec
+attente exponentielle jusqu'à max_attempts, puis statut failed (Permanent :
+échec immédiat).
+Une tâche réservée par un processus arrêté en cours de route est reprise
+après JOBS_LEASE_SECONDS : exécution au moins une fois, les tâches doivent
+être idempotentes. Tant qu'elle s'exécute, son bail est prolongé par le
+répartiteur (battement tous les tiers de bail) ; une tâche reprise par un
+autre exécutant (bail perdu) n'est plus marquée terminée par le premier.
+
+Clé d'idempotence (key) : une seconde mise en file avec la même clé renvoie
+la tâche existante. coalesce=True : pas de nouvelle tâche si une tâche du
+même type attend déjà (republier un instantané une fois suffit). Une tâche
+exclusive (exclusive=True) ne s'exécute pas en parallèle d'une autre du même
+type, quel que soit le processus qui l'a réservée.
+
+    cd backend && python -m shared.jobs status              # tous les services
+    cd backend && python -m shared.jobs retry contact       # relancer les tâches failed
+"""
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+from sqlalchemy import Column, DateTime, Integer, String, Text, and_, event, exists, func, inspect, or_, text
+from sqlalchemy.orm import Session, aliased
+
+from shared import metrics
+
+logger = logging.getLogger("mindgraphix.jobs")
+
+POOL = os.getenv("JOBS_POOL", "thread")
+WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "1.0"))
+MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "5"))
+BACKOFF_BASE = float(os.getenv("JOBS_BACKOFF_BASE", "2.0"))
+BACKOFF_MAX = float(os.getenv("JOBS_BACKOFF_MAX", "600"))
+LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", "300"))
+# Tâches terminées conservées (clés d'idempotence comprises) avant purge
+RETENTION_DAYS = float(os.getenv("JOBS_RETENTION_DAYS", "7"))
+PURGE_INTERVAL = 600
+# Clés d'idempotence par requête IN (sous la limite de variables de SQLite)
+KEYS_PER_QUERY = 500
+MAX_ERROR = 2000
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Services ayant une file de tâches : nom -> (répertoire, préfixe de DATABASE_URL en mode monolithe)
+SERVICES = {
+    "users": ("user-service", "USER"),
+    "projects": ("project-service", "PROJECT"),
+    "services": ("service-service", "SERVICE"),
+    "contact": ("contact-service", "CONTACT"),
+}
+
+enqueued_total = metrics.registry.counter(
+    "jobs_enqueued_total", "Tâches mises en file"
+)
+completed_total = metrics.registry.counter(
+    "jobs_completed_total", "Exécutions de tâches (result=done, retry, failed)"
+)
+queue_depth = metrics.registry.gauge(
+    "jobs_queue_depth", "Tâches par statut dans la file du service"
+)
+wait_seconds = metrics.registry.histogram(
+    "jobs_wait_seconds", "Attente entre l'échéance d'une tâche et le début de son exécution",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+)
+run_seconds = metrics.registry.histogram(
+    "jobs_run_seconds", "Durée d'exécution d'une tâche",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+)
+
+
+def declare_jobs(Base):
+    """
+    Déclare la table jobs sur la Base d'un service
+    """
+    class Job(Base):
+        __tablename__ = "jobs"
+
+        id = Column(Integer, primary_key=True, autoincrement=True)
+        task = Column(String, nullable=False)
+        payload = Column(Text, nullable=True)
+        idempotency_key = Column(String, unique=True, nullable=True)
+        status = Column(String, nullable=False, default=PENDING, index=True)
+        attempts = Column(Integer, nullable=False, default=0)
+        max_attempts = Column(Integer, nullable=False, default=MAX_ATTEMPTS)
+        # Échéance : date de création, puis date du prochain essai
+        run_at = Column(DateTime, nullable=False, index=True)
+        lease_expires_at = Column(DateTime, nullable=True)
+        # Exécutant titulaire du bail (hôte:pid:file)
+        locked_by = Column(String, nullable=True)
+        created_at = Column(DateTime, default=func.now())
+        started_at = Column(DateTime, nullable=True)
+        finished_at = Column(DateTime, nullable=True)
+        last_error = Column(Text, nullable=True)
+
+    return Job
+
+
+def upgrade_schema(engine, Job):
+    """
+    create_all ne modifie pas une table existante : ajoute locked_by aux tables
+    jobs créées avant son introduction
+    """
+    columns = {column["name"] for column in inspect(engine).get_columns(Job.__tablename__)}
+    if "locked_by" not in columns:
+        with engine.begin() as connection:
+            connection.execute(text(f"ALTER TABLE {Job.__tablename__} ADD COLUMN locked_by VARCHAR"))
+
+
+class JobStatus(BaseModel):
+    id: int
+    task: str
+    status: str
+    attempts: int
+    max_attempts: int
+    run_at: datetime
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+
+class Permanent(Exception):
+    """
+    Échec définitif : la tâche passe en failed sans nouvel essai
+    """
+
+
+def backoff(attempts: int) -> float:
+    """
+    Attente avant l'essai suivant : exponentielle bornée, avec gigue
+    """
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+
+
+def _added(db: Session) -> dict:
+    return db.info.setdefault("jobs_added", {})
+
+
+# Files du processus par nom, pour les exécutants du pool de processus
+_queues: Dict[str, "JobQueue"] = {}
+
+
+class JobQueue:
+    """
+    File de tâches d'un service : types de tâches, mise en file, répartiteur et pool d'exécutants
+    """
+
+    def __init__(self, service: str, model, workers: int = WORKERS, pool: str = POOL,
+                 poll_interval: float = POLL_INTERVAL):
+        self.service = service
+        self.model = model
+        self.workers = workers
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self.session_factory = None
+        self._tasks: Dict[str, tuple] = {}
+        self._exclusive = set()
+        # Module qui crée la file (et déclare ses tâches), réimporté par les exécutants du pool de processus
+        caller = sys._getframe(1).f_globals
+        self._module = (os.path.dirname(os.path.abspath(caller["__file__"])), caller["__name__"].rsplit(".", 1)[-1])
+        self._wakeup = threading.Condition()
+        self._woken = False
+        self._slots = threading.Semaphore(workers)
+        self._stopping = False
+        self._thread = None
+        self._workers = None
+        self._executor = None
+        self._last_purge = 0.0
+        self.worker_id = None
+        # Tâches en cours dans ce processus, dont le bail est à prolonger
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self._last_renewal = 0.0
+        _queues[service] = self
+
+    # --- Déclaration et mise en file ---
+
+    def task(self, name: str, max_attempts: int = MAX_ATTEMPTS, exclusive: bool = False):
+        """
+        Décorateur : function(db, payload) exécutée pour chaque tâche `name`
+        """
+        def register(function: Callable):
+            self._tasks[name] = (function, max_attempts)
+            if exclusive:
+                self._exclusive.add(name)
+            return function
+        return register
+
+    def enqueue(self, db: Session, task: str, payload: dict = None, key: str = None,
+                coalesce: bool = False, delay: float = 0):
+        """
+        Ajoute une tâche à la session courante (validée par l'appelant) ; renvoie la
+        tâche existante pour une clé déjà connue, ou la tâche en attente si coalescée
+        """
+        if task not in self._tasks:
+            raise KeyError(f"Tâche inconnue: {task}")
+        Job = self.model
+        added = _added(db)
+        if key is not None:
+            existing = added.get((Job, "key", key)) or db.query(Job).filter(Job.idempotency_key == key).first()
+            if existing is not None:
+                return existing
+        if coalesce:
+            waiting = added.get((Job, "task", task)) or db.query(Job).filter(
+                Job.task == task, Job.status == PENDING, Job.attempts == 0).first()
+            if waiting is not None:
+                return waiting
+        return self._add(db, task, payload, key, delay)
+
+    def enqueue_many(self, db: Session, task: str, items: list, delay: float = 0) -> list:
+        """
+        enqueue() d'un lot de (payload, clé) : les clés déjà connues sont cherchées
+        en une requête par tranche de KEYS_PER_QUERY, pas une par tâche
+        """
+        if task not in self._tasks:
+            raise KeyError(f"Tâche inconnue: {task}")
+        Job = self.model
+        added = _added(db)
+        keys = [key for _, key in items if key is not None and (Job, "key", key) not in added]
+        known = {}
+        for start in range(0, len(keys), KEYS_PER_QUERY):
+            chunk = keys[start:start + KEYS_PER_QUERY]
+            known.update((job.idempotency_key, job) for job in db.query(Job).filter(Job.idempotency_key.in_(chunk)))
+        result = []
+        for payload, key in items:
+            existing = None if key is None else added.get((Job, "key", key)) or known.get(key)
+            result.append(existing if existing is not None else self._add(db, task, payload, key, delay))
+        return result
+
+    def _add(self, db: Session, task: str, payload: Optional[dict], key: Optional[str], delay: float):
+        Job = self.model
+        job = Job(
+            task=task,
+            payload=json.dumps(payload, default=str) if payload is not None else None,
+            idempotency_key=key,
+            status=PENDING,
+            attempts=0,
+            max_attempts=self._tasks[task][1],
+            run_at=datetime.utcnow() + timedelta(seconds=delay),
+        )
+        db.add(job)
+        # Tâches ajoutées par la transaction en cours, par clé et par type : sans parcours de db.new
+        added = _added(db)
+        added.setdefault((Job, "task", task), job)
+        if key is not None:
+            added[(Job, "key", key)] = job
+        # Réveil du répartiteur à la validation de la transaction
+        db.info.setdefault("jobs_enqueued", set()).add(self)
+        enqueued_total.inc(service=self.service, task=task)
+        return job
+
+    def notify(self):
+        with self._wakeup:
+            self._woken = True
+            self._wakeup.notify()
+
+    def get(self, db: Session, job_id: int):
+        return db.query(self.model).filter(self.model.id == job_id).first()
+
+    # --- Répartiteur ---
+
+    def start(self, session_factory):
+        self.session_factory = session_factory
+        self._stopping = False
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._workers = ThreadPoolExecutor(self.workers, thread_name_prefix=f"jobs-{self.service}")
+        if self.pool == "process":
+            # spawn plutôt que fork : un fork copierait les verrous (SQLite, métriques) tenus par d'autres threads
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_process,
+                initargs=(self.service, *self._module, session_factory.kw["bind"].url.render_as_string(hide_password=False)),
+            )
+        self._thread = threading.Thread(target=self._run, name=f"jobs-{self.service}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        # Attend la fin des tâches en cours (leur bail couvre un arrêt brutal)
+        if self._workers is not None:
+            self._workers.shutdown()
+            self._workers = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _run(self):
+        while not self._stopping:
+            self._renew_leases()
+            if not self._slots.acquire(timeout=self.poll_interval):
+                continue
+            try:
+                job = self._claim()
+            except Exception:
+                logger.exception("Réservation d'une tâche impossible (%s)", self.service)
+                job = None
+            if job is None:
+                self._slots.release()
+                self._maintain()
+                with self._wakeup:
+                    # Une validation survenue pendant la réservation n'attend pas le prochain tour
+                    if not self._woken and not self._stopping:
+                        self._wakeup.wait(self.poll_interval)
+                    self._woken = False
+                continue
+            try:
+                self._workers.submit(self._execute, *job)
+            except RuntimeError:
+                # Interpréteur en cours d'arrêt sans stop() : la tâche sera reprise à l'expiration du bail
+                self._slots.release()
+                return
+
+    def _claimable(self, now: datetime):
+        # Due, ou réservée par un exécutant dont le bail a expiré
+        Job = self.model
+        due = or_(
+            and_(Job.status == PENDING, Job.run_at <= now),
+            and_(Job.status == RUNNING, Job.lease_expires_at < now),
+        )
+        if not self._exclusive:
+            return due
+        running = aliased(Job)
+        busy = exists().where(running.task == Job.task, running.status == RUNNING, running.lease_expires_at >= now)
+        return and_(due, or_(Job.task.notin_(self._exclusive), ~busy))
+
+    def _claim(self):
+        """
+        Réserve la prochaine tâche due (ou dont le bail a expiré) ; (id, tâche, payload, essai, essais max)
+        """
+        Job = self.model
+        db = self.session_factory()
+        try:
+            while True:
+                now = datetime.utcnow()
+                candidate = db.query(
+                    Job.id, Job.task, Job.payload, Job.attempts, Job.max_attempts, Job.status, Job.run_at
+                ).filter(self._claimable(now)).order_by(Job.run_at, Job.id).first()
+                if candidate is None:
+                    return None
+                job_id, task, payload, attempts, max_attempts, job_status, run_at = candidate
+                # Réservation conditionnelle : un seul processus l'emporte
+                claimed = db.query(Job).filter(
+                    Job.id == job_id, Job.status == job_status, Job.attempts == attempts, self._claimable(now)
+                ).update({
+                    Job.status: RUNNING,
+                    Job.attempts: attempts + 1,
+                    Job.started_at: now,
+                    Job.lease_expires_at: now + timedelta(seconds=LEASE_SECONDS),
+                    Job.locked_by: self.worker_id,
+                }, synchronize_session=False)
+                db.commit()
+                if claimed:
+                    with self._running_lock:
+                        self._running.add(job_id)
+                    wait_seconds.observe(max(0.0, (now - run_at).total_seconds()), service=self.service, task=task)
+                    return job_id, task, payload, attempts + 1, max_attempts
+        finally:
+            db.close()
+
+    def _renew_leases(self):
+        """
+        Battement : prolonge le bail des tâches en cours de ce processus, tous les tiers de bail
+        """
+        if time.monotonic() - self._last_renewal < LEASE_SECONDS / 3:
+            return
+        self._last_renewal = time.monotonic()
+        with self._running_lock:
+            running = list(self._running)
+        if not running:
+            return
+        Job = self.model
+        db = self.session_factory()
+        try:
+            renewed = db.query(Job).filter(
+                Job.id.in_(running), Job.status == RUNNING, Job.locked_by == self.worker_id
+            ).update({Job.lease_expires_at: datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)},
+                     synchronize_session=False)
+            db.commit()
+            if renewed < len(running):
+                logger.warning("Bail perdu pour %d tâche(s) en cours (%s)", len(running) - renewed, self.service)
+        except Exception:
+            logger.exception("Prolongation des baux impossible (%s)", self.service)
+        finally:
+            db.close()
+
+    def _execute(self, job_id: int, task: str, payload: Optional[str], attempt: int, max_attempts: int):
+        started = time.perf_counter()
+        try:
+            if self._executor is not None:
+                self._executor.submit(_run_in_process, self.service, task, payload).result()
+            else:
+                run_task(self, task, payload)
+        except Exception as exc:
+            retry = not isinstance(exc, Permanent) and attempt < max_attempts
+            self._finish(job_id, PENDING if retry else FAILED, f"{type(exc).__name__}: {exc}",
+                         backoff(attempt) if retry else None)
+            completed_total.inc(service=self.service, task=task, result="retry" if retry else "failed")
+            logger.warning("Tâche %s #%d (%s) en échec, essai %d%s : %s", task, job_id, self.service, attempt,
+                           "" if retry else ", abandonnée", exc)
+        else:
+            self._finish(job_id, DONE)
+            completed_total.inc(service=self.service, task=task, result="done")
+        finally:
+            with self._running_lock:
+                self._running.discard(job_id)
+            run_seconds.observe(time.perf_counter() - started, service=self.service, task=task)
+            self._slots.release()
+
+    def _finish(self, job_id: int, status: str, error: str = None, retry_in: float = None):
+        Job = self.model
+        now = datetime.utcnow()
+        values = {Job.status: status, Job.lease_expires_at: None, Job.locked_by: None,
+                  Job.last_error: error[:MAX_ERROR] if error else None}
+        if retry_in is not None:
+            values[Job.run_at] = now + timedelta(seconds=retry_in)
+        else:
+            values[Job.finished_at] = now
+        db = self.session_factory()
+        try:
+            # Seul le titulaire du bail conclut : une tâche reprise ailleurs garde l'état de son nouvel exécutant
+            finished = db.query(Job).filter(
+                Job.id == job_id, Job.status == RUNNING, Job.locked_by == self.worker_id
+            ).update(values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        if not finished:
+            logger.warning("Tâche #%d (%s) reprise par un autre exécutant, résultat ignoré", job_id, self.service)
+        return bool(finished)
+
+    def _maintain(self):
+        # File vide : profondeur par statut, et purge périodique des tâches terminées
+        Job = self.model
+        db = self.session_factory()
+        try:
+            counts = dict(db.query(Job.status, func.count(Job.id)).group_by(Job.status))
+            for job_status in (PENDING, RUNNING, DONE, FAILED):
+                queue_depth.set(counts.get(job_status, 0), service=self.service, status=job_status)
+            if time.monotonic() - self._last_purge >= PURGE_INTERVAL:
+                self._last_purge = time.monotonic()
+                cutoff = datetime.utcnow() - timedelta(days=RETENTION_DAYS)
+                db.query(Job).filter(Job.status == DONE, Job.finished_at < cutoff).delete(synchronize_session=False)
+                db.commit()
+        except Exception:
+            logger.exception("Maintenance de la file impossible (%s)", self.service)
+        finally:
+            db.close()
+
+
+def run_task(queue: JobQueue, task: str, payload: Optional[str]):
+    if task not in queue._tasks:
+        raise Permanent(f"Tâche inconnue: {task}")
+    function, _ = queue._tasks[task]
+    db = queue.session_factory()
+    try:
+        function(db, json.loads(payload) if payload else {})
+    finally:
+        db.close()
+
+
+def _init_process(service: str, directory: str, module: str, database_url: str):
+    # Même disposition qu'un service lancé seul : ses modules sont importables directement
+    os.environ["DATABASE_URL"] = database_url
+    sys.path[:0] = [directory, BACKEND_DIR]
+    importlib.import_module(module)
+    _queues[service].session_factory = importlib.import_module("database").SessionLocal
+
+
+def _run_in_process(service: str, task: str, payload: Optional[str]):
+    try:
+        run_task(_queues[service], task, payload)
+    except Permanent:
+        raise
+    except Exception as exc:
+        # L'exception doit revenir au parent : elle est réduite à son message
+        raise RuntimeError(f"{type(exc).__name__}: {exc}") from None
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_dispatchers(session):
+    # Tâches validées : désormais trouvées par requête
+    session.info.pop("jobs_added", None)
+    for queue in session.info.pop("jobs_enqueued", ()):
+        queue.notify()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop("jobs_added", None)
+    session.info.pop("jobs_enqueued", None)
+
+
+def install(app: FastAPI, queue: JobQueue, session_factory, path: str = "/jobs"):
+    """
+    Démarre la file avec le service et ajoute GET /jobs/{job_id} (suivi d'une tâche acceptée en 202)
+    """
+    @app.on_event("startup")
+    def start_job_queue():
+        upgrade_schema(session_factory.kw["bind"], queue.model)
+        queue.start(session_factory)
+
+    @app.on_event("shutdown")
+    def stop_job_queue():
+        queue.stop()
+
+    @app.get(path + "/{job_id}", response_model=JobStatus)
+    def read_job(job_id: int):
+        db = session_factory()
+        try:
+            job = queue.get(db, job_id)
+        finally:
+            db.close()
+        if job is None:
+            raise HTTPException(status_code=404, detail="Tâche non trouvée")
+        return job
+
+
+# --- Suivi en ligne de commande ---
+
+def _here(command: str):
+    # Exécuté dans le répertoire d'un service : ses modules sont importables directement
+    sys.path.insert(0, os.getcwd())
+    from database import SessionLocal, engine
+    import models
+
+    models.Base.metadata.create_all(bind=engine)
+    Job = models.Job
+    upgrade_schema(engine, Job)
+    db = SessionLocal()
+    try:
+        if command == "retry":
+            retried = db.query(Job).filter(Job.status == FAILED).update({
+                Job.status: PENDING, Job.attempts: 0, Job.run_at: datetime.utcnow(), Job.last_error: None,
+            }, synchronize_session=False)
+            db.commit()
+            print(f"{retried} tâche(s) relancée(s)")
+            return
+        rows = db.query(Job.task, Job.status, func.count(Job.id)).group_by(Job.task, Job.status).order_by(Job.task)
+        for task, job_status, count in rows:
+            print(f"{task:<24} {job_status:<8} {count}")
+        for job in db.query(Job).filter(Job.status == FAILED).order_by(Job.id.desc()).limit(10):
+            print(f"  #{job.id} {job.task} ({job.attempts} essais) : {(job.last_error or '').splitlines()[0][:120]}")
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] in (["status-here"], ["retry-here"]):
+        _here(argv[0][:-len("-here")])
+        return 0
+    if argv[:1] not in (["status"], ["retry"]) or any(name not in SERVICES for name in argv[1:]):
+        print(__doc__)
+        return 2
+    status = 0
+    for name in argv[1:] or SERVICES:
+        directory, prefix = SERVICES[name]
+        env = dict(os.environ, PYTHONPATH=BACKEND_DIR)
+        if os.getenv(f"{prefix}_DATABASE_URL"):
+            env["DATABASE_URL"] = os.environ[f"{prefix}_DATABASE_URL"]
+        print(f"[{name}]", flush=True)
+        # Un processus par service : leurs modules portent les mêmes noms
+        status |= subprocess.call([sys.executable, "-m", "shared.jobs", f"{argv[0]}-here"],
+                                  cwd=os.path.join(BACKEND_DIR, directory), env=env)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""
+Surveillance du retard de la boucle asyncio.
+
+Un appel bloquant dans un handler async (SQLAlchemy synchrone, bcrypt...)
+immobilise la boucle : toutes les requêtes concurrentes du processus
+attendent. Une tâche se réveille toutes les LOOPLAG_INTERVAL_MS et mesure
+son retard (métrique event_loop_lag_seconds) ; un thread de garde relève la
+pile de la boucle dès qu'elle reste bloquée plus de LOOPLAG_THRESHOLD_MS,
+journalisée avec la durée totale du blocage.
+
+Mode strict (LOOPLAG_STRICT=1, pour les tests) : chaque requête HTTP est
+chronométrée tranche par tranche sur la boucle ; une tranche synchrone plus
+longue que LOOPLAG_BUDGET_MS fait échouer la requête (LoopBlocked, réponse
+500) ; les réponses sont retenues en mémoire jusqu'à la fin du traitement.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from fastapi import FastAPI
+
+from shared import metrics
+
+logger = logging.getLogger("mindgraphix.looplag")
+
+INTERVAL = float(os.getenv("LOOPLAG_INTERVAL_MS", "50")) / 1000
+THRESHOLD = float(os.getenv("LOOPLAG_THRESHOLD_MS", "100")) / 1000
+STRICT = os.getenv("LOOPLAG_STRICT", "0") == "1"
+BUDGET = float(os.getenv("LOOPLAG_BUDGET_MS", "50")) / 1000
+# Cadres conservés dans la pile journalisée
+STACK_LIMIT = 30
+
+lag_seconds = metrics.registry.histogram(
+    "event_loop_lag_seconds", "Retard de réveil de la boucle asyncio",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+blocked_total = metrics.registry.counter(
+    "event_loop_blocked_total", "Blocages de la boucle au-delà du seuil"
+)
+
+
+class LoopBlocked(RuntimeError):
+    """
+    Mode strict : un handler a occupé la boucle plus longtemps que le budget
+    """
+
+
+class Monitor:
+    """
+    Tâche de mesure du retard et thread de garde d'une boucle
+    """
+
+    def __init__(self, service: str, interval: float = INTERVAL, threshold: float = THRESHOLD):
+        self.service = service
+        self.interval = interval
+        self.threshold = threshold
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread = None
+        self._task = None
+        self._stop = threading.Event()
+        self._watchdog = None
+        self._last_beat = time.monotonic()
+        self._stack = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = self._loop.create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name=f"looplag-{self.service}", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _tick(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._last_beat = now
+            lag_seconds.observe(lag, service=self.service)
+            stack, self._stack = self._stack, None
+            if lag > self.threshold:
+                blocked_total.inc(service=self.service)
+                logger.warning("Boucle asyncio de %s bloquée %.0f ms%s", self.service, lag * 1000,
+                               f", pile relevée pendant le blocage :\n{stack}" if stack else "")
+
+    def _watch(self):
+        # Pile relevée une seule fois par blocage, pendant qu'il dure
+        captured_for = None
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._last_beat
+            if beat == captured_for or time.monotonic() - beat <= self.interval + self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                self._stack = "".join(traceback.format_stack(frame, limit=STACK_LIMIT))
+                captured_for = beat
+
+
+# Une boucle par processus : en monolithe, le premier service démarré la surveille pour tous
+_monitor: Optional[Monitor] = None
+
+
+def start(service: str):
+    global _monitor
+    if _monitor is None:
+        _monitor = Monitor(service)
+        _monitor.start()
+
+
+def stop(service: str):
+    global _monitor
+    if _monitor is not None and _monitor.service == service:
+        _monitor.stop()
+        _monitor = None
+
+
+# --- Mode strict ---
+
+class _Timed:
+    """
+    Exécute une coroutine en mesurant chacune de ses tranches synchrones sur la boucle
+    """
+
+    def __init__(self, coro):
+        self.coro = coro
+        self.longest = 0.0
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            started = time.perf_counter()
+            try:
+                yielded = self.coro.throw(error) if error is not None else self.coro.send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.longest = max(self.longest, time.perf_counter() - started)
+            try:
+                value, error = (yield yielded), None
+            except BaseException as exc:
+                value, error = None, exc
+
+
+class StrictMiddleware:
+    """
+    Fait échouer une requête dont le traitement a bloqué la boucle plus de `budget` secondes.
+    La réponse est retenue jusqu'à la fin du traitement : LoopBlocked est levée avant
+    tout envoi (500 du serveur, exception remontée par TestClient), jamais après
+    """
+
+    def __init__(self, app, service: str, budget: float = BUDGET):
+        self.app = app
+        self.service = service
+        self.budget = budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        messages = []
+
+        async def buffer(message):
+            messages.append(message)
+
+        timed = _Timed(self.app(scope, receive, buffer))
+        await timed
+        if timed.longest > self.budget:
+            raise LoopBlocked(
+                f"{scope['method']} {scope['path']} ({self.service}) a bloqué la boucle "
+                f"{timed.longest * 1000:.0f} ms (budget {self.budget * 1000:.0f} ms)"
+            )
+        for message in messages:
+            await send(message)
+
+
+def install(app: FastAPI, service: str):
+    """
+    Surveillance de la boucle pendant la vie du service ; mode strict si LOOPLAG_STRICT=1
+    """
+    @app.on_event("startup")
+    async def start_loop_monitor():
+        start(service)
+
+    @app.on_event("shutdown")
+    async def stop_loop_monitor():
+        stop(service)
+
+    if STRICT:
+        app.add_middleware(StrictMiddleware, service=service)
@@ -0,0 +1,133 @@
+"""
+Lectures groupées par identifiant.
+
+GET /projects?ids=3,1,7 résout tous les identifiants avec une requête IN par
+paquet de CHUNK_SIZE, renvoie les objets dans l'ordre demandé et signale les
+absents dans l'en-tête X-Missing-Ids. Batcher regroupe de la même façon les
+lectures unitaires concurrentes (GET /projects/{id}), à la manière d'un
+DataLoader : pendant qu'une requête groupée s'exécute, les identifiants
+demandés entre-temps s'accumulent et partent ensemble dans la suivante.
+"""
+import asyncio
+import itertools
+import os
+from typing import Callable, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException, Response
+from starlette.concurrency import run_in_threadpool
+
+from shared import metrics
+
+MAX_IDS = int(os.getenv("MULTIGET_MAX_IDS", "1000"))
+# Paramètres par requête IN, sous la limite historique de SQLite (999)
+CHUNK_SIZE = 500
+# Attente avant le premier envoi d'un lot (0 : envoi immédiat, regroupement pendant l'exécution)
+BATCH_WINDOW = float(os.getenv("MULTIGET_BATCH_WINDOW_MS", "0")) / 1000
+MISSING_HEADER = "X-Missing-Ids"
+
+batch_sizes = metrics.registry.histogram(
+    "multiget_batch_size", "Identifiants résolus par requête groupée",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500)
+)
+loads_total = metrics.registry.counter(
+    "multiget_loads_total", "Lectures unitaires passées par un regroupeur"
+)
+
+
+def parse_ids(value: str, max_ids: int = MAX_IDS) -> List[int]:
+    """
+    "3,1,7,1" -> [3, 1, 7] : ordre de la requête, doublons retirés
+    """
+    try:
+        ids = list(dict.fromkeys(int(item) for item in value.split(",") if item.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids doit être une liste d'entiers séparés par des virgules")
+    if len(ids) > max_ids:
+        raise HTTPException(status_code=400, detail=f"Au plus {max_ids} identifiants par requête")
+    return ids
+
+
+def chunks(ids: List, size: int = CHUNK_SIZE) -> Iterable[List]:
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def fetch(query, column, ids: List) -> Dict:
+    """
+    {identifiant: objet} pour les identifiants trouvés, une requête IN par paquet
+    """
+    found = {}
+    for chunk in chunks(ids):
+        for obj in query.filter(column.in_(chunk)):
+            found[getattr(obj, column.key)] = obj
+    batch_sizes.observe(len(ids), loader=column.table.name)
+    return found
+
+
+def ordered(found: Dict, ids: List, response: Response) -> List:
+    """
+    Objets dans l'ordre demandé ; les identifiants absents vont dans l'en-tête X-Missing-Ids
+    """
+    missing = [key for key in ids if key not in found]
+    if missing:
+        response.headers[MISSING_HEADER] = ",".join(str(key) for key in missing)
+    return [found[key] for key in ids if key in found]
+
+
+class Batcher:
+    """
+    Regroupe les lectures unitaires concurrentes en une seule requête :
+    load_many(db, ids) -> {identifiant: objet}, exécuté dans le pool de threads
+    """
+
+    def __init__(self, name: str, session_factory, load_many: Callable,
+                 window: float = BATCH_WINDOW, max_batch: int = CHUNK_SIZE):
+        self.name = name
+        self.session_factory = session_factory
+        self.load_many = load_many
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: Dict[object, List[asyncio.Future]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self, key):
+        """
+        Objet de l'identifiant, ou None s'il n'existe pas
+        """
+        loads_total.inc(loader=self.name)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(key, []).append(future)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._dispatch())
+        return await future
+
+    def _query(self, ids: List) -> Dict:
+        db = self.session_factory()
+        try:
+            return self.load_many(db, ids)
+        finally:
+            db.close()
+
+    async def _dispatch(self):
+        try:
+            if self.window:
+                await asyncio.sleep(self.window)
+            # Une seule requête groupée à la fois : les suivantes se remplissent pendant son exécution
+            while self._pending:
+                keys = list(itertools.islice(self._pending, self.max_batch))
+                waiters = {key: self._pending.pop(key) for key in keys}
+                try:
+                    found = await run_in_threadpool(self._query, keys)
+                except Exception as exc:
+                    for futures in waiters.values():
+                        for future in futures:
+                            if not future.done():
+                                future.set_exception(exc)
+                    continue
+                for key, futures in waiters.items():
+                    for future in futures:
+                        # Client parti entre-temps : son attente a été annulée
+                        if not future.done():
+                            future.set_result(found.get(key))
+        finally:
+            self._task = None
@@ -0,0 +1,276 @@
+"""
+Outbox transactionnelle : événements de changement écrits avec les données,
+diffusés en SSE (GET /events, permission view_events) et sur Redis.
+
+Rétention : les événements plus anciens que OUTBOX_RETENTION_HOURS sont
+purgés toutes les OUTBOX_PURGE_INTERVAL secondes ; chaque purge laisse un
+événement ("outbox", "purged") dont la clé est le dernier offset supprimé.
+Reprendre un flux avant cet offset répond 410 : le client doit se
+resynchroniser (relire les données) puis repartir de l'offset courant.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Column, DateTime, Integer, String, Text, event
+from sqlalchemy.sql import func
+from starlette.concurrency import run_in_threadpool
+
+from shared import authz
+
+logger = logging.getLogger("mindgraphix.outbox")
+
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_CHANNEL_PREFIX = os.getenv("OUTBOX_REDIS_CHANNEL_PREFIX", "mindgraphix.events")
+POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))
+RETENTION_HOURS = float(os.getenv("OUTBOX_RETENTION_HOURS", "24"))
+PURGE_INTERVAL = float(os.getenv("OUTBOX_PURGE_INTERVAL", "600"))
+BATCH_SIZE = 200
+PERMISSION = "view_events"
+# Marqueur de purge : topic, action
+PURGED = ("outbox", "purged")
+
+
+def declare_outbox(Base):
+    """
+    Déclare la table outbox_events sur la Base d'un service.
+    L'identifiant auto-incrémenté sert d'offset pour reprendre un flux.
+    """
+    class OutboxEvent(Base):
+        __tablename__ = "outbox_events"
+
+        id = Column(Integer, primary_key=True, autoincrement=True)
+        topic = Column(String, index=True, nullable=False)
+        action = Column(String, nullable=False)
+        key = Column(String, nullable=False)
+        payload = Column(Text, nullable=True)
+        created_at = Column(DateTime, default=func.now())
+
+    return OutboxEvent
+
+
+def record(db, model, topic: str, action: str, key, payload: dict = None):
+    """
+    Ajoute un événement à la session courante : il est validé dans la même
+    transaction que l'écriture qu'il décrit, jamais l'un sans l'autre
+    """
+    db.add(model(
+        topic=topic,
+        action=action,
+        key=str(key),
+        payload=json.dumps(payload, default=str) if payload is not None else None
+    ))
+
+
+def serialize(evt) -> dict:
+    return {
+        "offset": evt.id,
+        "topic": evt.topic,
+        "action": evt.action,
+        "key": evt.key,
+        "payload": json.loads(evt.payload) if evt.payload else None,
+        "created_at": evt.created_at.isoformat() if evt.created_at else None,
+    }
+
+
+class EventStream:
+    """
+    Diffuse les événements de l'outbox d'un service : réveil immédiat après un commit
+    local, interrogation périodique pour les écritures d'autres processus, et
+    publication optionnelle sur Redis
+    """
+
+    def __init__(self, service: str, model, session_factory):
+        self.service = service
+        self.model = model
+        self.session_factory = session_factory
+        self._waiters = set()
+        self._waiters_lock = threading.Lock()
+        self._redis = None
+        self._stop = threading.Event()
+        self._purger = None
+
+        if REDIS_URL:
+            import redis
+            self._redis = redis.Redis.from_url(REDIS_URL)
+
+        event.listen(session_factory, "after_flush", self._collect)
+        event.listen(session_factory, "after_commit", self._committed)
+        event.listen(session_factory, "after_rollback", self._discard)
+
+    # --- Détection des commits contenant des événements ---
+
+    def _collect(self, session, flush_context):
+        # Les identifiants sont connus après le flush ; après le commit les objets sont expirés
+        events = [
+            {"offset": obj.id, "topic": obj.topic, "action": obj.action, "key": obj.key,
+             "payload": json.loads(obj.payload) if obj.payload else None}
+            for obj in session.new if isinstance(obj, self.model)
+        ]
+        if events:
+            session.info.setdefault("outbox_events", []).extend(events)
+
+    def _discard(self, session):
+        session.info.pop("outbox_events", None)
+
+    def _committed(self, session):
+        events = session.info.pop("outbox_events", None)
+        if not events:
+            return
+        self._wake_waiters()
+        if self._redis is not None:
+            channel = f"{REDIS_CHANNEL_PREFIX}.{self.service}"
+            try:
+                for evt in events:
+                    self._redis.publish(channel, json.dumps(evt, default=str))
+            except Exception:
+                # Le flux SSE reste la source fiable : les abonnés Redis peuvent s'y resynchroniser
+                logger.exception("Publication Redis des événements impossible")
+
+    def _wake_waiters(self):
+        with self._waiters_lock:
+            waiters = list(self._waiters)
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(waiter.set)
+
+    # --- Lecture ---
+
+    def read(self, since: int, topics=None, limit: int = BATCH_SIZE):
+        db = self.session_factory()
+        try:
+            query = db.query(self.model).filter(self.model.id > since)
+            if topics:
+                query = query.filter(self.model.topic.in_(topics))
+            return [serialize(evt) for evt in query.order_by(self.model.id).limit(limit).all()]
+        finally:
+            db.close()
+
+    def latest_offset(self) -> int:
+        db = self.session_factory()
+        try:
+            return db.query(func.max(self.model.id)).scalar() or 0
+        finally:
+            db.close()
+
+    # --- Rétention ---
+
+    def purged_offset(self) -> int:
+        """
+        Dernier offset supprimé par la purge (0 si rien n'a été purgé)
+        """
+        db = self.session_factory()
+        try:
+            marker = db.query(self.model.key).filter(
+                self.model.topic == PURGED[0], self.model.action == PURGED[1]
+            ).order_by(self.model.id.desc()).first()
+            return int(marker.key) if marker else 0
+        finally:
+            db.close()
+
+    def purge(self, retention: timedelta = None) -> int:
+        """
+        Supprime les événements plus anciens que la rétention et laisse un marqueur ; renvoie le nombre supprimé
+        """
+        cutoff = datetime.utcnow() - (retention if retention is not None else timedelta(hours=RETENTION_HOURS))
+        db = self.session_factory()
+        try:
+            last = db.query(func.max(self.model.id)).filter(self.model.created_at < cutoff).scalar()
+            if last is None:
+                return 0
+            deleted = db.query(self.model).filter(self.model.id <= last).delete(synchronize_session=False)
+            record(db, self.model, *PURGED, last, {"deleted": deleted})
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    def start(self):
+        self._stop.clear()
+        self._purger = threading.Thread(target=self._purge_periodically, name=f"outbox-{self.service}", daemon=True)
+        self._purger.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._purger is not None:
+            self._purger.join()
+            self._purger = None
+
+    def _purge_periodically(self):
+        while not self._stop.wait(PURGE_INTERVAL):
+            try:
+                deleted = self.purge()
+                if deleted:
+                    logger.info("%d événement(s) purgé(s) de l'outbox (%s)", deleted, self.service)
+            except Exception:
+                logger.exception("Purge de l'outbox impossible (%s)", self.service)
+
+    async def subscribe(self, request: Request, since: int, topics=None):
+        loop = asyncio.get_running_loop()
+        waiter = asyncio.Event()
+        entry = (loop, waiter)
+        with self._waiters_lock:
+            self._waiters.add(entry)
+        try:
+            # Indique au client le délai de reconnexion conseillé
+            yield f"retry: {int(POLL_INTERVAL * 1000)}\n\n"
+            while not await request.is_disconnected():
+                waiter.clear()
+                events = await run_in_threadpool(self.read, since, topics)
+                for evt in events:
+                    since = evt["offset"]
+                    yield f"id: {since}\nevent: {evt['topic']}\ndata: {json.dumps(evt)}\n\n"
+                if len(events) == BATCH_SIZE:
+                    continue
+                try:
+                    await asyncio.wait_for(waiter.wait(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            with self._waiters_lock:
+                self._waiters.discard(entry)
+
+    def response(self, request: Request, since: int = None, topics: str = None) -> StreamingResponse:
+        """
+        Réponse SSE reprenant après l'offset donné (paramètre since ou en-tête Last-Event-ID)
+        """
+        if since is None:
+            last_event_id = request.headers.get("last-event-id")
+            since = int(last_event_id) if last_event_id and last_event_id.isdigit() else self.latest_offset()
+        purged = self.purged_offset()
+        if since < purged:
+            # Événements manquants : reprendre ne suffit plus, le client doit relire les données
+            raise HTTPException(status_code=410, detail=f"Offset {since} purgé (événements supprimés jusqu'à {purged})")
+        topic_list = [topic for topic in topics.split(",") if topic] if topics else None
+        return StreamingResponse(
+            self.subscribe(request, since, topic_list),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+
+remote_permission = authz.require_permission(PERMISSION)
+
+
+def install(app: FastAPI, stream: EventStream, dependency=remote_permission, path: str = "/events"):
+    """
+    Ajoute le flux SSE au service (dependency vérifie la permission view_events)
+    et purge l'outbox périodiquement pendant la vie du service
+    """
+    @app.on_event("startup")
+    def start_outbox_purge():
+        stream.start()
+
+    @app.on_event("shutdown")
+    def stop_outbox_purge():
+        stream.stop()
+
+    @app.get(path)
+    def stream_events(request: Request, since: Optional[int] = None, topics: Optional[str] = None,
+                      access=Depends(dependency)):
+        return stream.response(request, since=since, topics=topics)
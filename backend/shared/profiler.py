@@ -0,0 +1,227 @@
+"""
+Profilage à la demande d'un service en cours d'exécution.
+
+GET /debug/profile?seconds=N, réservé aux détenteurs de la permission
+debug_profile (auth-service) :
+
+- mode=cpu (défaut) : échantillonnage statistique des piles de tous les
+  threads, dont celui de la boucle asyncio, toutes les PROFILE_INTERVAL_MS ;
+  tasks=true ajoute les piles des tâches asyncio suspendues (temps d'attente).
+  Sortie en piles repliées ("thread;f1;f2 N"), prête pour flamegraph.pl ou
+  speedscope.
+- mode=alloc : différence tracemalloc entre le début et la fin de la fenêtre,
+  top N des lignes qui ont le plus alloué.
+
+Le profilage tourne pendant le trafic réel : l'endpoint attend sans bloquer
+la boucle, un seul profil à la fois par processus.
+
+    curl -H "Authorization: Bearer $TOKEN" "localhost:8003/debug/profile?seconds=10" > project.folded
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from shared import authz
+
+PERMISSION = "debug_profile"
+INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+# Profondeur des piles conservées par tracemalloc
+ALLOC_FRAMES = 10
+
+# Fonctions feuilles d'un thread qui attend (sélecteur, verrou, file) : exclues sauf idle=true
+IDLE_LEAVES = {"select", "poll", "epoll", "wait", "_wait", "acquire", "get", "sleep", "accept",
+               "recv", "recv_into", "readinto", "_worker", "serve_forever"}
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_busy = threading.Lock()
+
+
+# --- Autorisation ---
+
+# Dépendance : le porteur du token a la permission debug_profile, vérifié par auth-service
+remote_permission = authz.require_permission(PERMISSION)
+
+
+def check_access(access: dict):
+    """
+    Réponse de GET /users/me/roles -> 403 si la permission manque
+    """
+    authz.check_permission(access, PERMISSION)
+
+
+# --- Échantillonnage des piles ---
+
+def _short(filename: str) -> str:
+    if filename.startswith(BACKEND_DIR):
+        return os.path.relpath(filename, BACKEND_DIR)
+    return "/".join(filename.split(os.sep)[-2:])
+
+
+def _frame_label(code) -> str:
+    filename = _short(code.co_filename)
+    # ";" sépare les cadres dans le format replié (le compte suit le dernier espace)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _stack(frame) -> list:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _task_stack(task) -> list:
+    labels = []
+    for frame in task.get_stack(limit=64):
+        labels.append(_frame_label(frame.f_code))
+    coro = task.get_coro()
+    # Pile la plus profonde de la chaîne d'await (get_stack n'en donne que le premier niveau)
+    awaited = getattr(coro, "cr_await", None)
+    while awaited is not None:
+        frame = getattr(awaited, "cr_frame", None) or getattr(awaited, "gi_frame", None)
+        if frame is not None:
+            labels.append(_frame_label(frame.f_code))
+        awaited = getattr(awaited, "cr_await", None) or getattr(awaited, "gi_yieldfrom", None)
+    return labels
+
+
+class Sampler:
+    """
+    Thread qui relève les piles de tous les threads à intervalle fixe
+    """
+
+    def __init__(self, interval: float = INTERVAL, loop: asyncio.AbstractEventLoop = None,
+                 loop_thread: int = None, tasks: bool = False, idle: bool = False):
+        self.interval = interval
+        self.loop = loop
+        self.loop_thread = loop_thread
+        self.tasks = tasks and loop is not None
+        self.idle = idle
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _thread_name(self, ident: int, names: dict) -> str:
+        if ident == self.loop_thread:
+            return "event-loop"
+        return names.get(ident, f"thread-{ident}").replace(" ", "_").replace(";", ":")
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                labels = _stack(frame)
+                if not self.idle and labels and labels[-1].split(" ", 1)[0] in IDLE_LEAVES and ident != self.loop_thread:
+                    continue
+                self.stacks[";".join([self._thread_name(ident, names)] + labels)] += 1
+            if self.tasks:
+                self._sample_tasks()
+            self.samples += 1
+
+    def _sample_tasks(self):
+        try:
+            tasks = asyncio.all_tasks(self.loop)
+        except RuntimeError:
+            return
+        for task in tasks:
+            labels = _task_stack(task)
+            if labels:
+                name = task.get_name().replace(" ", "_").replace(";", ":")
+                self.stacks[";".join([f"task:{name}"] + labels)] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+async def sample_cpu(seconds: float, tasks: bool = False, idle: bool = False) -> Sampler:
+    sampler = Sampler(loop=asyncio.get_running_loop(), loop_thread=threading.get_ident(), tasks=tasks, idle=idle)
+    sampler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        sampler.stop()
+    return sampler
+
+
+# --- Allocations ---
+
+async def sample_allocations(seconds: float, top: int = 25) -> list:
+    """
+    Lignes dont l'allocation nette a le plus augmenté pendant la fenêtre
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(ALLOC_FRAMES)
+    try:
+        before = tracemalloc.take_snapshot()
+        await asyncio.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+    finally:
+        if started:
+            tracemalloc.stop()
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), "traceback")
+    return [{
+        "size_diff": stat.size_diff,
+        "count_diff": stat.count_diff,
+        "size": stat.size,
+        "count": stat.count,
+        "traceback": [f"{_short(frame.filename)}:{frame.lineno}" for frame in reversed(stat.traceback)],
+    } for stat in diff[:top]]
+
+
+# --- Endpoint ---
+
+def install(app: FastAPI, service: str, dependency=remote_permission, path: str = "/debug/profile"):
+    """
+    Ajoute l'endpoint de profilage au service ; dependency vérifie la permission debug_profile
+    """
+    @app.get(path, include_in_schema=False)
+    async def read_profile(
+        seconds: float = 10,
+        mode: str = "cpu",
+        tasks: bool = False,
+        idle: bool = False,
+        top: int = 25,
+        current_user=Depends(dependency)
+    ):
+        if not 0 < seconds <= MAX_SECONDS:
+            raise HTTPException(status_code=400, detail=f"seconds doit être compris entre 0 et {MAX_SECONDS:g}")
+        if mode not in ("cpu", "alloc"):
+            raise HTTPException(status_code=400, detail="mode doit valoir cpu ou alloc")
+        if not _busy.acquire(blocking=False):
+            raise HTTPException(status_code=409, detail="Un profil est déjà en cours sur ce processus")
+        try:
+            started = time.monotonic()
+            if mode == "alloc":
+                allocations = await sample_allocations(seconds, top)
+                return {"service": service, "seconds": round(time.monotonic() - started, 3), "top": allocations}
+            sampler = await sample_cpu(seconds, tasks=tasks, idle=idle)
+            return PlainTextResponse(sampler.collapsed(), headers={
+                "X-Profile-Service": service,
+                "X-Profile-Samples": str(sampler.samples),
+                "X-Profile-Seconds": f"{time.monotonic() - started:.3f}",
+            })
+        finally:
+            _busy.release()
@@ -0,0 +1,164 @@
+"""
+Tables d'agrégats (rollups) pour les statistiques du tableau de bord.
+
+Chaque écriture met à jour le compteur de son bucket dans la même transaction
+que la donnée ; une statistique se lit donc en O(buckets) au lieu de O(lignes).
+Reconstruction complète depuis les données :
+
+    cd backend && python -m shared.rollup rebuild            # tous les services
+    cd backend && python -m shared.rollup rebuild contact
+"""
+import os
+import subprocess
+import sys
+from typing import List, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import Column, Integer, String
+from sqlalchemy.dialects import postgresql, sqlite
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Services exposant des statistiques : nom -> (répertoire, préfixe de DATABASE_URL en mode monolithe)
+SERVICES = {
+    "auth": ("auth-service", "AUTH"),
+    "projects": ("project-service", "PROJECT"),
+    "services": ("service-service", "SERVICE"),
+    "contact": ("contact-service", "CONTACT"),
+}
+
+
+class StatBucket(BaseModel):
+    bucket: str
+    value: int
+
+
+class StatSeries(BaseModel):
+    metric: str
+    total: int
+    buckets: List[StatBucket] = []
+
+
+def declare_rollup(Base):
+    """
+    Déclare la table rollups sur la Base d'un service : un compteur par (métrique, bucket)
+    """
+    class Rollup(Base):
+        __tablename__ = "rollups"
+
+        metric = Column(String, primary_key=True)
+        bucket = Column(String, primary_key=True)
+        value = Column(Integer, nullable=False, default=0)
+
+    return Rollup
+
+
+# INSERT ... ON CONFLICT DO UPDATE selon le dialecte de la base
+_UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def increment(db, model, metric: str, bucket: str, delta: int = 1):
+    """
+    Ajoute delta au compteur, dans la transaction courante (sans commit)
+    """
+    increment_many(db, model, metric, {bucket: delta})
+
+
+def increment_many(db, model, metric: str, counts: dict):
+    """
+    Une seule instruction atomique pour tous les buckets : deux écritures concurrentes
+    sur un bucket absent ne peuvent pas insérer chacune leur ligne
+    """
+    rows = [{"metric": metric, "bucket": str(bucket), "value": delta} for bucket, delta in counts.items() if delta]
+    if not rows:
+        return
+    upsert = _UPSERTS.get(db.get_bind().dialect.name)
+    if upsert is None:
+        # Autres bases : mise à jour puis insertion, sans garantie face aux écritures concurrentes
+        for row in rows:
+            updated = db.query(model).filter(model.metric == metric, model.bucket == row["bucket"]).update(
+                {model.value: model.value + row["value"]}, synchronize_session=False
+            )
+            if not updated:
+                db.add(model(**row))
+        db.flush()
+        return
+    statement = upsert(model.__table__).values(rows)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[model.__table__.c.metric, model.__table__.c.bucket],
+        set_={"value": model.__table__.c.value + statement.excluded.value},
+    ))
+
+
+def remove_buckets(db, model, metric: str, prefix: str):
+    """
+    Supprime les buckets commençant par prefix (ex. un mois entier de buckets journaliers)
+    """
+    db.query(model).filter(model.metric == metric, model.bucket.startswith(prefix)) \
+        .delete(synchronize_session=False)
+
+
+def series(db, model, metric: str, since: Optional[str] = None, until: Optional[str] = None) -> StatSeries:
+    """
+    Buckets d'une métrique triés, bornés par [since, until] (comparaison des libellés)
+    """
+    query = db.query(model.bucket, model.value).filter(model.metric == metric, model.value != 0)
+    if since is not None:
+        query = query.filter(model.bucket >= since)
+    if until is not None:
+        # "2024-05" doit inclure "2024-05-31" : la borne haute couvre tout le préfixe
+        query = query.filter(model.bucket <= until + "\uffff")
+    buckets = [StatBucket(bucket=bucket, value=value) for bucket, value in query.order_by(model.bucket)]
+    return StatSeries(metric=metric, total=sum(b.value for b in buckets), buckets=buckets)
+
+
+def rebuild(db, model, metric: str, counts: dict):
+    """
+    Remplace tous les buckets d'une métrique par des comptes recalculés, puis valide
+    """
+    db.query(model).filter(model.metric == metric).delete(synchronize_session=False)
+    db.add_all(model(metric=metric, bucket=str(bucket), value=value) for bucket, value in counts.items() if value)
+    db.commit()
+
+
+# --- Reconstruction en ligne de commande ---
+
+def _rebuild_here():
+    # Exécuté dans le répertoire d'un service : ses modules sont importables directement
+    sys.path.insert(0, os.getcwd())
+    from database import SessionLocal, engine
+    import models
+    import crud
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        for metric, total in crud.rebuild_rollups(db).items():
+            print(f"{metric}: {total}")
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["rebuild-here"]:
+        _rebuild_here()
+        return 0
+    if argv[:1] != ["rebuild"] or any(name not in SERVICES for name in argv[1:]):
+        print(__doc__)
+        return 2
+    status = 0
+    for name in argv[1:] or SERVICES:
+        directory, prefix = SERVICES[name]
+        env = dict(os.environ, PYTHONPATH=BACKEND_DIR)
+        if os.getenv(f"{prefix}_DATABASE_URL"):
+            env["DATABASE_URL"] = os.environ[f"{prefix}_DATABASE_URL"]
+        print(f"[{name}]", flush=True)
+        # Un processus par service : leurs modules portent les mêmes noms
+        status |= subprocess.call([sys.executable, "-m", "shared.rollup", "rebuild-here"],
+                                  cwd=os.path.join(BACKEND_DIR, directory), env=env)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+import re
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import text
+
+# Bornes de pagination : la latence d'une requête ne doit pas dépendre
+# de la taille de la table, on refuse donc les pages trop profondes.
+MAX_LIMIT = 50
+MAX_OFFSET = 500
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class SearchHit(BaseModel):
+    type: str
+    id: int
+    score: float
+    fields: Dict[str, Optional[str]] = {}
+    highlights: Dict[str, str] = {}
+
+
+class SearchPage(BaseModel):
+    query: str
+    results: List[SearchHit] = []
+    next_offset: Optional[int] = None
+
+
+def tokenize(query: str) -> List[str]:
+    return [token.lower() for token in _TOKEN_RE.findall(query or "")]
+
+
+def _fts_table(table: str) -> str:
+    return f"{table}_fts"
+
+
+def ensure_fts_index(engine, table: str, columns: List[str]) -> bool:
+    """
+    Crée l'index FTS5 d'une table et les triggers qui le tiennent à jour à chaque écriture
+    """
+    if engine.dialect.name != "sqlite":
+        return False
+
+    fts = _fts_table(table)
+    cols = ", ".join(columns)
+    new_cols = ", ".join(f"new.{col}" for col in columns)
+    old_cols = ", ".join(f"old.{col}" for col in columns)
+
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": fts}
+        ).first()
+
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+            f"{cols}, content='{table}', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END"
+        ))
+
+        # Première création : indexer les lignes déjà présentes
+        if not exists:
+            conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+    return True
+
+
+def _match_expression(tokens: List[str]) -> str:
+    # Chaque terme est cherché en préfixe, tous les termes sont requis
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def _highlight(value: Optional[str], tokens: List[str]) -> Optional[str]:
+    if not value:
+        return None
+    pattern = re.compile(r"\b(" + "|".join(re.escape(t) for t in tokens) + r")\w*", re.IGNORECASE)
+    if not pattern.search(value):
+        return None
+    return pattern.sub(lambda m: f"{HIGHLIGHT_START}{m.group(0)}{HIGHLIGHT_END}", value)
+
+
+def search(db, table: str, columns: List[str], query: str, hit_type: str,
+           extra_columns: List[str] = None, skip: int = 0, limit: int = 20) -> SearchPage:
+    """
+    Recherche classée (bm25) avec correspondance par préfixe, surlignage et pagination
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return SearchPage(query=query)
+
+    skip = max(0, min(skip, MAX_OFFSET))
+    limit = max(1, min(limit, MAX_LIMIT))
+    extra_columns = extra_columns or []
+    selected = ", ".join(f"t.{col}" for col in ["id"] + extra_columns + columns)
+    params = {"limit": limit + 1, "offset": skip}
+
+    if db.bind.dialect.name == "sqlite":
+        fts = _fts_table(table)
+        highlights = ", ".join(
+            f"highlight({fts}, {i}, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}') AS hl_{col}"
+            for i, col in enumerate(columns)
+        )
+        params["match"] = _match_expression(tokens)
+        rows = db.execute(text(
+            f"SELECT {selected}, bm25({fts}) AS rank_score, {highlights} "
+            f"FROM {fts} JOIN {table} t ON t.id = {fts}.rowid "
+            f"WHERE {fts} MATCH :match ORDER BY rank LIMIT :limit OFFSET :offset"
+        ), params).mappings().all()
+    else:
+        # Repli sans FTS5 (PostgreSQL, ...) : filtre LIKE, sans classement
+        clauses = []
+        for i, token in enumerate(tokens):
+            params[f"t{i}"] = f"%{token}%"
+            clauses.append("(" + " OR ".join(f"LOWER(t.{col}) LIKE :t{i}" for col in columns) + ")")
+        rows = db.execute(text(
+            f"SELECT {selected}, 0 AS rank_score FROM {table} t "
+            f"WHERE {' AND '.join(clauses)} ORDER BY t.id LIMIT :limit OFFSET :offset"
+        ), params).mappings().all()
+
+    results = []
+    for row in rows[:limit]:
+        hits = {}
+        for col in columns:
+            marked = row.get(f"hl_{col}") if f"hl_{col}" in row else _highlight(row[col], tokens)
+            if marked and HIGHLIGHT_START in marked:
+                hits[col] = marked
+        results.append(SearchHit(
+            type=hit_type,
+            id=row["id"],
+            # bm25 renvoie un score négatif : plus il est bas, plus le document est pertinent
+            score=-float(row["rank_score"]),
+            fields={col: (None if row[col] is None else str(row[col])) for col in extra_columns + columns},
+            highlights=hits
+        ))
+
+    next_offset = skip + limit if len(rows) > limit and skip + limit <= MAX_OFFSET else None
+    return SearchPage(query=query, results=results, next_offset=next_offset)
@@ -0,0 +1,235 @@
+"""
+Instantanés précompilés et précompressés des collections publiques.
+
+À chaque changement, la collection est sérialisée une fois en JSON puis
+compressée (gzip, et brotli si le module est installé) dans des fichiers
+versionnés ; un pointeur <nom>.current désigne la version servie (noms de
+fichiers relatifs au répertoire : il peut être déplacé ou monté ailleurs). Une lecture
+ne coûte ni SQL, ni ORM, ni sérialisation : le fichier correspondant à
+l'Accept-Encoding du client est envoyé tel quel.
+
+    cd backend && python -m shared.snapshot publish            # tous les services
+    cd backend && python -m shared.snapshot publish services
+"""
+import gzip
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+from datetime import datetime
+from typing import Callable, Dict, NamedTuple, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse
+
+from shared import conditional, config
+
+# Sans SNAPSHOT_DIR : <service>/data/snapshots
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR")
+# Versions conservées sur disque : la précédente reste servable pendant la bascule
+KEEP_VERSIONS = 2
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Services publiant un instantané : nom -> (répertoire, préfixe de DATABASE_URL en mode monolithe)
+SERVICES = {
+    "projects": ("project-service", "PROJECT"),
+    "services": ("service-service", "SERVICE"),
+}
+
+# Suffixe de fichier et d'ETag par Content-Encoding, du plus compact au moins compact
+SUFFIXES = {"br": ".br", "gzip": ".gz", "identity": ""}
+
+
+class Artifact(NamedTuple):
+    version: str
+    built_at: str
+    # Content-Encoding -> nom du fichier dans le répertoire de l'instantané
+    files: Dict[str, str]
+
+
+def _brotli():
+    # Dépendance optionnelle : sans elle, seules les variantes JSON et gzip sont produites
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def _write_atomic(path: str, data: bytes):
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(data)
+    os.replace(f"{path}.tmp", path)
+
+
+def accepted_encodings(header: Optional[str]) -> set:
+    """
+    Encodages acceptés d'après Accept-Encoding (q=0 exclut) ; identity l'est par défaut
+    """
+    accepted, refused = set(), set()
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        (accepted if q > 0 else refused).add(name)
+    if "*" in accepted:
+        accepted.update(encoding for encoding in SUFFIXES if encoding not in refused)
+    if "identity" not in refused and not ("*" in refused and "identity" not in accepted):
+        accepted.add("identity")
+    return accepted
+
+
+class SnapshotStore:
+    """
+    Instantané d'une collection : build(db) renvoie le contenu JSON-sérialisable
+    """
+
+    def __init__(self, name: str, build: Callable, directory: str = None):
+        self.name = name
+        self.build = build
+        # Par défaut, data/snapshots du service qui crée l'instantané
+        self.directory = directory or SNAPSHOT_DIR or config.data_dir(sys._getframe(1).f_globals["__file__"], "snapshots")
+        self._lock = threading.Lock()
+        self._pointer_stat = None
+        self._artifact: Optional[Artifact] = None
+
+    @property
+    def pointer_path(self) -> str:
+        return os.path.join(self.directory, f"{self.name}.current")
+
+    def path(self, artifact: Artifact, encoding: str) -> str:
+        # Les pointeurs d'avant le passage aux noms relatifs contiennent des chemins absolus
+        return os.path.join(self.directory, artifact.files[encoding])
+
+    def publish(self, db) -> Artifact:
+        """
+        Reconstruit l'instantané depuis la base ; sans effet si le contenu n'a pas changé
+        """
+        payload = json.dumps(jsonable_encoder(self.build(db)), ensure_ascii=False, separators=(",", ":"))
+        data = payload.encode("utf-8")
+        version = hashlib.sha1(data).hexdigest()[:24]
+        with self._lock:
+            current = self.current()
+            if current is not None and current.version == version:
+                return current
+            os.makedirs(self.directory, exist_ok=True)
+            base = f"{self.name}-{version}.json"
+            variants = {"identity": data, "gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+            brotli = _brotli()
+            if brotli is not None:
+                variants["br"] = brotli.compress(data, quality=11)
+            files = {}
+            for encoding, content in variants.items():
+                files[encoding] = base + SUFFIXES[encoding]
+                _write_atomic(os.path.join(self.directory, files[encoding]), content)
+            artifact = Artifact(version=version, built_at=datetime.utcnow().isoformat(), files=files)
+            # Bascule atomique : les autres processus voient l'ancienne ou la nouvelle version
+            _write_atomic(self.pointer_path, json.dumps(artifact._asdict()).encode("utf-8"))
+            self._prune(keep={version, current.version if current else version})
+        return artifact
+
+    def _prune(self, keep: set):
+        prefix = f"{self.name}-"
+        for filename in os.listdir(self.directory):
+            if not filename.startswith(prefix) or filename.endswith(".tmp"):
+                continue
+            version = filename[len(prefix):].split(".", 1)[0]
+            if version not in keep:
+                os.remove(os.path.join(self.directory, filename))
+
+    def current(self) -> Optional[Artifact]:
+        """
+        Version publiée, relue seulement quand le pointeur change (un stat par appel)
+        """
+        try:
+            stat = os.stat(self.pointer_path)
+        except FileNotFoundError:
+            return None
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if key != self._pointer_stat:
+            with open(self.pointer_path) as f:
+                self._artifact = Artifact(**json.load(f))
+            self._pointer_stat = key
+        return self._artifact
+
+    def response(self, request: Request, response: Response, session_factory) -> Response:
+        artifact = self.current()
+        if artifact is None or not os.path.exists(self.path(artifact, "identity")):
+            # Premier accès (répertoire vidé, service jamais démarré) : construit une fois
+            db = session_factory()
+            try:
+                artifact = self.publish(db)
+            finally:
+                db.close()
+
+        accepted = accepted_encodings(request.headers.get("accept-encoding"))
+        encoding = next(
+            (name for name in SUFFIXES if name in accepted and name in artifact.files), "identity"
+        )
+        # Une variante encodée est une autre représentation : ETag distinct
+        etag = f'"{artifact.version}{SUFFIXES[encoding].replace(".", "-")}"'
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = "public, no-cache"
+        cached = conditional.not_modified(request, response, etag)
+        if cached is not None:
+            cached.headers.update(response.headers)
+            return cached
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        headers = {key: value for key, value in response.headers.items() if key != "content-length"}
+        return FileResponse(self.path(artifact, encoding), media_type="application/json", headers=headers)
+
+
+# --- Publication en ligne de commande (écritures faites hors des services) ---
+
+def _publish_here():
+    # Exécuté dans le répertoire d'un service : ses modules sont importables directement
+    sys.path.insert(0, os.getcwd())
+    from database import SessionLocal, engine
+    import models
+    import crud
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        artifact = crud.SNAPSHOT.publish(db)
+        print(f"{crud.SNAPSHOT.name}: {artifact.version} ({', '.join(sorted(artifact.files))})")
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["publish-here"]:
+        _publish_here()
+        return 0
+    if argv[:1] != ["publish"] or any(name not in SERVICES for name in argv[1:]):
+        print(__doc__)
+        return 2
+    status = 0
+    for name in argv[1:] or SERVICES:
+        directory, prefix = SERVICES[name]
+        env = dict(os.environ, PYTHONPATH=BACKEND_DIR)
+        if os.getenv(f"{prefix}_DATABASE_URL"):
+            env["DATABASE_URL"] = os.environ[f"{prefix}_DATABASE_URL"]
+        # Un processus par service : leurs modules portent les mêmes noms
+        status |= subprocess.call([sys.executable, "-m", "shared.snapshot", "publish-here"],
+                                  cwd=os.path.join(BACKEND_DIR, directory), env=env)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""
+Champs partiels (?fields=id,title) : seules les colonnes demandées sont lues
+en base (load_only), instanciées et sérialisées.
+"""
+from typing import Iterable, List, Optional
+
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import load_only as _load_only
+
+
+def parse(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """
+    "id,title" -> ["id", "title"] ; None si le paramètre est absent (réponse complète)
+    """
+    if not fields:
+        return None
+    allowed = list(allowed)
+    requested = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in requested if name not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Champs inconnus: {unknown}, valeurs possibles: {allowed}"
+        )
+    return requested or None
+
+
+def load_only(model, fields: List[str], extra: Iterable[str] = ()):
+    """
+    Option de requête limitant le SELECT aux champs demandés (plus ceux dont
+    l'endpoint a besoin, pour l'ETag par exemple) ; les autres colonnes restent différées
+    """
+    names = dict.fromkeys([*fields, *extra])
+    return _load_only(*(getattr(model, name) for name in names))
+
+
+def project(obj, fields: List[str]) -> dict:
+    # Lecture des seuls attributs chargés : aucune colonne différée n'est rechargée
+    if isinstance(obj, dict):
+        return {name: obj[name] for name in fields}
+    return {name: getattr(obj, name) for name in fields}
+
+
+def response(data, response: Response) -> JSONResponse:
+    """
+    Réponse partielle construite directement, sans valider le modèle complet ;
+    les en-têtes déjà posés (ETag, Last-Modified) sont conservés
+    """
+    headers = {key: value for key, value in response.headers.items() if key != "content-length"}
+    return JSONResponse(jsonable_encoder(data), headers=headers)
@@ -0,0 +1,164 @@
+import contextvars
+import json
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from shared import metrics
+
+logger = logging.getLogger("mindgraphix.sql")
+
+# Nombre de répétitions d'une même requête SQL au-delà duquel on signale un N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+# Mode strict : une requête HTTP qui dépasse son budget renvoie une erreur 500
+STRICT = os.getenv("SQL_BUDGET_STRICT", "0") == "1"
+
+queries_total = metrics.registry.counter("db_queries_total", "Requêtes SQL exécutées, par endpoint")
+db_seconds = metrics.registry.histogram("db_time_per_request_seconds", "Temps SQL cumulé par requête HTTP")
+n_plus_one_total = metrics.registry.counter("db_n_plus_one_total", "Requêtes HTTP avec un motif N+1 détecté")
+budget_exceeded_total = metrics.registry.counter("db_query_budget_exceeded_total", "Dépassements du budget de requêtes SQL")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.duration += duration
+        # Les paramètres sont liés séparément : le texte SQL est déjà la « forme » de la requête
+        self.shapes[statement] += 1
+
+    def repeated(self, threshold: int = None):
+        threshold = threshold or N_PLUS_ONE_THRESHOLD
+        return {shape: n for shape, n in self.shapes.items() if n >= threshold}
+
+
+_current = contextvars.ContextVar("sql_request_stats", default=None)
+
+
+def current_stats():
+    return _current.get()
+
+
+def instrument_engine(engine):
+    """
+    Chronomètre chaque requête SQL de l'engine et l'impute à la requête HTTP en cours
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.record(statement, time.perf_counter() - started)
+
+
+def parse_budgets(value: str) -> dict:
+    """
+    "GET /projects=2,GET /roles=6" -> {"GET /projects": 2, "GET /roles": 6}
+    """
+    budgets = {}
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        endpoint, _, limit = item.rpartition("=")
+        budgets[endpoint.strip()] = int(limit)
+    return budgets
+
+
+class SQLProfilingMiddleware:
+    """
+    Compte les requêtes SQL et le temps base de données de chaque requête HTTP,
+    les expose dans l'en-tête Server-Timing et les métriques, et détecte les N+1
+    """
+
+    def __init__(self, app, service: str, budgets: dict = None, strict: bool = None):
+        self.app = app
+        self.service = service
+        self.budgets = budgets if budgets is not None else parse_budgets(os.getenv("SQL_QUERY_BUDGETS"))
+        self.strict = STRICT if strict is None else strict
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        replaced = False
+
+        async def send_wrapper(message):
+            nonlocal replaced
+            if replaced:
+                return
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                endpoint = f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+                violation = self._report(endpoint, stats)
+                if violation and self.strict:
+                    replaced = True
+                    body = json.dumps({"detail": violation}).encode("utf-8")
+                    await send({"type": "http.response.start", "status": 500,
+                                "headers": [(b"content-type", b"application/json"),
+                                            (b"content-length", str(len(body)).encode())]})
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing",
+                                f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries"'.encode()))
+                headers.append((b"x-db-query-count", str(stats.count).encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+
+    def _report(self, endpoint: str, stats: RequestStats):
+        queries_total.inc(stats.count, service=self.service, endpoint=endpoint)
+        db_seconds.observe(stats.duration, service=self.service, endpoint=endpoint)
+
+        repeated = stats.repeated()
+        if repeated:
+            n_plus_one_total.inc(service=self.service, endpoint=endpoint)
+            for shape, count in repeated.items():
+                logger.warning("N+1 probable sur %s : %d exécutions de %s", endpoint, count, " ".join(shape.split())[:200])
+
+        budget = self.budgets.get(endpoint)
+        if budget is not None and stats.count > budget:
+            budget_exceeded_total.inc(service=self.service, endpoint=endpoint)
+            message = f"Budget SQL dépassé pour {endpoint} : {stats.count} requêtes (max {budget})"
+            logger.warning(message)
+            return message
+        return None
+
+
+@contextmanager
+def query_budget(max_queries: int):
+    """
+    Pour les tests : échoue si le bloc exécute plus de max_queries requêtes SQL
+
+        with sqlprofile.query_budget(2):
+            crud.get_user_permissions(db, user_id)
+    """
+    stats = RequestStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+    if stats.count > max_queries:
+        raise QueryBudgetExceeded(f"{stats.count} requêtes SQL exécutées (max {max_queries})")
@@ -0,0 +1,501 @@
+"""
+Traçage distribué : propagation W3C Trace Context (en-tête traceparent) du
+gateway vers les services, spans locaux exportés par lots.
+
+Spans produits : requête HTTP reçue (TracingMiddleware), appel amont du
+gateway (upstream.TracingTransport), vérifications d'authentification (span()),
+requêtes SQL (instrument_engine). La décision d'échantillonnage est prise à
+l'entrée (TRACE_SAMPLE_RATE) puis suivie par tous les services traversés ;
+une requête non échantillonnée propage son contexte sans rien enregistrer.
+Au gateway (edge=True), le traceparent d'un client n'est pas suivi : seul
+son trace_id est repris, l'échantillonnage est décidé localement (un client
+ne peut pas forcer l'enregistrement de toutes ses requêtes).
+
+Export (TRACE_EXPORTER) : file (NDJSON dans TRACE_DIR, par défaut), otlp
+(OTLP/HTTP JSON vers TRACE_OTLP_ENDPOINT) ou none.
+
+    cd backend && python -m shared.tracing collector --port 4318   # collecteur OTLP local
+    cd backend && python -m shared.tracing show                    # traces les plus lentes
+    cd backend && python -m shared.tracing show <trace_id>         # cascade d'une trace
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import urllib.request
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+from shared import config
+
+logger = logging.getLogger("mindgraphix.tracing")
+
+SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+EXPORTER = os.getenv("TRACE_EXPORTER", "file")
+# Répertoire commun à tous les services (chacun tourne depuis son propre dossier),
+# hors des sources : backend/shared/data/traces
+TRACE_DIR = os.getenv("TRACE_DIR", config.data_dir(__file__, "traces"))
+OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+# Spans en attente d'export ; au-delà, les plus anciens sont abandonnés
+MAX_QUEUE = int(os.getenv("TRACE_MAX_QUEUE", "20000"))
+FLUSH_INTERVAL = float(os.getenv("TRACE_FLUSH_INTERVAL", "1.0"))
+# Texte SQL conservé dans un span
+MAX_STATEMENT = 500
+TRACE_ID_HEADER = "X-Trace-Id"
+
+SERVER, CLIENT, INTERNAL = "server", "client", "internal"
+# Codes SpanKind d'OTLP
+OTLP_KINDS = {INTERNAL: 1, SERVER: 2, CLIENT: 3}
+
+
+# --- Contexte ---
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "sampled", "name", "service", "kind",
+                 "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], sampled: bool, name: str = "",
+                 service: str = "", kind: str = INTERNAL):
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.name = name
+        self.service = service
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes: Dict[str, object] = {}
+        self.error = False
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set(self, **attributes):
+        if self.sampled:
+            self.attributes.update(attributes)
+
+    def finish(self):
+        self.end_ns = time.time_ns()
+        if self.sampled:
+            exporter.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "service": self.service,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": "error" if self.error else "ok",
+        }
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def parse_traceparent(value: Optional[str]):
+    """
+    "00-<trace_id>-<parent_id>-<flags>" -> (trace_id, parent_id, sampled), None si invalide
+    """
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or parts[0] == "ff":
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3][:2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1].lower(), parts[2].lower(), bool(flags & 1)
+
+
+def start_span(name: str, kind: str = INTERNAL, service: str = None, parent=None) -> Span:
+    """
+    Span enfant du span courant (ou du contexte parent donné), nouvelle trace sinon
+    """
+    parent = parent if parent is not None else _current.get()
+    if isinstance(parent, Span):
+        return Span(parent.trace_id, parent.span_id, parent.sampled, name,
+                    service or parent.service, kind)
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+        return Span(trace_id, parent_id, sampled, name, service or "", kind)
+    return Span("%032x" % random.getrandbits(128), None, random.random() < SAMPLE_RATE,
+                name, service or "", kind)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Span interne autour d'un bloc ; sans trace échantillonnée en cours, ne coûte rien
+    """
+    parent = _current.get()
+    if parent is None or not parent.sampled:
+        yield None
+        return
+    current = start_span(name, parent=parent)
+    current.set(**attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException:
+        current.error = True
+        raise
+    finally:
+        _current.reset(token)
+        current.finish()
+
+
+# --- Export ---
+
+class Exporter:
+    """
+    File bornée vidée par lots dans un thread : l'export n'est jamais sur le chemin de la requête
+    """
+
+    def __init__(self):
+        self._queue = deque(maxlen=MAX_QUEUE)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def export(self, finished: Span):
+        self._queue.append(finished)
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        batch = []
+        while self._queue:
+            try:
+                batch.append(self._queue.popleft())
+            except IndexError:
+                break
+        if not batch or EXPORTER == "none":
+            return
+        try:
+            if EXPORTER == "otlp":
+                _post_otlp(batch)
+            else:
+                _append_file(batch)
+        except Exception:
+            # Le traçage ne doit jamais gêner le service : le lot est abandonné
+            logger.exception("Échec de l'export de %d span(s)", len(batch))
+
+
+exporter = Exporter()
+
+
+def spans_path(directory: str = None) -> str:
+    return os.path.join(directory or TRACE_DIR, "spans.ndjson")
+
+
+def _append_lines(records: List[dict], path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    data = "".join(json.dumps(record, default=str) + "\n" for record in records).encode("utf-8")
+    # O_APPEND et une seule écriture : les lots de plusieurs processus ne s'entremêlent pas
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+def _append_file(batch: List[Span]):
+    _append_lines([finished.to_dict() for finished in batch], spans_path())
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(batch: List[Span]) -> dict:
+    by_service: Dict[str, list] = {}
+    for finished in batch:
+        by_service.setdefault(finished.service, []).append({
+            "traceId": finished.trace_id,
+            "spanId": finished.span_id,
+            "parentSpanId": finished.parent_id or "",
+            "name": finished.name,
+            "kind": OTLP_KINDS[finished.kind],
+            "startTimeUnixNano": str(finished.start_ns),
+            "endTimeUnixNano": str(finished.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in finished.attributes.items()],
+            "status": {"code": 2 if finished.error else 1},
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+        "scopeSpans": [{"scope": {"name": "mindgraphix"}, "spans": spans}],
+    } for service, spans in by_service.items()]}
+
+
+def _post_otlp(batch: List[Span]):
+    request = urllib.request.Request(
+        OTLP_ENDPOINT, data=json.dumps(to_otlp(batch)).encode("utf-8"),
+        headers={"Content-Type": "application/json"}, method="POST",
+    )
+    urllib.request.urlopen(request, timeout=5).close()
+
+
+# --- Instrumentation ---
+
+class TracingMiddleware:
+    """
+    Span serveur par requête HTTP ; reprend le traceparent reçu ou le span courant
+    (application montée dans le gateway en mode monolithe). edge : point d'entrée
+    public, le traceparent reçu vient d'un client et seul son trace_id est gardé
+    """
+
+    def __init__(self, app, service: str, edge: bool = False):
+        self.app = app
+        self.service = service
+        self.edge = edge
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = None
+        for key, value in scope.get("headers", ()):
+            if key == b"traceparent":
+                header = value.decode("latin-1")
+                break
+        parent = parse_traceparent(header)
+        if parent is not None and self.edge:
+            # Span racine dans la trace du client, échantillonné selon TRACE_SAMPLE_RATE
+            parent = (parent[0], None, random.random() < SAMPLE_RATE)
+        current = start_span(f"{scope['method']} {scope['path']}", SERVER, self.service, parent=parent)
+        current.set(**{"http.method": scope["method"], "http.target": scope["path"]})
+        token = _current.set(current)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                current.set(**{"http.status_code": message["status"]})
+                current.error = message["status"] >= 500
+                if current.sampled:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (TRACE_ID_HEADER.lower().encode(), current.trace_id.encode())
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            current.error = True
+            raise
+        finally:
+            _current.reset(token)
+            current.finish()
+
+
+def instrument_engine(engine, system: str = None):
+    """
+    Un span par requête SQL exécutée pendant une requête HTTP échantillonnée
+    """
+    system = system or engine.dialect.name
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        parent = _current.get()
+        if parent is None or not parent.sampled:
+            conn.info.setdefault("trace_spans", []).append(None)
+            return
+        current = start_span("db.query", CLIENT, parent=parent)
+        current.set(**{"db.system": system, "db.statement": statement[:MAX_STATEMENT]})
+        if executemany:
+            current.set(**{"db.executemany": True})
+        conn.info.setdefault("trace_spans", []).append(current)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        current = conn.info["trace_spans"].pop()
+        if current is not None:
+            current.finish()
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        spans = context.connection.info.get("trace_spans") if context.connection is not None else None
+        if spans:
+            current = spans.pop()
+            if current is not None:
+                current.error = True
+                current.finish()
+
+
+# --- Collecteur local et vue en cascade ---
+
+def _from_otlp_value(value: dict):
+    if "intValue" in value:
+        return int(value["intValue"])
+    return next(iter(value.values()), None)
+
+
+def from_otlp(payload: dict) -> List[dict]:
+    """
+    Requête OTLP/HTTP JSON -> spans au format du fichier local
+    """
+    kinds = {code: name for name, code in OTLP_KINDS.items()}
+    records = []
+    for resource_spans in payload.get("resourceSpans", []):
+        attributes = {item["key"]: item["value"] for item in resource_spans.get("resource", {}).get("attributes", [])}
+        service = attributes.get("service.name", {}).get("stringValue", "")
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for item in scope_spans.get("spans", []):
+                start, end = int(item["startTimeUnixNano"]), int(item["endTimeUnixNano"])
+                records.append({
+                    "trace_id": item["traceId"],
+                    "span_id": item["spanId"],
+                    "parent_id": item.get("parentSpanId") or None,
+                    "name": item["name"],
+                    "service": service,
+                    "kind": kinds.get(item.get("kind"), INTERNAL),
+                    "start_ns": start,
+                    "end_ns": end,
+                    "duration_ms": round((end - start) / 1e6, 3),
+                    "attributes": {attr["key"]: _from_otlp_value(attr["value"])
+                                   for attr in item.get("attributes", [])},
+                    "status": "error" if item.get("status", {}).get("code") == 2 else "ok",
+                })
+    return records
+
+
+def run_collector(port: int, path: str):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/v1/traces":
+                self.send_error(404)
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                records = from_otlp(json.loads(body))
+            except (ValueError, KeyError, TypeError):
+                self.send_error(400)
+                return
+            _append_lines(records, path)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, format, *args):
+            pass
+
+    print(f"Collecteur OTLP sur http://localhost:{port}/v1/traces -> {path}", file=sys.stderr)
+    ThreadingHTTPServer(("0.0.0.0", port), Handler).serve_forever()
+
+
+def load_spans(path: str, trace_id: str = None) -> List[dict]:
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip() and (trace_id is None or f'"{trace_id}"' in line):
+                record = json.loads(line)
+                if trace_id is None or record["trace_id"] == trace_id:
+                    spans.append(record)
+    return spans
+
+
+def waterfall(spans: List[dict], width: int = 48) -> str:
+    """
+    Cascade textuelle d'une trace : décalage, barre, durée, service et nom de chaque span
+    """
+    if not spans:
+        return "Trace introuvable"
+    start = min(record["start_ns"] for record in spans)
+    end = max(record["end_ns"] for record in spans)
+    total = max(end - start, 1)
+    children: Dict[Optional[str], list] = {}
+    ids = {record["span_id"] for record in spans}
+    for record in sorted(spans, key=lambda r: r["start_ns"]):
+        parent = record["parent_id"] if record["parent_id"] in ids else None
+        children.setdefault(parent, []).append(record)
+
+    lines = [f"trace {spans[0]['trace_id']}  {total / 1e6:.1f} ms  {len(spans)} spans"]
+
+    def walk(parent, depth):
+        for record in children.get(parent, []):
+            offset = int((record["start_ns"] - start) / total * width)
+            length = max(1, int((record["end_ns"] - record["start_ns"]) / total * width))
+            bar = " " * offset + "█" * min(length, width - offset)
+            label = record["name"]
+            if "db.statement" in record["attributes"]:
+                label = record["attributes"]["db.statement"].split("\n")[0][:60]
+            flag = " !" if record["status"] == "error" else ""
+            lines.append(f"{(record['start_ns'] - start) / 1e6:8.1f} ms |{bar:<{width}}| "
+                         f"{record['duration_ms']:8.1f} ms  {'  ' * depth}{record['service']}: {label}{flag}")
+            walk(record["span_id"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+def slowest(spans: List[dict], count: int = 20) -> str:
+    roots = [record for record in spans if record["parent_id"] is None]
+    roots.sort(key=lambda r: r["duration_ms"], reverse=True)
+    return "\n".join(f"{record['trace_id']}  {record['duration_ms']:9.1f} ms  {record['service']}: {record['name']}"
+                     for record in roots[:count]) or "Aucune trace"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m shared.tracing", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    collector = commands.add_parser("collector")
+    collector.add_argument("--port", type=int, default=4318)
+    collector.add_argument("--output", default=spans_path())
+    show = commands.add_parser("show")
+    show.add_argument("trace_id", nargs="?")
+    show.add_argument("--file", default=spans_path())
+    args = parser.parse_args(argv)
+
+    if args.command == "collector":
+        run_collector(args.port, args.output)
+        return 0
+    if not os.path.exists(args.file):
+        print(f"{args.file} introuvable", file=sys.stderr)
+        return 1
+    spans = load_spans(args.file, args.trace_id)
+    print(waterfall(spans) if args.trace_id else slowest(spans))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Les services importent leurs modules sans paquet (models, crud...) : ils sont
+chargés comme en mode monolithe (gateway/monolith.py), sous "<service>_service.<module>".
+
+Les répertoires de données (journal d'ingestion, archives, instantanés, audit)
+et les bases du monolithe sont placés dans un répertoire temporaire, fixé
+avant l'import des modules qui lisent leur configuration.
+"""
+import atexit
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GATEWAY_DIR = os.path.join(BACKEND_DIR, "gateway")
+sys.path.insert(0, BACKEND_DIR)
+
+DATA_DIR = tempfile.mkdtemp(prefix="mindgraphix-tests-")
+atexit.register(shutil.rmtree, DATA_DIR, ignore_errors=True)
+os.environ.update(
+    TRACE_EXPORTER="none",
+    CONTACT_LOG_DIR=os.path.join(DATA_DIR, "contact_log"),
+    CONTACT_ARCHIVE_DIR=os.path.join(DATA_DIR, "contact_archive"),
+    SNAPSHOT_DIR=os.path.join(DATA_DIR, "snapshots"),
+    AUDIT_DIR=os.path.join(DATA_DIR, "audit"),
+)
+for prefix in ("AUTH", "USER", "PROJECT", "SERVICE", "CONTACT"):
+    os.environ[f"{prefix}_DATABASE_URL"] = f"sqlite:///{os.path.join(DATA_DIR, prefix.lower() + '.db')}"
+
+
+@pytest.fixture(scope="session")
+def gateway():
+    """
+    Gateway en mode monolithe (les cinq services dans le processus), démarré pour la session :
+    (module main du gateway, TestClient)
+    """
+    from fastapi.testclient import TestClient
+
+    os.environ["GATEWAY_MODE"] = "monolith"
+    subprocess.run([sys.executable, "init_db.py"], cwd=os.path.join(BACKEND_DIR, "auth-service"),
+                   env=dict(os.environ, DATABASE_URL=os.environ["AUTH_DATABASE_URL"]), check=True, capture_output=True)
+    sys.path.insert(0, GATEWAY_DIR)
+    try:
+        spec = importlib.util.spec_from_file_location("gateway_main", os.path.join(GATEWAY_DIR, "main.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(GATEWAY_DIR)
+    with TestClient(module.app) as client:
+        yield module, client
+
+
+def service_modules(name: str, *modules: str) -> dict:
+    """
+    Modules d'un service chargé par le gateway : {"crud": ..., "database": ...}
+    """
+    return {module: sys.modules[f"{name}_service.{module}"] for module in modules}
+
+
+@pytest.fixture(scope="session")
+def auth_service(gateway):
+    """
+    Service d'authentification du monolithe, sur sa base SQLite temporaire initialisée par init_db.py
+    """
+    module, _ = gateway
+    return module.service_apps["auth"], service_modules("auth", "crud", "database", "models", "schemas")
+
+
+@pytest.fixture(scope="session")
+def tokens(gateway, auth_service):
+    """
+    En-têtes Authorization d'un administrateur et d'un utilisateur sans rôle particulier
+    """
+    _, client = gateway
+    _, modules = auth_service
+    crud, database, schemas = modules["crud"], modules["database"], modules["schemas"]
+    db = database.SessionLocal()
+    try:
+        for email in ("admin@example.com", "user@example.com"):
+            crud.create_user(db, schemas.UserCreate(email=email, username=email.split("@")[0],
+                                                    full_name=email, password="secret123"))
+        admin = crud.get_user_by_email(db, "admin@example.com")
+        crud.add_role_to_user(db, admin.id, crud.get_role_by_name(db, "admin").id)
+    finally:
+        db.close()
+
+    def header(email):
+        response = client.post("/api/auth/token", data={"username": email, "password": "secret123"})
+        response.raise_for_status()
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    return {"admin": header("admin@example.com"), "user": header("user@example.com")}
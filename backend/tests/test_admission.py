@@ -0,0 +1,89 @@
+"""
+Compartiments du contrôle d'admission (shared.admission) : ordre de priorité
+de la file, préemption quand elle est pleine, délestage sur le temps d'attente.
+"""
+import asyncio
+
+import pytest
+
+from shared import admission
+from shared.admission import ADMIN, ANONYMOUS, AUTHENTICATED, Bulkhead, Overloaded
+
+
+async def queued(bulkhead, priority, admitted):
+    # Attend un créneau, note l'ordre d'admission puis le rend aussitôt
+    await bulkhead.acquire(priority)
+    admitted.append(priority)
+    bulkhead.release()
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_higher_priority_is_admitted_first():
+    async def scenario():
+        bulkhead = Bulkhead("test", limit=1)
+        await bulkhead.acquire(ADMIN)
+        admitted = []
+        tasks = [asyncio.create_task(queued(bulkhead, priority, admitted))
+                 for priority in (ANONYMOUS, AUTHENTICATED, ADMIN)]
+        await settle()
+        assert len(bulkhead.waiters) == 3
+        bulkhead.release()
+        await asyncio.gather(*tasks)
+        assert admitted == [ADMIN, AUTHENTICATED, ANONYMOUS]
+        assert bulkhead.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_preempts_lower_priority():
+    async def scenario():
+        bulkhead = Bulkhead("test", limit=1, max_queue=1)
+        await bulkhead.acquire(ADMIN)
+        anonymous = asyncio.create_task(bulkhead.acquire(ANONYMOUS))
+        await settle()
+        admin = asyncio.create_task(bulkhead.acquire(ADMIN))
+        await settle()
+        with pytest.raises(Overloaded) as shed:
+            await anonymous
+        assert shed.value.reason == "preempted"
+        # Un arrivant de priorité égale ou moindre ne déloge personne
+        with pytest.raises(Overloaded) as shed:
+            await bulkhead.acquire(AUTHENTICATED)
+        assert shed.value.reason == "queue_full"
+        bulkhead.release()
+        await admin
+        bulkhead.release()
+        assert bulkhead.active == 0 and not bulkhead.waiters
+
+    asyncio.run(scenario())
+
+
+def test_queue_time_sheds(monkeypatch):
+    monkeypatch.setitem(admission.MAX_QUEUE_TIME, ANONYMOUS, 0.05)
+
+    async def scenario():
+        bulkhead = Bulkhead("test", limit=1)
+        await bulkhead.acquire(ADMIN)
+        with pytest.raises(Overloaded) as shed:
+            await bulkhead.acquire(ANONYMOUS)
+        assert shed.value.reason == "queue_time"
+        assert not bulkhead.waiters
+
+        # File déjà plus ancienne que l'attente tolérée : refus sans attendre
+        admin = asyncio.create_task(bulkhead.acquire(ADMIN))
+        await asyncio.sleep(0.06)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        with pytest.raises(Overloaded) as shed:
+            await bulkhead.acquire(ANONYMOUS)
+        assert shed.value.reason == "queue_time"
+        assert loop.time() - started < 0.05
+        bulkhead.release()
+        await admin
+        bulkhead.release()
+
+    asyncio.run(scenario())
@@ -0,0 +1,95 @@
+"""
+Journal d'audit (shared.audit) : tampon plein en mode drop (les plus anciens
+cèdent) ou block (attente bornée), pagination par curseur identique pour la
+base et pour les fichiers.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from shared import audit
+
+Base = declarative_base()
+AuditEvent = audit.declare_audit(Base)
+
+
+class ListSink:
+    def __init__(self):
+        self.written = []
+
+    def write(self, batch):
+        self.written.extend(batch)
+
+
+def test_drop_overwrites_oldest_events():
+    log = audit.AuditLog("test", ListSink(), buffer_size=3, overflow="drop")
+    for i in range(5):
+        log.record(f"action-{i}")
+    log.flush()
+    assert [entry["action"] for entry in log.sink.written] == ["action-2", "action-3", "action-4"]
+
+
+def test_block_waits_for_room_then_gives_up(monkeypatch):
+    monkeypatch.setattr(audit, "BLOCK_TIMEOUT", 0.05)
+    log = audit.AuditLog("test", ListSink(), buffer_size=2, overflow="block")
+    log.record("a")
+    log.record("b")
+    started = time.monotonic()
+    log.record("perdu")
+    assert time.monotonic() - started >= 0.05
+    log.flush()
+    assert [entry["action"] for entry in log.sink.written] == ["a", "b"]
+
+    # De la place libérée pendant l'attente : l'événement est gardé
+    monkeypatch.setattr(audit, "BLOCK_TIMEOUT", 5)
+    log.record("c")
+    log.record("d")
+    threading.Timer(0.05, log.flush).start()
+    log.record("gardé")
+    log.flush()
+    assert [entry["action"] for entry in log.sink.written][2:] == ["c", "d", "gardé"]
+
+
+@pytest.fixture(params=["db", "file"])
+def sink(request, tmp_path):
+    if request.param == "file":
+        yield audit.FileSink(str(tmp_path / "audit"))
+        return
+    engine = create_engine(f"sqlite:///{tmp_path / 'audit.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield audit.DatabaseSink(sessionmaker(bind=engine), AuditEvent)
+    engine.dispose()
+
+
+def entries():
+    # Deux heures, et des horodatages identiques départagés par l'identifiant
+    start = datetime(2024, 5, 1, 9, 50)
+    return [{"id": f"{i:04d}", "occurred_at": start + timedelta(minutes=5 * (i // 2)), "action": "login",
+             "actor": "alice" if i % 3 else "bob", "target": None, "ip": None, "payload": {"i": i} if i else None}
+            for i in range(9)]
+
+
+def walk(log, **filters):
+    ids, cursor = [], None
+    while True:
+        page = log.query(cursor=cursor, limit=2, **filters)
+        ids.extend(entry["id"] for entry in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+def test_cursor_pagination(sink):
+    sink.write(entries())
+    log = audit.AuditLog("test", sink)
+    expected = sorted(entries(), key=lambda e: (e["occurred_at"], e["id"]), reverse=True)
+    assert walk(log) == [e["id"] for e in expected]
+    assert walk(log, actor="bob") == [e["id"] for e in expected if e["actor"] == "bob"]
+    since, until = datetime(2024, 5, 1, 10, 0), datetime(2024, 5, 1, 10, 10)
+    assert walk(log, since=since, until=until) == [e["id"] for e in expected if since <= e["occurred_at"] < until]
+    assert log.query(limit=1)["items"][0]["payload"] == {"i": 8}
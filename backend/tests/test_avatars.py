@@ -0,0 +1,52 @@
+"""
+Vérification des URL d'avatar (user-service/avatars.py) : adresses internes
+refusées, connexion à l'adresse vérifiée (pas de seconde résolution DNS).
+"""
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "user-service"))
+
+import avatars  # noqa: E402
+
+
+@pytest.fixture
+def image_server():
+    hosts = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_HEAD(self):
+            hosts.append(self.headers["Host"])
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address[1], hosts
+    server.shutdown()
+    server.server_close()
+
+
+def test_internal_addresses_are_refused():
+    assert avatars.is_image("http://127.0.0.1/avatar.png") is False
+    assert avatars.is_image("http://localhost/avatar.png") is False
+
+
+def test_connects_to_vetted_address(image_server, monkeypatch):
+    port, hosts = image_server
+    resolved = []
+    # Le nom n'est résolu qu'une fois, à la vérification ; un proxy d'environnement est ignoré
+    monkeypatch.setattr(avatars, "_public_address", lambda host, port: resolved.append(host) or "127.0.0.1")
+    monkeypatch.setenv("http_proxy", "http://127.0.0.1:9")
+    assert avatars.is_image(f"http://avatars.example:{port}/me.png") is True
+    assert resolved == ["avatars.example"]
+    assert hosts == [f"avatars.example:{port}"]
@@ -0,0 +1,85 @@
+"""
+Import en masse (shared.bulk) : reprise après une interruption au dernier
+paquet validé, index et triggers FTS retirés pendant le chargement puis
+reconstruits, même quand la fin a lieu dans un second processus.
+"""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import textwrap
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_DIR = os.path.join(BACKEND_DIR, "project-service")
+
+# Premier import arrêté net après le second paquet validé (chunk-size 2), comme un processus tué
+INTERRUPTED = textwrap.dedent("""
+    import os, sys
+    import crud, database, models
+    from shared import bulk, search
+
+    models.Base.metadata.create_all(bind=database.engine)
+    search.ensure_fts_index(database.engine, "projects", crud.SEARCH_COLUMNS)
+    update = bulk.Progress.update
+
+    def crash(self, rows, offset=None, final=False):
+        update(self, rows, offset, final)
+        if rows >= 4:
+            os._exit(3)
+
+    bulk.Progress.update = crash
+    sys.exit(bulk.main(["import-here", "projects", sys.argv[1], "--chunk-size", "2", "--drop-indexes"]))
+""")
+
+
+def run(args, database_url, **kwargs):
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR, DATABASE_URL=database_url, PROJECT_DATABASE_URL=database_url)
+    return subprocess.run([sys.executable, *args], env=env, capture_output=True, text=True, **kwargs)
+
+
+def schema(conn, kind):
+    return {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = ? AND tbl_name = 'projects'",
+                                           (kind,))}
+
+
+def test_interrupted_import_resumes_and_rebuilds_indexes(tmp_path):
+    source = tmp_path / "projects.ndjson"
+    source.write_text("".join(json.dumps({"title": f"Projet {i}", "description": f"volume{i}"}) + "\n"
+                              for i in range(7)))
+    database = tmp_path / "projects.db"
+    database_url = f"sqlite:///{database}"
+
+    first = run(["-c", INTERRUPTED, str(source)], database_url, cwd=PROJECT_DIR)
+    assert first.returncode == 3, first.stderr
+    conn = sqlite3.connect(database)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM projects").fetchone()[0] == 4
+        offset, rows, done, restore = conn.execute(
+            "SELECT offset, rows, done, restore FROM bulk_checkpoints WHERE dataset = 'projects'").fetchone()
+        assert (rows, done) == (4, 0) and offset > 0
+        # Index secondaire et triggers retirés ; le DDL à rejouer est dans le point de reprise
+        assert "ix_projects_title" not in schema(conn, "index")
+        assert not schema(conn, "trigger")
+        assert len(json.loads(restore)) == 3
+    finally:
+        conn.close()
+
+    second = run(["-m", "shared.bulk", "import", "projects", str(source), "--chunk-size", "2"],
+                 database_url, cwd=BACKEND_DIR)
+    assert second.returncode == 0, second.stderr
+    assert "reprise après 4 lignes" in second.stderr
+    conn = sqlite3.connect(database)
+    try:
+        titles = [title for title, in conn.execute("SELECT title FROM projects ORDER BY id")]
+        assert titles == [f"Projet {i}" for i in range(7)]
+        assert "ix_projects_title" in schema(conn, "index")
+        assert schema(conn, "trigger") == {"projects_fts_ai", "projects_fts_ad", "projects_fts_au"}
+        # Index plein texte reconstruit, lignes de la reprise comprises
+        assert conn.execute("SELECT rowid FROM projects_fts WHERE projects_fts MATCH 'volume6'").fetchall() == [(7,)]
+    finally:
+        conn.close()
+
+    third = run(["-m", "shared.bulk", "import", "projects", str(source)], database_url, cwd=BACKEND_DIR)
+    assert third.returncode == 0
+    assert "déjà importé (7 lignes)" in third.stderr
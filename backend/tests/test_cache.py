@@ -0,0 +1,164 @@
+"""
+Cache en lecture (shared.cache) : invalidation au commit, lecture concurrente
+d'une invalidation non stockée (mémoire et Redis), invalidation des autres
+processus par l'outbox.
+"""
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import Column, Integer, String, create_engine, text
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from shared import cache, outbox
+
+Base = declarative_base()
+OutboxEvent = outbox.declare_outbox(Base)
+
+
+class Item(Base):
+    __tablename__ = "items"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+
+
+class FakeRedis:
+    """
+    Sous-ensemble du client redis utilisé par RedisBackend (sans expiration)
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, name):
+        return self.data.get(name)
+
+    def set(self, name, value, px=None):
+        self.data[name] = value
+
+    def delete(self, *names):
+        for name in names:
+            self.data.pop(name, None)
+
+    def incr(self, name):
+        self.data[name] = str(int(self.data.get(name) or 0) + 1)
+
+    def scan_iter(self, match):
+        return [name for name in self.data if name.startswith(match.rstrip("*"))]
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cache.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    db.add(Item(id=1, name="avant"))
+    db.commit()
+    db.close()
+    yield factory
+    engine.dispose()
+
+
+@pytest.fixture(params=["memory", "redis"])
+def items(request):
+    backend = cache.MemoryBackend() if request.param == "memory" else cache.RedisBackend("items", FakeRedis())
+    items_cache = cache.Cache("items", Item, backend=backend, topic="item")
+    yield items_cache
+    cache._registry[Item].remove(items_cache)
+
+
+@pytest.fixture
+def memory_items():
+    # Seul le stockage en mémoire est propre à un processus
+    items_cache = cache.Cache("items", Item, backend=cache.MemoryBackend(), topic="item")
+    yield items_cache
+    cache._registry[Item].remove(items_cache)
+
+
+def reader(items_cache, during_read=None):
+    @items_cache.cached
+    def get_item(db, item_id):
+        obj = db.query(Item).get(item_id)
+        if during_read is not None:
+            during_read()
+        return obj
+
+    return get_item
+
+
+def test_commit_invalidates_entry(session_factory, items):
+    get_item = reader(items)
+    db = session_factory()
+    try:
+        assert get_item(db, 1).name == "avant"
+        assert items.backend.get(1) is not cache.MISSING
+        get_item(db, 1).name = "après"
+        db.commit()
+        assert items.backend.get(1) is cache.MISSING
+        db.expunge_all()
+        assert get_item(db, 1).name == "après"
+    finally:
+        db.close()
+
+
+def test_bulk_update_clears_cache(session_factory, items):
+    get_item = reader(items)
+    db = session_factory()
+    try:
+        get_item(db, 1)
+        db.query(Item).update({Item.name: "masse"}, synchronize_session=False)
+        db.commit()
+        assert items.backend.get(1) is cache.MISSING
+    finally:
+        db.close()
+
+
+def test_read_racing_an_invalidation_is_not_stored(session_factory, items):
+    # Un autre commit invalide la clé pendant la lecture : la ligne lue est peut-être périmée
+    get_item = reader(items, during_read=lambda: items.invalidate([1]))
+    db = session_factory()
+    try:
+        assert get_item(db, 1).name == "avant"
+        assert items.backend.get(1) is cache.MISSING
+    finally:
+        db.close()
+
+
+def test_outbox_invalidates_writes_of_other_processes(session_factory, memory_items):
+    stream = outbox.EventStream("items", OutboxEvent, session_factory)
+    follower = cache.OutboxFollower(stream)
+    follower.sync()
+    get_item = reader(memory_items)
+    db = session_factory()
+    try:
+        get_item(db, 1)
+        # Écriture d'un autre processus : ni événement de session ni invalidation locale
+        with session_factory.kw["bind"].begin() as connection:
+            connection.execute(text("UPDATE items SET name = 'ailleurs' WHERE id = 1"))
+            connection.execute(text("INSERT INTO outbox_events (topic, action, key) VALUES ('item', 'updated', '1')"))
+        assert memory_items.backend.get(1) is not cache.MISSING
+        assert follower.sync() == 1
+        assert memory_items.backend.get(1) is cache.MISSING
+        db.expunge_all()
+        assert get_item(db, 1).name == "ailleurs"
+    finally:
+        db.close()
+
+
+def test_outbox_gap_clears_caches(session_factory, memory_items):
+    stream = outbox.EventStream("items", OutboxEvent, session_factory)
+    follower = cache.OutboxFollower(stream)
+    follower.sync()
+    db = session_factory()
+    try:
+        reader(memory_items)(db, 1)
+        outbox.record(db, OutboxEvent, "item", "updated", 1)
+        db.commit()
+        # Événements purgés avant d'avoir été lus : le cache est vidé
+        stream.purge(timedelta(hours=-1))
+        assert follower.sync() == 0
+        assert memory_items.backend.get(1) is cache.MISSING
+    finally:
+        db.close()
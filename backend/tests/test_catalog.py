@@ -0,0 +1,37 @@
+"""
+Copie en mémoire du catalogue (service-service/catalog.py) : reconstruite dès
+que la version partagée de la collection change, y compris pour une écriture
+validée par un autre processus.
+"""
+from sqlalchemy import text
+
+from conftest import service_modules
+
+
+def test_snapshot_follows_shared_collection_version(gateway):
+    modules = service_modules("services", "catalog", "crud", "database", "models", "schemas")
+    catalog, crud, database, models = modules["catalog"], modules["crud"], modules["database"], modules["models"]
+    conditional = catalog.conditional
+    db = database.SessionLocal()
+    try:
+        crud.create_service(db, modules["schemas"].ServiceCreate(name="Audit", price=300, category="conseil"))
+        before = catalog.get_snapshot(db)
+        assert catalog.get_snapshot(db) is before
+        assert "Audit" in before.names
+
+        # Autre processus : insertion et version dans sa propre transaction, sans toucher à ce processus
+        other = database.SessionLocal()
+        try:
+            other.execute(text("INSERT INTO services (name, price, category) VALUES ('Formation', 900, 'conseil')"))
+            conditional.bump(other, models.CollectionVersion, catalog.COLLECTION)
+            other.commit()
+        finally:
+            other.close()
+
+        after = catalog.get_snapshot(db)
+        assert after is not before
+        assert after.source_version == before.source_version + 1
+        assert "Formation" in after.names
+        assert after.version != before.version
+    finally:
+        db.close()
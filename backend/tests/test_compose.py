@@ -0,0 +1,90 @@
+"""
+Vue composée du gateway (gateway/compose.py) : partie en erreur ou trop lente
+omise et signalée, profil relu pour l'identité confirmée quand l'uid du token
+ne correspond pas, échec de l'identité propagé.
+"""
+import asyncio
+import base64
+import json
+import os
+import sys
+
+import httpx
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "gateway"))
+
+import compose  # noqa: E402
+
+AUTH, USERS = "http://auth", "http://users"
+
+
+def bearer(claims: dict) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip("=")
+    return f"Bearer header.{payload}.signature"
+
+
+def compose_view(routes: dict, claims: dict, requested: list = None):
+    async def handler(request):
+        if requested is not None:
+            requested.append(request.url.path)
+        route = routes[f"{request.url.host}{request.url.path}"]
+        if isinstance(route, float):
+            await asyncio.sleep(route)
+            return httpx.Response(200, json={})
+        status, body = route
+        return httpx.Response(status, json=body)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await compose.compose_user_view(client, AUTH, USERS, bearer(claims))
+
+    return asyncio.run(scenario())
+
+
+def test_failed_and_slow_parts_are_reported(monkeypatch):
+    monkeypatch.setattr(compose, "ROLES_TIMEOUT", 0.05)
+    view = compose_view({
+        "auth/users/me": (200, {"id": 5, "email": "alice@example.com"}),
+        "auth/users/me/roles": 1.0,
+        "users/users/5": (500, {"detail": "panne"}),
+    }, {"uid": 5})
+    assert view["user"]["id"] == 5
+    assert view["errors"] == {"roles": "timeout", "profile": "error"}
+    assert view["partial"] is True
+    assert view["roles"] == [] and view["profile"] is None
+
+
+def test_profile_is_refetched_when_uid_does_not_match():
+    requested = []
+    view = compose_view({
+        "auth/users/me": (200, {"id": 7, "email": "bob@example.com"}),
+        "auth/users/me/roles": (200, {"user_id": 7, "roles": ["user"], "permissions": ["view_projects"]}),
+        "users/users/5": (200, {"user_id": 5, "bio": "pas moi"}),
+        "users/users/7": (200, {"user_id": 7, "bio": "moi"}),
+    }, {"uid": 5}, requested)
+    assert view["profile"] == {"user_id": 7, "bio": "moi"}
+    assert view["roles"] == ["user"] and view["partial"] is False
+    assert "/users/7" in requested
+
+
+def test_token_without_uid_fetches_profile_after_identity():
+    requested = []
+    view = compose_view({
+        "auth/users/me": (200, {"id": 3}),
+        "auth/users/me/roles": (200, {"user_id": 3, "roles": [], "permissions": []}),
+        "users/users/3": (404, {"detail": "absent"}),
+    }, {"sub": "carol@example.com"}, requested)
+    assert view["profile"] is None and view["errors"] == {}
+    assert requested[-1] == "/users/3"
+
+
+def test_identity_failure_is_raised():
+    with pytest.raises(compose.PartError) as error:
+        compose_view({
+            "auth/users/me": (401, {"detail": "Token invalide"}),
+            "auth/users/me/roles": (401, {}),
+            "users/users/5": (200, {}),
+        }, {"uid": 5})
+    assert error.value.status_code == 401
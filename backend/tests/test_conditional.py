@@ -0,0 +1,98 @@
+"""
+Requêtes conditionnelles (shared.conditional) : 304 sur If-None-Match et
+If-Modified-Since, version de collection incrémentée dans la transaction de
+chaque écriture (suppressions comprises).
+"""
+from datetime import datetime, timedelta, timezone
+
+from fastapi import Request, Response
+from sqlalchemy import create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from conftest import service_modules
+from shared import conditional
+
+Base = declarative_base()
+CollectionVersion = conditional.declare_versions(Base)
+
+
+def make_request(**headers):
+    raw = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw, "query_string": b""})
+
+
+def test_validators_and_not_modified():
+    etag = conditional.make_etag("projects", 3)
+    modified = datetime.utcnow() - timedelta(hours=1)
+    response = Response()
+    assert conditional.not_modified(make_request(), response, etag, modified) is None
+    assert response.headers["etag"] == etag
+    assert response.headers["last-modified"] == conditional.http_date(modified)
+
+    assert conditional.not_modified(make_request(if_none_match=f'W/{etag}'), Response(), etag).status_code == 304
+    assert conditional.not_modified(make_request(if_none_match='"autre"'), Response(), etag) is None
+    since = conditional.http_date(modified)
+    assert conditional.not_modified(make_request(if_modified_since=since), Response(), etag, modified).status_code == 304
+    # If-None-Match l'emporte sur If-Modified-Since
+    assert conditional.not_modified(make_request(if_none_match='"autre"', if_modified_since=since),
+                                    Response(), etag, modified) is None
+
+
+def test_last_modified_waits_for_the_second_to_end():
+    # Une autre écriture peut suivre dans la même seconde : pas de Last-Modified encore
+    response = Response()
+    conditional.not_modified(make_request(), response, '"x"', datetime.now(timezone.utc))
+    assert "last-modified" not in response.headers
+
+
+def test_bump_counts_every_write(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'versions.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        assert conditional.collection_version(db, CollectionVersion, "items") == (0, None)
+        conditional.bump(db, CollectionVersion, "items")
+        db.rollback()
+        assert conditional.collection_version(db, CollectionVersion, "items") == (0, None)
+        conditional.bump(db, CollectionVersion, "items")
+        conditional.bump(db, CollectionVersion, "items")
+        db.commit()
+        version, modified_at = conditional.collection_version(db, CollectionVersion, "items")
+        assert version == 2 and modified_at is not None
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def test_list_is_not_modified_until_a_write(gateway, tokens):
+    _, client = gateway
+    first = client.get("/api/projects/projects", headers=tokens["user"])
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    again = client.get("/api/projects/projects", headers=dict(tokens["user"], **{"If-None-Match": etag}))
+    assert again.status_code == 304
+    assert again.content == b""
+
+    modules = service_modules("projects", "crud", "database", "schemas")
+    db = modules["database"].SessionLocal()
+    try:
+        modules["crud"].create_project(db, modules["schemas"].ProjectCreate(title="Nouveau"))
+    finally:
+        db.close()
+    changed = client.get("/api/projects/projects", headers=dict(tokens["user"], **{"If-None-Match": etag}))
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+
+def test_profile_deletion_bumps_the_collection(gateway):
+    modules = service_modules("users", "crud", "database", "schemas")
+    crud = modules["crud"]
+    db = modules["database"].SessionLocal()
+    try:
+        crud.save_user_profile(db, 9001, modules["schemas"].UserProfileBase(bio="Temporaire"))
+        version, _ = crud.get_users_version(db)
+        assert crud.delete_user(db, 9001)
+        assert crud.get_users_version(db)[0] == version + 1
+    finally:
+        db.close()
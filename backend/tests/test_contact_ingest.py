@@ -0,0 +1,164 @@
+"""
+File d'ingestion des contacts : reprise après crash, idempotence, compaction
+et journal par processus.
+
+    cd backend && python -m pytest tests
+"""
+import json
+import os
+import sys
+import time
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "contact-service"))
+sys.path.insert(0, BACKEND_DIR)
+
+import crud  # noqa: E402
+import ingest  # noqa: E402
+import models  # noqa: E402
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'contacts.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+def make_queue(tmp_path, session_factory, **kwargs):
+    return ingest.ContactIngestQueue(log_dir=str(tmp_path / "log"), session_factory=session_factory,
+                                     flush_interval=0.01, fsync=False, **kwargs)
+
+
+def sample_contact(i):
+    return {"name": f"Client {i}", "email": f"client{i}@example.com", "message": "Bonjour"}
+
+
+def drain(queue):
+    deadline = time.monotonic() + 10
+    while queue.pending():
+        assert time.monotonic() < deadline, "file d'ingestion bloquée"
+        time.sleep(0.01)
+
+
+def stored_ingest_ids(session_factory):
+    db = session_factory()
+    try:
+        return [contact.ingest_id for contact in crud.get_contacts(db, limit=1000)]
+    finally:
+        db.close()
+
+
+def test_submitted_contacts_are_written(tmp_path, session_factory):
+    queue = make_queue(tmp_path, session_factory)
+    queue.start()
+    ids = [queue.submit(sample_contact(i)) for i in range(20)]
+    drain(queue)
+    queue.stop()
+    assert sorted(stored_ingest_ids(session_factory)) == sorted(ids)
+
+
+def test_replay_after_crash(tmp_path, session_factory):
+    queue = make_queue(tmp_path, session_factory)
+    # Crash simulé : journal écrit et acquitté, thread d'écriture jamais démarré
+    slot, queue._slot_lock = queue._acquire_slot()
+    queue.log_path, queue.checkpoint_path, _ = queue._slot_paths(slot)
+    queue._log = open(queue.log_path, "ab")
+    ids = [queue.submit(sample_contact(i)) for i in range(5)]
+    # Dernière ligne interrompue en cours d'écriture : jamais acquittée, ignorée
+    queue._log.write(b'{"name": "tronqu')
+    queue._log.close()
+    queue._slot_lock.close()
+
+    restarted = make_queue(tmp_path, session_factory)
+    restarted.start()
+    drain(restarted)
+    restarted.stop()
+    assert sorted(stored_ingest_ids(session_factory)) == sorted(ids)
+
+
+def test_replay_is_idempotent(tmp_path, session_factory):
+    queue = make_queue(tmp_path, session_factory)
+    queue.start()
+    ids = [queue.submit(sample_contact(i)) for i in range(5)]
+    drain(queue)
+    queue.stop()
+
+    # Point de reprise perdu (arrêt entre l'écriture en base et le point de reprise)
+    with open(queue.checkpoint_path, "w") as f:
+        f.write("0")
+    restarted = make_queue(tmp_path, session_factory)
+    restarted.start()
+    drain(restarted)
+    restarted.stop()
+    assert sorted(stored_ingest_ids(session_factory)) == sorted(ids)
+
+
+def test_compaction_checkpoint_precedes_truncate(tmp_path, session_factory, monkeypatch):
+    monkeypatch.setattr(ingest, "COMPACT_BYTES", 1)
+    queue = make_queue(tmp_path, session_factory)
+    queue.start()
+    events = []
+    write_checkpoint = queue._write_checkpoint
+    monkeypatch.setattr(queue, "_write_checkpoint",
+                        lambda offset, *args: (events.append(("checkpoint", offset)), write_checkpoint(offset, *args)))
+    log = queue._log
+    truncate = log.truncate
+    monkeypatch.setattr(queue, "_log", type("Log", (), {
+        "__getattr__": lambda self, name: getattr(log, name),
+        "truncate": lambda self, size: (events.append(("truncate", size)), truncate(size)),
+    })())
+    queue.submit(sample_contact(0))
+    drain(queue)
+    queue.stop()
+    assert events.index(("checkpoint", 0)) < events.index(("truncate", 0))
+    assert os.path.getsize(queue.log_path) == 0
+
+
+def test_each_process_gets_its_own_log(tmp_path, session_factory):
+    first = make_queue(tmp_path, session_factory)
+    second = make_queue(tmp_path, session_factory)
+    first.start()
+    second.start()
+    try:
+        assert first.log_path != second.log_path
+        first_id = first.submit(sample_contact(1))
+        second_id = second.submit(sample_contact(2))
+        drain(first)
+        drain(second)
+    finally:
+        second.stop()
+        first.stop()
+    assert sorted(stored_ingest_ids(session_factory)) == sorted([first_id, second_id])
+
+
+def test_abandoned_log_is_drained(tmp_path, session_factory):
+    log_dir = tmp_path / "log"
+    log_dir.mkdir()
+    entry = dict(sample_contact(7), ingest_id="orphelin", created_at="2026-01-15T10:00:00")
+    (log_dir / "contacts.3.log").write_text(json.dumps(entry) + "\n")
+
+    queue = make_queue(tmp_path, session_factory)
+    queue.start()
+    queue.stop()
+    assert stored_ingest_ids(session_factory) == ["orphelin"]
+    assert os.path.getsize(log_dir / "contacts.3.log") == 0
+
+
+def test_upgrade_schema_adds_ingest_id(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE contacts (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, "
+                                "email VARCHAR NOT NULL, message TEXT NOT NULL, created_at DATETIME)"))
+        connection.execute(text("INSERT INTO contacts (name, email, message) VALUES ('A', 'a@example.com', 'Bonjour')"))
+    models.upgrade_schema(engine)
+    models.upgrade_schema(engine)
+    assert "ingest_id" in {column["name"] for column in inspect(engine).get_columns("contacts")}
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT ingest_id FROM contacts")).scalar() is None
+    engine.dispose()
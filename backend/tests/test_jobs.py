@@ -0,0 +1,109 @@
+"""
+File de tâches (shared.jobs) : mise en file par lot, bail prolongé pendant
+l'exécution, fin de tâche réservée au titulaire du bail.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from shared import jobs, sqlprofile
+
+Base = declarative_base()
+Job = jobs.declare_jobs(Base)
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    sqlprofile.instrument_engine(engine)
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+def make_queue(session_factory, worker_id):
+    queue = jobs.JobQueue("test", Job, workers=1)
+    queue.task("notify")(lambda db, payload: None)
+    queue.session_factory = session_factory
+    queue.worker_id = worker_id
+    return queue
+
+
+def test_enqueue_many_reads_known_keys_once(session_factory):
+    queue = make_queue(session_factory, "a")
+    db = session_factory()
+    try:
+        queue.enqueue(db, "notify", {"n": 0}, key="notify:0")
+        db.commit()
+        items = [({"n": n}, f"notify:{n}") for n in range(50)] + [({"n": 1}, "notify:1")]
+        with sqlprofile.query_budget(1):
+            batch = queue.enqueue_many(db, "notify", items)
+        db.commit()
+        assert batch[1] is batch[-1]
+        assert db.query(Job).count() == 50
+    finally:
+        db.close()
+
+
+def test_enqueue_finds_job_added_in_same_transaction(session_factory):
+    queue = make_queue(session_factory, "a")
+    db = session_factory()
+    try:
+        first = queue.enqueue(db, "notify", key="notify:1")
+        assert queue.enqueue(db, "notify", key="notify:1") is first
+        assert queue.enqueue(db, "notify", coalesce=True) is first
+    finally:
+        db.close()
+
+
+def expire_lease(session_factory, job_id):
+    db = session_factory()
+    try:
+        db.query(Job).filter(Job.id == job_id).update(
+            {Job.lease_expires_at: datetime.utcnow() - timedelta(seconds=1)}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def read_job(session_factory, job_id):
+    db = session_factory()
+    try:
+        return db.query(Job).filter(Job.id == job_id).one()
+    finally:
+        db.close()
+
+
+def test_lease_is_renewed_while_running(session_factory):
+    queue = make_queue(session_factory, "a")
+    db = session_factory()
+    queue.enqueue(db, "notify")
+    db.commit()
+    db.close()
+    job_id = queue._claim()[0]
+    expire_lease(session_factory, job_id)
+
+    queue._renew_leases()
+    assert read_job(session_factory, job_id).lease_expires_at > datetime.utcnow()
+    assert make_queue(session_factory, "b")._claim() is None
+
+
+def test_only_lease_holder_finishes(session_factory):
+    first, second = make_queue(session_factory, "a"), make_queue(session_factory, "b")
+    db = session_factory()
+    first.enqueue(db, "notify")
+    db.commit()
+    db.close()
+    job_id = first._claim()[0]
+    # Bail expiré sans battement (processus figé) : la tâche est reprise ailleurs
+    expire_lease(session_factory, job_id)
+    assert second._claim()[0] == job_id
+
+    assert first._finish(job_id, jobs.DONE) is False
+    job = read_job(session_factory, job_id)
+    assert (job.status, job.locked_by, job.attempts) == (jobs.RUNNING, "b", 2)
+    assert second._finish(job_id, jobs.DONE) is True
+    assert read_job(session_factory, job_id).status == jobs.DONE
@@ -0,0 +1,45 @@
+"""
+Mode strict de shared.looplag : un handler async bloquant échoue avant
+l'envoi de sa réponse.
+"""
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from shared import looplag
+
+
+def make_app():
+    app = FastAPI()
+    app.add_middleware(looplag.StrictMiddleware, service="test", budget=0.05)
+
+    @app.get("/blocking")
+    async def blocking():
+        time.sleep(0.2)
+        return {"ok": True}
+
+    @app.get("/awaiting")
+    async def awaiting():
+        await asyncio.sleep(0.2)
+        return {"ok": True}
+
+    return app
+
+
+def test_non_blocking_handler_passes():
+    response = TestClient(make_app()).get("/awaiting")
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+
+
+def test_blocking_handler_raises():
+    with pytest.raises(looplag.LoopBlocked, match="GET /blocking \\(test\\) a bloqué la boucle"):
+        TestClient(make_app()).get("/blocking")
+
+
+def test_blocking_handler_returns_500():
+    response = TestClient(make_app(), raise_server_exceptions=False).get("/blocking")
+    assert response.status_code == 500
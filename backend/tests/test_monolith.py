@@ -0,0 +1,45 @@
+"""
+Mode monolithe (gateway/monolith.py) : les services sont appelés en ASGI direct
+par les routes /api/... du gateway, sans être exposés sur le port public ;
+l'accès direct à toutes leurs routes n'est servi que sur 127.0.0.1.
+"""
+import socket
+
+import httpx
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_reads_are_relayed_in_process(gateway):
+    module, client = gateway
+    assert module.MONOLITH
+    response = client.get("/api/projects/projects")
+    assert response.status_code == 200
+    assert isinstance(response.json(), list)
+
+
+def test_service_writes_are_not_public(gateway, tokens):
+    _, client = gateway
+    # Ni montage /svc/<service>, ni relais des méthodes autres que GET (hors connexion)
+    assert client.delete("/svc/users/users/1").status_code == 404
+    assert client.post("/svc/projects/projects", json={"title": "Public"}).status_code == 404
+    assert client.put("/api/users/users/1", json={"bio": "x"}).status_code == 405
+    assert client.delete("/api/users/users/1").status_code == 405
+    assert client.post("/api/projects/projects", json={"title": "Public"}).status_code == 405
+    assert client.post("/api/auth/users", json={}).status_code == 404
+
+
+def test_internal_server_listens_on_loopback(gateway):
+    module, client = gateway
+    port = free_port()
+    server = client.portal.call(module.monolith.serve_internal, module.service_apps, port)
+    try:
+        response = httpx.get(f"http://127.0.0.1:{port}/projects/projects", timeout=10)
+        assert response.status_code == 200
+        assert server.config.host == "127.0.0.1"
+    finally:
+        client.portal.call(module.monolith.stop_internal, server)
@@ -0,0 +1,68 @@
+"""
+Lectures groupées (shared.multiget) : regroupement des lectures unitaires
+concurrentes par Batcher, découpage par paquet, erreurs propagées à chaque
+demandeur ; ordre et absents des lectures ?ids=.
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException, Response
+
+from shared import multiget
+
+
+class Session:
+    def close(self):
+        pass
+
+
+def make_batcher(calls, fail=False, **kwargs):
+    def load_many(db, ids):
+        calls.append(list(ids))
+        if fail:
+            raise RuntimeError("base indisponible")
+        return {key: f"objet {key}" for key in ids if key != 404}
+
+    return multiget.Batcher("test", Session, load_many, **kwargs)
+
+
+def test_concurrent_loads_share_one_query():
+    calls = []
+    batcher = make_batcher(calls)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.load(key) for key in (1, 2, 2, 3, 404)))
+
+    assert asyncio.run(scenario()) == ["objet 1", "objet 2", "objet 2", "objet 3", None]
+    assert calls == [[1, 2, 3, 404]]
+
+
+def test_batches_are_capped_and_errors_reach_every_caller():
+    calls = []
+    batcher = make_batcher(calls, max_batch=2)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.load(key) for key in range(5)))
+
+    assert asyncio.run(scenario()) == [f"objet {key}" for key in range(5)]
+    assert calls == [[0, 1], [2, 3], [4]]
+
+    failing = make_batcher([], fail=True)
+
+    async def failed():
+        return await asyncio.gather(*(failing.load(key) for key in (1, 2)), return_exceptions=True)
+
+    results = asyncio.run(failed())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert failing._task is None and not failing._pending
+
+
+def test_ids_keep_request_order_and_report_missing():
+    assert multiget.parse_ids("3,1,7,1") == [3, 1, 7]
+    with pytest.raises(HTTPException):
+        multiget.parse_ids("1,x")
+    with pytest.raises(HTTPException):
+        multiget.parse_ids("1,2,3", max_ids=2)
+    response = Response()
+    assert multiget.ordered({1: "a", 7: "c"}, [3, 1, 7], response) == ["a", "c"]
+    assert response.headers[multiget.MISSING_HEADER] == "3"
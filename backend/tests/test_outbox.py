@@ -0,0 +1,76 @@
+"""
+Outbox (shared.outbox) : purge par âge avec marqueur, reprise refusée (410)
+avant l'offset purgé, flux réservé à la permission view_events, et flux non
+relayé par le gateway.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from shared import authz, outbox
+
+Base = declarative_base()
+OutboxEvent = outbox.declare_outbox(Base)
+
+
+@pytest.fixture
+def stream(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'outbox.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield outbox.EventStream("test", OutboxEvent, sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    engine.dispose()
+
+
+def add_events(stream, count, age=timedelta(0)):
+    db = stream.session_factory()
+    try:
+        for i in range(count):
+            db.add(OutboxEvent(topic="project", action="created", key=str(i), created_at=datetime.utcnow() - age))
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_purge_removes_old_events_and_leaves_marker(stream):
+    add_events(stream, 3, age=timedelta(days=2))
+    add_events(stream, 2)
+    assert stream.purge(timedelta(days=1)) == 3
+    assert stream.purged_offset() == 3
+    events = stream.read(0)
+    assert [evt["offset"] for evt in events] == [4, 5, 6]
+    assert (events[-1]["topic"], events[-1]["action"], events[-1]["key"]) == ("outbox", "purged", "3")
+    # Rien d'assez ancien : pas de nouveau marqueur
+    assert stream.purge(timedelta(days=1)) == 0
+    assert stream.latest_offset() == 6
+
+
+def make_client(stream, access):
+    app = FastAPI()
+    outbox.install(app, stream)
+    if access is not None:
+        app.dependency_overrides[authz.current_access] = lambda: access
+    return TestClient(app)
+
+
+def test_resume_before_purged_offset_is_gone(stream):
+    add_events(stream, 3, age=timedelta(days=2))
+    stream.purge(timedelta(days=1))
+    response = make_client(stream, {"permissions": [outbox.PERMISSION]}).get("/events", params={"since": 1})
+    assert response.status_code == 410
+    assert "purgé" in response.json()["detail"]
+
+
+def test_events_require_permission(stream):
+    assert make_client(stream, None).get("/events").status_code == 401
+    assert make_client(stream, {"permissions": ["view_projects"]}).get("/events").status_code == 403
+
+
+def test_gateway_does_not_relay_event_streams(gateway, tokens):
+    _, client = gateway
+    response = client.get("/api/projects/events", headers=tokens["admin"])
+    assert response.status_code == 404
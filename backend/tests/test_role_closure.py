@@ -0,0 +1,73 @@
+"""
+Héritage des rôles (auth-service/crud.py) : table de fermeture avec comptage des
+chemins, retrait d'une arête d'un losange, refus des cycles.
+"""
+import pytest
+
+
+@pytest.fixture
+def auth(auth_service):
+    _, modules = auth_service
+    db = modules["database"].SessionLocal()
+    yield modules, db
+    db.close()
+
+
+def make_roles(modules, db, prefix, *names):
+    crud, schemas = modules["crud"], modules["schemas"]
+    return {name: crud.create_role(db, schemas.RoleCreate(name=f"{prefix}-{name}", description=name)).id
+            for name in names}
+
+
+def paths(modules, db, role_id, included_role_id):
+    row = db.query(modules["models"].RoleClosure).get((role_id, included_role_id))
+    return 0 if row is None else row.paths
+
+
+def closure_rows(modules, db):
+    closure = modules["models"].RoleClosure
+    return sorted(db.query(closure.role_id, closure.included_role_id, closure.paths).all())
+
+
+def test_diamond_counts_paths_and_survives_edge_removal(auth):
+    modules, db = auth
+    crud = modules["crud"]
+    roles = make_roles(modules, db, "losange", "haut", "gauche", "droite", "bas")
+    crud.add_role_inheritance(db, roles["haut"], roles["gauche"])
+    crud.add_role_inheritance(db, roles["haut"], roles["droite"])
+    crud.add_role_inheritance(db, roles["gauche"], roles["bas"])
+    crud.add_role_inheritance(db, roles["droite"], roles["bas"])
+    assert paths(modules, db, roles["haut"], roles["bas"]) == 2
+    assert paths(modules, db, roles["gauche"], roles["bas"]) == 1
+
+    # Un des deux chemins retiré : "bas" reste inclus par "haut" via "droite"
+    assert crud.remove_role_inheritance(db, roles["haut"], roles["gauche"])
+    db.expire_all()
+    assert paths(modules, db, roles["haut"], roles["bas"]) == 1
+    assert not crud.role_includes(db, roles["haut"], roles["gauche"])
+    assert crud.role_includes(db, roles["haut"], roles["bas"])
+    # Le calcul incrémental donne la même table qu'une reconstruction complète
+    incremental = closure_rows(modules, db)
+    crud.rebuild_role_closure(db)
+    assert closure_rows(modules, db) == incremental
+
+    assert crud.remove_role_inheritance(db, roles["haut"], roles["droite"])
+    db.expire_all()
+    assert not crud.role_includes(db, roles["haut"], roles["bas"])
+    assert paths(modules, db, roles["haut"], roles["haut"]) == 1
+
+
+def test_cycle_is_refused(auth):
+    modules, db = auth
+    crud = modules["crud"]
+    roles = make_roles(modules, db, "cycle", "a", "b", "c")
+    crud.add_role_inheritance(db, roles["a"], roles["b"])
+    crud.add_role_inheritance(db, roles["b"], roles["c"])
+    before = closure_rows(modules, db)
+    with pytest.raises(ValueError, match="cycle"):
+        crud.add_role_inheritance(db, roles["c"], roles["a"])
+    with pytest.raises(ValueError, match="cycle"):
+        crud.add_role_inheritance(db, roles["b"], roles["b"])
+    db.rollback()
+    assert closure_rows(modules, db) == before
+    assert [role.id for role in crud.get_inherited_roles(db, roles["c"])] == []
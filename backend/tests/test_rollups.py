@@ -0,0 +1,96 @@
+"""
+Agrégats des statistiques (shared.rollup) : compteurs mis à jour dans la
+transaction de l'écriture (annulés avec elle), upsert sans perte entre
+écritures concurrentes, égaux à une reconstruction complète.
+"""
+import threading
+
+import pytest
+from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from conftest import service_modules
+from shared import rollup
+
+Base = declarative_base()
+Rollup = rollup.declare_rollup(Base)
+
+
+class Order(Base):
+    __tablename__ = "orders"
+
+    id = Column(Integer, primary_key=True)
+    day = Column(String, nullable=False)
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'rollups.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+def write_order(db, day):
+    db.add(Order(day=day))
+    rollup.increment(db, Rollup, "orders_per_day", day)
+
+
+def test_increment_commits_and_rolls_back_with_the_write(session_factory):
+    db = session_factory()
+    try:
+        write_order(db, "2024-05-01")
+        db.commit()
+        write_order(db, "2024-05-01")
+        write_order(db, "2024-05-02")
+        db.rollback()
+        series = rollup.series(db, Rollup, "orders_per_day")
+        assert [(b.bucket, b.value) for b in series.buckets] == [("2024-05-01", 1)]
+        assert db.query(Order).count() == series.total
+    finally:
+        db.close()
+
+
+def test_concurrent_increments_on_a_new_bucket(session_factory):
+    def worker():
+        for _ in range(20):
+            db = session_factory()
+            try:
+                write_order(db, "2024-06-01")
+                db.commit()
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    db = session_factory()
+    try:
+        assert rollup.series(db, Rollup, "orders_per_day").total == 80
+    finally:
+        db.close()
+
+
+def test_service_writes_update_stats_in_their_transaction(gateway):
+    modules = service_modules("services", "crud", "database", "models", "schemas")
+    crud, schemas = modules["crud"], modules["schemas"]
+    db = modules["database"].SessionLocal()
+    try:
+        def count(category):
+            series = crud.get_service_stats(db)
+            return {b.bucket: b.value for b in series.buckets}.get(category, 0)
+
+        before = count("rollup-test")
+        created = [crud.create_service(db, schemas.ServiceCreate(name=f"Stat {i}", category="rollup-test"))
+                   for i in range(3)]
+        assert count("rollup-test") == before + 3
+        crud.delete_service(db, created[0].id)
+        assert count("rollup-test") == before + 2
+        # Les compteurs incrémentaux égalent un recalcul depuis la table
+        crud.rebuild_rollups(db)
+        assert count("rollup-test") == before + 2
+    finally:
+        db.close()
@@ -0,0 +1,73 @@
+"""
+Champs partiels (shared.sparse) : le SELECT ne lit que les colonnes demandées,
+la projection ne recharge aucune colonne différée ; ?fields= de bout en bout.
+"""
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import Column, Integer, String, Text, create_engine, event
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from conftest import service_modules
+from shared import sparse
+
+Base = declarative_base()
+
+
+class Article(Base):
+    __tablename__ = "articles"
+
+    id = Column(Integer, primary_key=True)
+    title = Column(String, nullable=False)
+    body = Column(Text, nullable=True)
+    author = Column(String, nullable=True)
+
+
+@pytest.fixture
+def db_and_statements(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sparse.db'}")
+    Base.metadata.create_all(bind=engine)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    db = sessionmaker(bind=engine)()
+    db.add(Article(id=1, title="Titre", body="long texte " * 100, author="alice"))
+    db.commit()
+    db.expunge_all()
+    statements.clear()
+    yield db, statements
+    db.close()
+    engine.dispose()
+
+
+def test_load_only_selects_requested_columns(db_and_statements):
+    db, statements = db_and_statements
+    fields = sparse.parse("title", ["id", "title", "body", "author"])
+    rows = db.query(Article).options(sparse.load_only(Article, fields, extra=("id",))).all()
+    assert [sparse.project(row, fields) for row in rows] == [{"title": "Titre"}]
+    # Une seule requête, sans les colonnes non demandées
+    assert len(statements) == 1
+    selected = statements[0].split("FROM")[0]
+    assert "articles.title" in selected and "articles.id" in selected
+    assert "articles.body" not in selected and "articles.author" not in selected
+
+
+def test_parse_rejects_unknown_fields():
+    assert sparse.parse(None, ["id"]) is None
+    assert sparse.parse("id, id ,title", ["id", "title"]) == ["id", "title"]
+    with pytest.raises(HTTPException) as error:
+        sparse.parse("id,secret", ["id", "title"])
+    assert error.value.status_code == 400
+
+
+def test_fields_parameter_through_gateway(gateway):
+    _, client = gateway
+    modules = service_modules("projects", "crud", "database", "schemas")
+    db = modules["database"].SessionLocal()
+    try:
+        modules["crud"].create_project(db, modules["schemas"].ProjectCreate(title="Partiel", description="Texte"))
+    finally:
+        db.close()
+    response = client.get("/api/projects/projects", params={"fields": "id,title"})
+    assert response.status_code == 200
+    assert response.json() and all(set(item) == {"id", "title"} for item in response.json())
+    assert client.get("/api/projects/projects", params={"fields": "password"}).status_code == 400
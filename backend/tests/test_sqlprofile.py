@@ -0,0 +1,98 @@
+"""
+Budgets de requêtes SQL (shared.sqlprofile) : query_budget dans les tests,
+SQLProfilingMiddleware par endpoint, et un N+1 réel dans auth-service.
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from shared import sqlprofile
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    sqlprofile.instrument_engine(engine)
+    yield engine
+    engine.dispose()
+
+
+def run_queries(engine, count):
+    with engine.connect() as connection:
+        for _ in range(count):
+            connection.execute(text("SELECT 1"))
+
+
+def test_query_budget_within(engine):
+    with sqlprofile.query_budget(3) as stats:
+        run_queries(engine, 3)
+    assert stats.count == 3
+
+
+def test_query_budget_exceeded(engine):
+    with pytest.raises(sqlprofile.QueryBudgetExceeded, match="4 requêtes SQL exécutées"):
+        with sqlprofile.query_budget(3):
+            run_queries(engine, 4)
+
+
+def test_repeated_statement_is_reported_as_n_plus_one(engine):
+    with sqlprofile.query_budget(100) as stats:
+        run_queries(engine, sqlprofile.N_PLUS_ONE_THRESHOLD)
+    assert stats.repeated() == {"SELECT 1": sqlprofile.N_PLUS_ONE_THRESHOLD}
+
+
+def make_client(engine, strict):
+    app = FastAPI()
+    app.add_middleware(sqlprofile.SQLProfilingMiddleware, service="test", budgets={"GET /items/{count}": 2},
+                       strict=strict)
+
+    @app.get("/items/{count}")
+    def read_items(count: int):
+        run_queries(engine, count)
+        return {"count": count}
+
+    return TestClient(app)
+
+
+def test_middleware_within_budget(engine):
+    response = make_client(engine, strict=True).get("/items/2")
+    assert response.status_code == 200
+    assert response.headers["x-db-query-count"] == "2"
+    assert 'desc="2 queries"' in response.headers["server-timing"]
+
+
+def test_middleware_strict_over_budget(engine):
+    response = make_client(engine, strict=True).get("/items/3")
+    assert response.status_code == 500
+    assert "Budget SQL dépassé pour GET /items/{count}" in response.json()["detail"]
+
+
+def test_middleware_lenient_over_budget(engine):
+    response = make_client(engine, strict=False).get("/items/3")
+    assert response.status_code == 200
+    assert response.headers["x-db-query-count"] == "3"
+
+
+def test_effective_permissions_in_one_query(auth_service):
+    _, modules = auth_service
+    crud, database = modules["crud"], modules["database"]
+    db = database.SessionLocal()
+    try:
+        user = crud.create_user(db, modules["schemas"].UserCreate(
+            email="budget@example.com", username="budget", full_name="Budget", password="budget123"))
+        user_id = user.id
+        crud.add_role_to_user(db, user_id, crud.get_role_by_name(db, "admin").id)
+        db.expire_all()
+
+        # Rôles hérités compris (admin ⊃ manager ⊃ user) : une seule requête via la fermeture
+        with sqlprofile.query_budget(1):
+            names = crud.get_user_permission_names(db, user_id)
+        assert {"manage_roles", "view_projects"} <= names
+
+        # Parcours rôle par rôle (chargement paresseux) : le N+1 dépasse le budget
+        with pytest.raises(sqlprofile.QueryBudgetExceeded):
+            with sqlprofile.query_budget(1):
+                {permission.name for role in crud.get_user_roles(db, user_id) for permission in role.permissions}
+    finally:
+        db.close()
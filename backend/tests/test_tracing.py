@@ -0,0 +1,51 @@
+"""
+Propagation du traceparent (shared.tracing) : suivi entre services, décision
+d'échantillonnage prise au gateway et non par le client.
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from shared import tracing
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+CLIENT_TRACEPARENT = f"00-{TRACE_ID}-00f067aa0ba902b7-01"
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    spans = []
+    monkeypatch.setattr(tracing.exporter, "export", spans.append)
+    return spans
+
+
+def make_client(edge):
+    app = FastAPI()
+    app.add_middleware(tracing.TracingMiddleware, service="test", edge=edge)
+
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+def test_service_follows_received_sampling(monkeypatch, exported):
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 0.0)
+    response = make_client(edge=False).get("/ping", headers={"traceparent": CLIENT_TRACEPARENT})
+    assert response.headers["x-trace-id"] == TRACE_ID
+    assert [(span.trace_id, span.parent_id) for span in exported] == [(TRACE_ID, "00f067aa0ba902b7")]
+
+
+def test_edge_ignores_client_sampled_flag(monkeypatch, exported):
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 0.0)
+    response = make_client(edge=True).get("/ping", headers={"traceparent": CLIENT_TRACEPARENT})
+    assert response.status_code == 200
+    assert "x-trace-id" not in response.headers
+    assert exported == []
+
+
+def test_edge_keeps_client_trace_id(monkeypatch, exported):
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 1.0)
+    make_client(edge=True).get("/ping", headers={"traceparent": f"00-{TRACE_ID}-00f067aa0ba902b7-00"})
+    assert [(span.trace_id, span.parent_id) for span in exported] == [(TRACE_ID, None)]
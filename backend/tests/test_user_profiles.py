@@ -0,0 +1,64 @@
+"""
+Profils (user-service) : PUT /users/{id}/profile enregistre le profil et, dans
+la même transaction, la vérification de l'avatar, exécutée par les tâches de fond.
+"""
+import functools
+import hashlib
+import time
+
+from conftest import service_modules
+
+
+def put_profile(gateway, user_id, body, headers):
+    # Écriture directe sur le service (le gateway public ne relaie que les lectures)
+    module, client = gateway
+    request = functools.partial(module.http_client.put, f"{module.USER_SERVICE_URL}/users/{user_id}/profile",
+                                json=body, headers=headers)
+    return client.portal.call(request)
+
+
+def user_id(auth_service, email):
+    _, modules = auth_service
+    db = modules["database"].SessionLocal()
+    try:
+        return modules["crud"].get_user_by_email(db, email).id
+    finally:
+        db.close()
+
+
+def test_profile_update_queues_avatar_check(gateway, auth_service, tokens):
+    modules = service_modules("users", "database", "models")
+    database, models = modules["database"], modules["models"]
+    owner = user_id(auth_service, "user@example.com")
+    url = "http://127.0.0.1/avatar.png"
+
+    response = put_profile(gateway, owner, {"bio": "Bonjour"}, tokens["user"])
+    assert response.status_code == 201
+    response = put_profile(gateway, owner, {"avatar_url": url}, tokens["user"])
+    assert response.status_code == 200
+    assert response.json()["bio"] == "Bonjour"
+
+    db = database.SessionLocal()
+    try:
+        key = f"avatar:{owner}:{hashlib.sha1(url.encode()).hexdigest()[:16]}"
+        assert db.query(models.Job).filter(models.Job.idempotency_key == key, models.Job.task == "validate_avatar").count() == 1
+        # Adresse interne : la tâche retire l'avatar
+        deadline = time.monotonic() + 10
+        while True:
+            db.expire_all()
+            profile = db.query(models.UserProfile).filter(models.UserProfile.user_id == owner).one()
+            if profile.avatar_url is None or time.monotonic() > deadline:
+                break
+            time.sleep(0.05)
+        assert profile.avatar_url is None
+        assert profile.bio == "Bonjour"
+    finally:
+        db.close()
+
+
+def test_profile_of_another_user_requires_manage_users(gateway, auth_service, tokens):
+    admin = user_id(auth_service, "admin@example.com")
+    owner = user_id(auth_service, "user@example.com")
+    assert put_profile(gateway, admin, {"bio": "Intrus"}, tokens["user"]).status_code == 403
+    assert put_profile(gateway, owner, {"location": "Lyon"}, tokens["admin"]).status_code in (200, 201)
+    assert put_profile(gateway, owner, {"bio": "x"}, {}).status_code == 401
@@ -0,0 +1,108 @@
+import functools
+import http.client
+import ipaddress
+import os
+import socket
+import urllib.error
+import urllib.request
+from typing import Optional
+from urllib.parse import urlsplit
+
+AVATAR_CHECK_TIMEOUT = float(os.getenv("AVATAR_CHECK_TIMEOUT", "10"))
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Une redirection pourrait viser le réseau interne : non suivie
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+# --- Connexion à l'adresse vérifiée ---
+# Résoudre une seconde fois à la connexion laisserait un DNS complaisant répondre
+# une adresse interne après la vérification (DNS rebinding) : la connexion vise
+# l'adresse vérifiée, l'en-tête Host et le nom TLS (SNI, certificat) restent ceux de l'URL.
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, address: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout, self.source_address)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, address: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.address = address
+
+    def connect(self):
+        sock = socket.create_connection((self.address, self.port), self.timeout, self.source_address)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+class _PinnedHTTPHandler(urllib.request.HTTPHandler):
+    def __init__(self, address: str):
+        super().__init__()
+        self.address = address
+
+    def http_open(self, req):
+        return self.do_open(functools.partial(_PinnedHTTPConnection, address=self.address), req)
+
+
+class _PinnedHTTPSHandler(urllib.request.HTTPSHandler):
+    def __init__(self, address: str):
+        super().__init__()
+        self.address = address
+
+    def https_open(self, req):
+        return self.do_open(functools.partial(_PinnedHTTPSConnection, address=self.address), req)
+
+
+def _opener(address: str):
+    # ProxyHandler({}) : pas de proxy de l'environnement, qui résoudrait le nom lui-même
+    return urllib.request.build_opener(urllib.request.ProxyHandler({}), _NoRedirect,
+                                       _PinnedHTTPHandler(address), _PinnedHTTPSHandler(address))
+
+
+def _public_address(host: str, port: int) -> Optional[str]:
+    """
+    Adresse à laquelle se connecter, None si le nom désigne une adresse interne
+    (boucle locale, réseau privé) : pas de requête vers l'infrastructure
+    """
+    # Échec de résolution : exception, peut-être passagère
+    addresses = [info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+    if not addresses or not all(ipaddress.ip_address(address.split("%", 1)[0]).is_global for address in addresses):
+        return None
+    return addresses[0]
+
+
+def is_image(url: str) -> bool:
+    """
+    L'URL répond avec un Content-Type image/*. Erreur 4xx : False ; 5xx ou
+    réseau : exception, la tâche sera retentée.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return False
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+    except ValueError:
+        return False
+    address = _public_address(parts.hostname, port)
+    if address is None:
+        return False
+    opener = _opener(address)
+    for method in ("HEAD", "GET"):
+        request = urllib.request.Request(url, method=method, headers={"User-Agent": "mindgraphix-avatar-check"})
+        try:
+            with opener.open(request, timeout=AVATAR_CHECK_TIMEOUT) as response:
+                return response.headers.get_content_maintype() == "image"
+        except urllib.error.HTTPError as exc:
+            # Certains hébergeurs refusent HEAD : nouvel essai en GET (seuls les en-têtes sont lus)
+            if exc.code == 405 and method == "HEAD":
+                continue
+            if 300 <= exc.code < 500:
+                return False
+            raise
+    return False
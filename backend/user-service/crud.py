@@ -1,20 +1,91 @@
+import hashlib
+
 from sqlalchemy.orm import Session
+import avatars
 import models
 import schemas
+from shared import cache, conditional, jobs, multiget, outbox, search, sparse
+
+SEARCH_COLUMNS = ["bio", "company", "location"]
+# Champs exposés, sélectionnables avec ?fields=
+FIELDS = ("id", "user_id", "bio", "avatar_url", "website", "location", "company", "created_at", "updated_at")
+
+# Profils par user_id mis en cache (hors ?fields=), invalidés à chaque écriture d'un profil
+profiles_by_user_id = cache.Cache("user_profiles", models.UserProfile, key="user_id", topic="profile", topic_key="user_id")
+
+JOBS = jobs.JobQueue("user", models.Job)
+
+@JOBS.task("validate_avatar")
+def validate_avatar(db: Session, payload: dict):
+    """
+    Retire l'avatar d'un profil si son URL ne désigne pas une image
+    """
+    profile = db.query(models.UserProfile).filter(models.UserProfile.user_id == payload["user_id"]).first()
+    # Profil supprimé ou avatar changé depuis : une autre tâche s'en charge
+    if profile is None or profile.avatar_url != payload["url"]:
+        return
+    if not avatars.is_image(payload["url"]):
+        profile.avatar_url = None
+        outbox.record(db, models.OutboxEvent, "profile", "updated", profile.user_id)
+        conditional.bump(db, models.CollectionVersion, "user_profiles")
+        db.commit()
+
+def _enqueue_avatar_check(db: Session, user_id: int, url: str):
+    digest = hashlib.sha1(url.encode()).hexdigest()[:16]
+    JOBS.enqueue(db, "validate_avatar", {"user_id": user_id, "url": url}, key=f"avatar:{user_id}:{digest}")
 
-def get_user(db: Session, user_id: int):
-    return db.query(models.UserProfile).filter(models.UserProfile.user_id == user_id).first()
+def _profiles(db: Session, fields=None, extra=()):
+    query = db.query(models.UserProfile)
+    if fields:
+        query = query.options(sparse.load_only(models.UserProfile, fields, extra))
+    return query
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.UserProfile).offset(skip).limit(limit).all()
+@profiles_by_user_id.cached
+def get_user(db: Session, user_id: int, fields=None):
+    # updated_at sert à l'ETag du détail
+    return _profiles(db, fields, extra=("updated_at",)).filter(models.UserProfile.user_id == user_id).first()
+
+@profiles_by_user_id.cached_many
+def get_users_by_ids(db: Session, user_ids, fields=None):
+    # {user_id: profil} ; user_id et updated_at servent à l'ordre de la réponse et à l'ETag
+    return multiget.fetch(_profiles(db, fields, extra=("user_id", "updated_at")), models.UserProfile.user_id, user_ids)
+
+def get_users(db: Session, skip: int = 0, limit: int = 100, fields=None):
+    return _profiles(db, fields).offset(skip).limit(limit).all()
 
 def create_user_profile(db: Session, user_profile: schemas.UserProfileCreate):
     db_user_profile = models.UserProfile(**user_profile.dict())
     db.add(db_user_profile)
+    outbox.record(db, models.OutboxEvent, "profile", "created", user_profile.user_id)
+    conditional.bump(db, models.CollectionVersion, "user_profiles")
+    if user_profile.avatar_url:
+        _enqueue_avatar_check(db, user_profile.user_id, user_profile.avatar_url)
     db.commit()
     db.refresh(db_user_profile)
     return db_user_profile
 
+def save_user_profile(db: Session, user_id: int, profile: schemas.UserProfileBase):
+    """
+    Crée ou met à jour le profil ; un nouvel avatar est vérifié en tâche de fond,
+    la tâche est validée dans la même transaction que le profil
+    """
+    values = profile.dict(exclude_unset=True)
+    db_user_profile = db.query(models.UserProfile).filter(models.UserProfile.user_id == user_id).first()
+    created = db_user_profile is None
+    if created:
+        db_user_profile = models.UserProfile(user_id=user_id)
+        db.add(db_user_profile)
+    previous_avatar = db_user_profile.avatar_url
+    for field, value in values.items():
+        setattr(db_user_profile, field, value)
+    outbox.record(db, models.OutboxEvent, "profile", "created" if created else "updated", user_id)
+    conditional.bump(db, models.CollectionVersion, "user_profiles")
+    if db_user_profile.avatar_url and db_user_profile.avatar_url != previous_avatar:
+        _enqueue_avatar_check(db, user_id, db_user_profile.avatar_url)
+    db.commit()
+    db.refresh(db_user_profile)
+    return db_user_profile, created
+
 def update_user(db: Session, user_id: int, user: schemas.UserUpdate):
     # Cette fonction serait normalement connectée au service d'authentification
     # Pour l'instant, c'est un placeholder
@@ -24,6 +95,19 @@ def delete_user(db: Session, user_id: int):
     db_user = get_user(db, user_id)
     if db_user:
         db.delete(db_user)
+        outbox.record(db, models.OutboxEvent, "profile", "deleted", user_id)
+        conditional.bump(db, models.CollectionVersion, "user_profiles")
         db.commit()
         return True
     return False
+
+def search_users(db: Session, query: str, skip: int = 0, limit: int = 20):
+    return search.search(
+        db, "user_profiles", SEARCH_COLUMNS, query, hit_type="user",
+        extra_columns=["user_id"],
+        skip=skip, limit=limit
+    )
+
+def get_users_version(db: Session):
+    # (version, dernière écriture) : incrémentée à chaque ajout, modification ou suppression
+    return conditional.collection_version(db, models.CollectionVersion, "user_profiles")
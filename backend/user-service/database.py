@@ -2,13 +2,17 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
-from dotenv import load_dotenv
 
-# Charger les variables d'environnement
-load_dotenv()
+from shared import config
+
+# Charger les variables d'environnement (une seule fois par processus)
+config.load_env()
 
 # Configuration de la base de données - Utilisation de SQLite pour le développement
-SQLALCHEMY_DATABASE_URL = "sqlite:///./user_service.db"
+SQLALCHEMY_DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    "sqlite:///./user_service.db"
+)
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
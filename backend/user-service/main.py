@@ -1,26 +1,62 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import os
-from dotenv import load_dotenv
+import sys
+
+# Rendre le paquet backend/shared importable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database import SessionLocal, engine
 import models
 import schemas
 import crud
-
-# Charger les variables d'environnement
-load_dotenv()
+from shared import admission, authz, cache, conditional, jobs, looplag, metrics, multiget, outbox, profiler, search, sparse, sqlprofile, tracing
 
 # Créer les tables
 models.Base.metadata.create_all(bind=engine)
 
+# Index plein texte mis à jour par triggers à chaque écriture
+search.ensure_fts_index(engine, "user_profiles", crud.SEARCH_COLUMNS)
+
 app = FastAPI(
     title="User Service",
     description="Service de gestion des utilisateurs pour MindGraphix",
     version="1.0.0"
 )
 
+# Profilage SQL par requête : en-tête Server-Timing, métriques et détection des N+1
+sqlprofile.instrument_engine(engine)
+tracing.instrument_engine(engine)
+app.add_middleware(sqlprofile.SQLProfilingMiddleware, service="user")
+metrics.install(app)
+# Profilage à la demande (permission debug_profile)
+profiler.install(app, "user")
+# Retard de la boucle asyncio et détection des appels bloquants
+looplag.install(app, "user")
+
+# Contrôle d'admission : compartiments par route, délestage en 503 + Retry-After
+app.add_middleware(admission.AdmissionMiddleware, service="user", routes=[
+    ("GET", "/search", "search"),
+    ("PUT", "/", "write"),
+    ("DELETE", "/", "write"),
+], limits={"search": 8, "write": 8})
+
+# Traçage distribué : ajouté en dernier, le span serveur couvre toute la requête
+app.add_middleware(tracing.TracingMiddleware, service="user")
+
+# Flux des événements de changement (outbox) pour l'invalidation des caches
+event_stream = outbox.EventStream("user", models.OutboxEvent, SessionLocal)
+outbox.install(app, event_stream)
+# Caches en mémoire invalidés par les écritures des autres processus
+cache.install(app, event_stream)
+
+# Lectures unitaires concurrentes regroupées en une requête IN
+profile_loader = multiget.Batcher("user_profiles", SessionLocal, crud.get_users_by_ids)
+
+# Tâches de fond (validation des URL d'avatar), exécutées hors des requêtes
+jobs.install(app, crud.JOBS, SessionLocal)
+
 # Dépendance pour obtenir la session de base de données
 def get_db():
     db = SessionLocal()
@@ -30,15 +66,50 @@ def get_db():
         db.close()
 
 @app.get("/users", response_model=List[schemas.UserProfile])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = crud.get_users(db, skip=skip, limit=limit)
+def read_users(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    ids: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Liste paginée, ou ?ids=3,1,7 (user_id) : profils demandés dans cet ordre, absents dans X-Missing-Ids
+    """
+    selected = sparse.parse(fields, crud.FIELDS)
+    version, last_modified = crud.get_users_version(db)
+    etag = conditional.make_etag("user_profiles", version, conditional.query_key(request))
+    cached = conditional.not_modified(request, response, etag, last_modified)
+    if cached is not None:
+        return cached
+    if ids is not None:
+        requested = multiget.parse_ids(ids)
+        users = multiget.ordered(crud.get_users_by_ids(db, requested, fields=selected), requested, response)
+    else:
+        users = crud.get_users(db, skip=skip, limit=limit, fields=selected)
+    if selected:
+        return sparse.response([sparse.project(user, selected) for user in users], response)
     return users
 
 @app.get("/users/{user_id}", response_model=schemas.UserProfile)
-def read_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = crud.get_user(db, user_id=user_id)
+async def read_user(
+    user_id: int,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = None
+):
+    selected = sparse.parse(fields, crud.FIELDS)
+    db_user = await profile_loader.load(user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
+    etag = conditional.make_etag("user_profile", db_user.id, db_user.updated_at, fields)
+    cached = conditional.not_modified(request, response, etag, db_user.updated_at)
+    if cached is not None:
+        return cached
+    if selected:
+        return sparse.response(sparse.project(db_user, selected), response)
     return db_user
 
 @app.put("/users/{user_id}", response_model=schemas.UserProfile)
@@ -48,6 +119,25 @@ def update_user(user_id: int, user: schemas.UserUpdate, db: Session = Depends(ge
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
     return db_user
 
+@app.put("/users/{user_id}/profile", response_model=schemas.UserProfile)
+def save_profile(
+    user_id: int,
+    profile: schemas.UserProfileBase,
+    response: Response,
+    db: Session = Depends(get_db),
+    access: dict = Depends(authz.current_access)
+):
+    """
+    Crée (201) ou met à jour le profil d'un utilisateur : le sien, ou tout profil avec manage_users.
+    Un nouvel avatar est vérifié en tâche de fond (retiré s'il ne désigne pas une image).
+    """
+    if access.get("user_id") != user_id:
+        authz.check_permission(access, "manage_users")
+    db_profile, created = crud.save_user_profile(db, user_id=user_id, profile=profile)
+    if created:
+        response.status_code = status.HTTP_201_CREATED
+    return db_profile
+
 @app.delete("/users/{user_id}")
 def delete_user(user_id: int, db: Session = Depends(get_db)):
     success = crud.delete_user(db, user_id=user_id)
@@ -55,6 +145,10 @@ def delete_user(user_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
     return {"message": "Utilisateur supprimé avec succès"}
 
+@app.get("/search", response_model=search.SearchPage)
+def search_users(q: str, skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
+    return crud.search_users(db, query=q, skip=skip, limit=limit)
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8003)
+    uvicorn.run(app, host="0.0.0.0", port=8002)
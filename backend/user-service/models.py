@@ -1,9 +1,20 @@
+from datetime import datetime
+
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 
+from shared import conditional, jobs, outbox
+
 Base = declarative_base()
 
+# Événements de changement, écrits dans la même transaction que les données
+OutboxEvent = outbox.declare_outbox(Base)
+# Tâches de fond (validation des avatars), validées avec l'écriture
+Job = jobs.declare_jobs(Base)
+# Version de chaque collection (ETag / Last-Modified des listes), suppressions comprises
+CollectionVersion = conditional.declare_versions(Base)
+
 class UserProfile(Base):
     __tablename__ = "user_profiles"
 
@@ -15,4 +26,5 @@ class UserProfile(Base):
     location = Column(String, nullable=True)
     company = Column(String, nullable=True)
     created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    # Horodatage côté Python : à la microseconde (sert à l'ETag du détail), func.now() de SQLite est à la seconde
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)